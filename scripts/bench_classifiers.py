@@ -0,0 +1,277 @@
+"""
+Benchmark and regression check for the campaign classifiers.
+
+Runs every classifier variant over the golden corpus
+(scripts/fixtures/classifier_golden.jsonl). That file holds anonymized SMS/ZNS
+bodies, each with the label every classifier family gave it when the corpus
+was recorded. For each variant it prints messages/sec, p50/p99 latency per
+message, and the confusion matrix of recorded vs current labels for any
+variant whose labels changed (--matrix: for all). It exits 1
+if any label changed, so a classifier speedup has to keep every answer.
+The cached variants keep their cache across passes, as an import run does over
+templated traffic. The column variants classify every pass in one call, as
+build_records does with a file's content column; each pass after the first
+gets fresh digits (mask_digits), so the column holds distinct bodies the way
+a month of vouchers and order numbers does.
+
+Families:
+  patterns  CAMPAIGN_PATTERNS, used by the importers (campaign_classifier.py)
+  rules     classify_message, used by the reclassify scripts (campaign_rules.py)
+
+Usage:
+    python scripts/bench_classifiers.py [run [--repeat N] [--only patterns_compiled ...] [--matrix]]
+    python scripts/bench_classifiers.py build <export.xlsx|.csv> [...] [--per-label 20]
+    python scripts/bench_classifiers.py record
+
+build samples real eSMS exports into the corpus. It keeps up to --per-label
+distinct bodies per label pair and anonymizes them (see anonymize). A body is
+kept only if anonymizing it leaves its labels unchanged. Free-text SMS keeps
+its wording, so read the file before committing it. record re-labels the
+corpus with the current classifiers, for changes that are meant to change
+labels.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from campaign_classifier import CampaignClassifier, classify_legacy, read_messages
+from campaign_rules import classify_column, classify_message, match_rules, rule_index
+from classification_cache import ClassificationCache, skeleton
+
+CORPUS_FILE = Path(__file__).parent / 'fixtures' / 'classifier_golden.jsonl'
+
+DIGITS = re.compile(r'[0-9]+')
+# ZNS template parameters that identify the customer
+PERSONAL_KEYS = re.compile(r'name|phone|address|email|dia_chi|ten', re.IGNORECASE)
+NONE_LABEL = '(none)'
+
+
+def make_variants():
+    """name -> (family, classify(content, template_id) -> label)"""
+    classifier = CampaignClassifier()
+    patterns_cache = ClassificationCache(classifier.label)
+    rules_cache = ClassificationCache(classify_message)
+    return {
+        'patterns_legacy': ('patterns', lambda content, template_id: classify_legacy(content)[0]),
+        'patterns_compiled': ('patterns', lambda content, template_id: classifier.classify(content)[0]),
+        'patterns_cached': ('patterns', lambda content, template_id: classifier.resolve(
+            content, patterns_cache.lookup(content, template_id))[0]),
+        'rules': ('rules', lambda content, template_id: classify_message(content)),
+        'rules_cached': ('rules', lambda content, template_id: rules_cache.lookup(content, template_id)),
+    }
+
+
+def make_column_variants():
+    """name -> (family, classify(contents, template_ids) -> labels) for the whole-column classifiers"""
+    classifier = CampaignClassifier()
+    patterns_cache = ClassificationCache(classifier.label, classify_texts=classifier.label_texts)
+    rules_cache = ClassificationCache(rule_index, classify_texts=match_rules)
+    return {
+        'patterns_column': ('patterns', lambda contents, template_ids: classifier.classify_column(contents)[0]),
+        'patterns_col_cached': ('patterns', lambda contents, template_ids: classifier.classify_column(
+            contents, template_ids, cache=patterns_cache)[0]),
+        'rules_column': ('rules', lambda contents, template_ids: classify_column(contents)[0]),
+        'rules_col_cached': ('rules', lambda contents, template_ids: classify_column(
+            contents, template_ids, cache=rules_cache)[0]),
+    }
+
+
+def label_message(classifier, content):
+    """Current label of a message in every family"""
+    return {'patterns': classifier.classify(content)[0], 'rules': classify_message(content)}
+
+
+def load_corpus(path=CORPUS_FILE):
+    with Path(path).open(encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_corpus(entries, path=CORPUS_FILE):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open('w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def mask_digits(text, rng):
+    """Random digits in place of each run, keeping its length and last two digits.
+
+    Both classifier families only look at a run's length and last two digits,
+    so masking leaves the labels alone.
+    """
+    def mask(match):
+        run = match.group()
+        if len(run) <= 2:
+            return run
+        return ''.join(rng.choice('0123456789') for _ in run[:-2]) + run[-2:]
+    return DIGITS.sub(mask, text)
+
+
+def anonymize(content, rng):
+    """Mask digits everywhere and replace personal ZNS template parameters"""
+    try:
+        params = json.loads(content) if content.startswith('[{') else None
+    except ValueError:
+        params = None
+    if isinstance(params, list) and all(isinstance(p, dict) and 'Key' in p for p in params):
+        for param in params:
+            if PERSONAL_KEYS.search(str(param['Key'])):
+                param['Value'] = 'Nguyen Van A'
+        content = json.dumps(params, ensure_ascii=False, separators=(',', ':'))
+    return mask_digits(content, rng)
+
+
+def build(files, per_label, seed=0):
+    """Sample distinct, anonymized bodies from eSMS exports, up to per_label per label pair"""
+    rng = random.Random(seed)
+    classifier = CampaignClassifier()
+    seen = set()
+    taken = Counter()
+    entries = []
+    for path in files:
+        for content in read_messages(path):
+            if not content or skeleton(content) in seen:
+                continue
+            seen.add(skeleton(content))
+            labels = label_message(classifier, content)
+            pair = (labels['patterns'], labels['rules'])
+            if taken[pair] >= per_label:
+                continue
+            anonymized = anonymize(content, rng)
+            if label_message(classifier, anonymized) != labels:
+                continue
+            taken[pair] += 1
+            entries.append({'content': anonymized, 'template_id': None, 'labels': labels})
+    return entries
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def run_variant(classify, corpus, repeat):
+    """(labels from the first pass, per-message latencies in ns)"""
+    labels = []
+    latencies = []
+    clock = time.perf_counter_ns
+    for i in range(repeat):
+        for entry in corpus:
+            started = clock()
+            label = classify(entry['content'], entry.get('template_id'))
+            latencies.append(clock() - started)
+            if i == 0:
+                labels.append(label)
+    return labels, latencies
+
+
+def column_passes(corpus, repeat, seed=0):
+    """(contents, template_ids) of repeat passes over the corpus, fresh digits after the first"""
+    rng = random.Random(seed)
+    contents = [entry['content'] for entry in corpus]
+    contents += [mask_digits(entry['content'], rng) for _ in range(repeat - 1) for entry in corpus]
+    return contents, [entry.get('template_id') for entry in corpus] * repeat
+
+
+def run_column_variant(classify, contents, template_ids, corpus_size):
+    """(labels of the first pass, seconds); every pass is classified in one call"""
+    started = time.perf_counter()
+    result = classify(contents, template_ids)
+    return list(result[:corpus_size]), time.perf_counter() - started
+
+
+def print_confusion(matrix):
+    """Recorded label (rows) vs current label (columns)"""
+    names = sorted({name for pair in matrix for name in pair})
+    width = max(len(name) for name in names)
+    header = 'recorded \\ current'
+    print(f"    {header:>{width}}    " + ' '.join(f"{i:>5}" for i in range(len(names))))
+    for i, expected in enumerate(names):
+        cells = ' '.join(f"{matrix.get((expected, actual), 0) or '.':>5}" for actual in names)
+        print(f"    {expected:>{width}} {i:>2}  {cells}")
+
+
+def run(corpus, repeat, only=None, matrix_always=False):
+    variants = make_variants()
+    failed = False
+    print(f"Corpus: {len(corpus):,} messages x {repeat} passes")
+    print(f"  {'variant':<18} {'msgs/sec':>12} {'p50 us':>8} {'p99 us':>8} {'changed':>8}")
+    reports = []
+
+    def report(name, family, labels, rate, latency):
+        matrix = Counter(
+            (entry['labels'][family] or NONE_LABEL, label or NONE_LABEL)
+            for entry, label in zip(corpus, labels)
+        )
+        changed = sum(count for (expected, actual), count in matrix.items() if expected != actual)
+        print(f"  {name:<18} {rate:>12,.0f} {latency} {changed:>8}")
+        reports.append((name, matrix, changed))
+        return changed
+
+    for name, (family, classify) in variants.items():
+        if only and name not in only:
+            continue
+        labels, latencies = run_variant(classify, corpus, repeat)
+        latencies.sort()
+        rate = len(latencies) / (sum(latencies) / 1e9) if latencies else 0
+        latency = f"{percentile(latencies, 50) / 1000:>8.1f} {percentile(latencies, 99) / 1000:>8.1f}"
+        failed = report(name, family, labels, rate, latency) > 0 or failed
+
+    # Column variants classify all passes at once, so there is no per-message latency
+    contents, template_ids = column_passes(corpus, repeat)
+    for name, (family, classify) in make_column_variants().items():
+        if only and name not in only:
+            continue
+        labels, seconds = run_column_variant(classify, contents, template_ids, len(corpus))
+        rate = len(contents) / seconds if seconds else 0
+        failed = report(name, family, labels, rate, f"{'-':>8} {'-':>8}") > 0 or failed
+
+    for name, matrix, changed in reports:
+        if changed or matrix_always:
+            print(f"\n{name}: {'labels changed' if changed else 'matches the recorded labels'}")
+            print_confusion(matrix)
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the campaign classifiers against the golden corpus')
+    parser.add_argument('--corpus', default=CORPUS_FILE, help='golden corpus (JSONL)')
+    commands = parser.add_subparsers(dest='command')
+    run_cmd = commands.add_parser('run', help='time every variant and compare with the recorded labels')
+    build_cmd = commands.add_parser('build', help='sample and anonymize eSMS exports into the corpus')
+    build_cmd.add_argument('files', nargs='+')
+    build_cmd.add_argument('--per-label', type=int, default=20)
+    commands.add_parser('record', help='re-label the corpus with the current classifiers')
+    run_cmd.add_argument('--repeat', type=int, default=200, help='passes over the corpus when timing')
+    run_cmd.add_argument('--only', nargs='+', help='variants to run')
+    run_cmd.add_argument('--matrix', action='store_true',
+                         help='print the confusion matrix of every variant, not only those with changes')
+    parser.set_defaults(repeat=200, only=None, matrix=False)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        entries = build(args.files, args.per_label)
+        save_corpus(entries, args.corpus)
+        print(f"Wrote {len(entries):,} messages to {args.corpus}")
+    elif args.command == 'record':
+        corpus = load_corpus(args.corpus)
+        classifier = CampaignClassifier()
+        for entry in corpus:
+            entry['labels'] = label_message(classifier, entry['content'])
+        save_corpus(corpus, args.corpus)
+        print(f"Re-labelled {len(corpus):,} messages")
+    else:
+        if not run(load_corpus(args.corpus), args.repeat, args.only, args.matrix):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
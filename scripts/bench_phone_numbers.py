@@ -0,0 +1,111 @@
+"""
+Benchmark phone canonicalization (phone_numbers.py) against the per-row
+normalize_phone the importers used before it.
+
+Generates synthetic phone columns shaped like eSMS exports and customers
+rows: Excel floats, 84/+84 prefixes, 9-digit numbers, formatted text and
+summary rows. Checks the column API gives the same phone as the per-row
+function for every cell, then prints cells/sec for each column kind.
+
+Usage: python scripts/bench_phone_numbers.py [rows]
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+from phone_numbers import canonicalize, normalize_phones
+
+
+def normalize_phone(phone):
+    """The per-row normalization the importers and esms_records used"""
+    if not phone:
+        return None
+    phone_str = str(phone).replace('.0', '').strip()
+    phone_str = re.sub(r'\D', '', phone_str)
+    if phone_str.startswith('84') and len(phone_str) > 9:
+        phone_str = '0' + phone_str[2:]
+    if not phone_str.startswith('0') and len(phone_str) == 9:
+        phone_str = '0' + phone_str
+    if len(phone_str) != 10:
+        return None
+    return phone_str
+
+
+def make_cell(rng):
+    number = rng.randint(300000000, 999999999)
+    roll = rng.random()
+    if roll < 0.4:
+        return float(number)
+    if roll < 0.55:
+        return f"84{number}"
+    if roll < 0.75:
+        return f"0{number}"
+    if roll < 0.82:
+        return f"+84 {str(number)[:2]} {str(number)[2:5]} {str(number)[5:]}"
+    if roll < 0.9:
+        return f"0{number}"[:4] + '-' + f"0{number}"[4:]
+    if roll < 0.95:
+        return float(f"84{number}")
+    if roll < 0.98:
+        return None
+    return 'Tong cong'
+
+
+def make_columns(rows, seed=42):
+    """name -> column: the mixed cells calamine returns, and the all-float and all-text extremes"""
+    rng = random.Random(seed)
+    mixed = [make_cell(rng) for _ in range(rows)]
+    return {
+        'mixed': np.array(mixed, dtype=object),
+        'floats': np.array([float(rng.randint(300000000, 999999999)) for _ in range(rows)]),
+        'text': np.array([cell if isinstance(cell, str) else f"0{rng.randint(300000000, 999999999)}"
+                          for cell in mixed], dtype=object),
+    }
+
+
+def timed(fn, *args, repeat=3):
+    """(result, best seconds over repeat calls)"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark phone canonicalization against the per-row normalize_phone')
+    parser.add_argument('rows', nargs='?', type=int, default=200000, help='synthetic rows to generate (default: 200,000)')
+    rows = parser.parse_args().rows
+    columns = make_columns(rows)
+    # First call pays for pyarrow's kernel setup; keep it out of the timings
+    normalize_phones(columns['mixed'][:10])
+
+    print(f"Rows: {rows:,} per column")
+    print(f"  {'column':<8} {'per-row':>12} {'strings':>12} {'int64':>12} {'speedup':>8}")
+    failed = False
+    for name, values in columns.items():
+        legacy, legacy_secs = timed(lambda: [normalize_phone(value) for value in values])
+        phones, phones_secs = timed(normalize_phones, values)
+        _, canonical_secs = timed(canonicalize, values)
+
+        mismatches = sum(1 for a, b in zip(legacy, phones) if a != b)
+        if mismatches:
+            print(f"  {name}: MISMATCH in {mismatches:,} cells")
+            failed = True
+        print(f"  {name:<8} {rows / legacy_secs:>12,.0f} {rows / phones_secs:>12,.0f} "
+              f"{rows / canonical_secs:>12,.0f} {legacy_secs / phones_secs:>7.1f}x")
+
+    print("  (cells/sec; strings = normalize_phones, int64 = canonicalize)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
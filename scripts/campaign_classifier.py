@@ -0,0 +1,401 @@
+"""
+Campaign classifier shared by the eSMS importers.
+
+CAMPAIGN_PATTERNS lists the campaigns in priority order. A message belongs to
+the first campaign with any pattern matching its lowercased content. When
+nothing matches but the message mentions a discount, it falls back to
+adhoc_campaign.
+
+CampaignClassifier compiles every pattern once and pairs it with the longest
+run of plain characters that any match must contain (e.g. 'month' for
+6\s*months?). A pattern only runs when its literal is in the message; the
+substring test is a C-speed scan, so most patterns are dismissed without
+starting the regex engine. Patterns are tried in the same priority order, so
+the result is exactly what the old loop returns (classify_legacy, kept as the
+reference), including its case-insensitive matching. The voucher code is then
+read from the original content with the winning campaign's voucher pattern.
+
+classify_column() does the same for a whole content column (importers pass a
+DataFrame column). It dedupes the column by skeleton (classification_cache),
+or asks a ClassificationCache for the template ids and skeletons it has
+already seen. Each campaign's patterns then run as one alternation, one
+regex mask (text_masks.TextColumn) over the distinct bodies not yet
+labelled, in priority order. Vouchers are pulled per campaign in one pass,
+with pyarrow's regex engine when it is installed.
+
+Usage (check the compiled classifier against the reference loop):
+    python scripts/campaign_classifier.py verify <workbook.xlsx|.csv|.txt> [...]
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import re._parser as sre_parse
+    from re._constants import LITERAL
+except ImportError:  # Python < 3.11
+    import sre_parse
+    from sre_constants import LITERAL
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+from classification_cache import by_skeleton, factorize_text
+from text_masks import SMALL_BATCH, TextColumn
+
+# Campaign type patterns for classification
+CAMPAIGN_PATTERNS = {
+    'birthday': {
+        'patterns': [
+            r'sinh\s*nh[aâ]t',
+            r'birthday',
+            r'sn\d+',  # SN followed by numbers (voucher codes)
+            r'20%.*sinh\s*nh[aâ]t',
+        ],
+        'voucher_pattern': r'(SN\d+[A-Z]*)',
+    },
+    'winback_6m': {
+        'patterns': [
+            r'6\s*th[aá]ng',
+            r'6\s*months?',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+    'winback_9m': {
+        'patterns': [
+            r'9\s*th[aá]ng',
+            r'9\s*months?',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+    'winback_12m': {
+        'patterns': [
+            r'12\s*th[aá]ng',
+            r'12\s*months?',
+            r'1\s*n[aă]m',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+    'winback_18m': {
+        'patterns': [
+            r'18\s*th[aá]ng',
+            r'18\s*months?',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+    'warranty': {
+        'patterns': [
+            r'b[aả]o\s*h[aà]nh',
+            r'warranty',
+            r'x[aá]c\s*nh[aậ]n.*b[aả]o\s*h[aà]nh',
+        ],
+        'voucher_pattern': None,
+    },
+    'referral': {
+        'patterns': [
+            r'gi[oớ]i\s*thi[eệ]u',
+            r'referral',
+            r'b[aạ]n\s*b[eè]',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+    'welcome': {
+        'patterns': [
+            r'ch[aà]o\s*m[uừ]ng',
+            r'welcome',
+            r'kh[aá]ch\s*h[aà]ng\s*m[oớ]i',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+    'eye_check': {
+        'patterns': [
+            r'kh[aá]m\s*m[aắ]t',
+            r'ki[eể]m\s*tra\s*m[aắ]t',
+            r'eye\s*check',
+            r'l[iị]ch\s*h[eẹ]n',
+        ],
+        'voucher_pattern': None,
+    },
+    'adhoc_campaign': {
+        'patterns': [
+            r'gi[aả]m\s*gi[aá]',
+            r'khuy[eế]n\s*m[aã]i',
+            r'promotion',
+            r'sale',
+            r'ưu\s*đ[aã]i',
+            r'\d+%\s*off',
+        ],
+        'voucher_pattern': r'([A-Z0-9]{6,})',
+    },
+}
+
+# Default to adhoc if the message mentions a discount but matched nothing specific
+# (case-sensitive against the lowercased content, with no voucher code)
+ADHOC_FALLBACK = r'\d+%|gi[aả]m|voucher'
+FALLBACK_CAMPAIGN = 'adhoc_campaign'
+FALLBACK_LABEL = 'adhoc_fallback'
+
+
+def classify_legacy(content, patterns=CAMPAIGN_PATTERNS):
+    """The original pattern-by-pattern loop; returns (campaign_key, voucher_code)"""
+    if not content:
+        return None, None
+
+    content_lower = content.lower()
+
+    # Check each campaign type's patterns
+    for campaign_key, config in patterns.items():
+        for pattern in config['patterns']:
+            if re.search(pattern, content_lower, re.IGNORECASE):
+                # Try to extract voucher code
+                voucher_code = None
+                if config.get('voucher_pattern'):
+                    match = re.search(config['voucher_pattern'], content, re.IGNORECASE)
+                    if match:
+                        voucher_code = match.group(1).upper()
+                return campaign_key, voucher_code
+
+    if re.search(ADHOC_FALLBACK, content_lower):
+        return FALLBACK_CAMPAIGN, None
+
+    return None, None
+
+
+# Characters that re.IGNORECASE treats as 'i'/'s' but str.lower() leaves alone;
+# folded so the plain substring prefilter agrees with the IGNORECASE patterns.
+IGNORECASE_FOLDS = str.maketrans({'ı': 'i', 'ſ': 's'})
+
+
+def fold(text):
+    # translate() is slow and these characters are rare; skip it when there is nothing to fold
+    if 'ı' in text or 'ſ' in text:
+        return text.translate(IGNORECASE_FOLDS)
+    return text
+
+
+def required_literal(pattern):
+    """Longest run of plain characters every match of the pattern contains ('' if none)"""
+    runs = ['']
+    for op, value in sre_parse.parse(pattern):
+        if op is LITERAL:
+            runs[-1] += chr(value)
+        else:
+            runs.append('')
+    return max(runs, key=len)
+
+
+class CampaignClassifier:
+    def __init__(self, patterns=CAMPAIGN_PATTERNS):
+        self.campaigns = list(patterns)
+        # (campaign index, compiled pattern, literal it needs) in priority order
+        self.patterns = [
+            (i, re.compile(pattern, re.IGNORECASE), required_literal(pattern).lower())
+            for i, config in enumerate(patterns.values())
+            for pattern in config['patterns']
+        ]
+        self.voucher_patterns = {
+            key: re.compile(config['voucher_pattern'], re.IGNORECASE)
+            for key, config in patterns.items() if config.get('voucher_pattern')
+        }
+        # RE2 spelling for pyarrow: the code is the pattern's first group
+        self.voucher_re2 = {
+            key: '(?i)' + pattern.pattern.replace('(', '(?P<voucher>', 1)
+            for key, pattern in self.voucher_patterns.items()
+        }
+        self.fallback = re.compile(ADHOC_FALLBACK)
+        # One alternation per campaign: "any of its patterns matches", for column masks
+        self.alternations = [
+            '|'.join(f"(?:{pattern})" for pattern in config['patterns'])
+            for config in patterns.values()
+        ]
+
+        # Column classification works on label indexes; -1 (no label) picks the trailing None
+        labels = self.campaigns + [FALLBACK_LABEL]
+        self.label_index = {label: i for i, label in enumerate(labels)}
+        self.label_array = np.array(labels + [None], dtype=object)
+        self.key_array = np.array(self.campaigns + [FALLBACK_CAMPAIGN, None], dtype=object)
+
+    def label(self, content):
+        """Which rule a message matched: a campaign key, FALLBACK_LABEL, or None"""
+        if not content:
+            return None
+
+        content_lower = content.lower()
+        folded = fold(content_lower)
+        for i, pattern, literal in self.patterns:
+            if literal in folded and pattern.search(folded):
+                return self.campaigns[i]
+        if self.fallback.search(content_lower):
+            return FALLBACK_LABEL
+        return None
+
+    def resolve(self, content, label):
+        """(campaign_key, voucher_code) for a message given its label"""
+        if label is None:
+            return None, None
+        if label == FALLBACK_LABEL:
+            return FALLBACK_CAMPAIGN, None
+        voucher_code = None
+        voucher_pattern = self.voucher_patterns.get(label)
+        if voucher_pattern is not None:
+            match = voucher_pattern.search(content)
+            if match:
+                voucher_code = match.group(1).upper()
+        return label, voucher_code
+
+    def classify(self, content):
+        """(campaign_key, voucher_code) for a message, or (None, None)"""
+        return self.resolve(content, self.label(content))
+
+    def label_indexes(self, texts):
+        """Which rule each distinct string matched, as an index into self.labels (-1: none)"""
+        texts = np.asarray(texts, dtype=object)
+        if len(texts) < SMALL_BATCH:
+            labels = [self.label(text) for text in texts]
+            return np.array([self.label_index.get(label, -1) for label in labels], dtype=np.int64)
+        content_lower = TextColumn(texts).lower()
+        # fold() only changes rows with a dotless i or long s
+        foldable = np.flatnonzero(content_lower.contains('ı') | content_lower.contains('ſ'))
+        folded = content_lower.map_rows(foldable, fold)
+        indexes = np.full(len(texts), -1, dtype=np.int64)
+
+        # Only rows no earlier campaign claimed are searched; rows maps column rows to texts
+        rows = np.arange(len(texts))
+        active = ~content_lower.empty()
+        column = folded
+        for i, alternation in enumerate(self.alternations):
+            if not active.any():
+                break
+            matched = column.search(alternation, re.IGNORECASE) & active
+            if matched.any():
+                indexes[rows[matched]] = self.label_index[self.campaigns[i]]
+                active &= ~matched
+                if active.sum() * 2 <= len(active):
+                    keep = np.flatnonzero(active)
+                    rows, active = rows[keep], active[keep]
+                    column = column.take(keep)
+        remaining = rows[active]
+        if len(remaining):
+            fallback = content_lower.take(remaining).search(ADHOC_FALLBACK)
+            indexes[remaining[fallback]] = self.label_index[FALLBACK_LABEL]
+        return indexes
+
+    def label_texts(self, texts):
+        """label() of every string in an array; the classify_texts of a ClassificationCache"""
+        return self.label_array[self.label_indexes(texts)]
+
+    def label_column(self, contents):
+        """label() of every value in a column, classifying each distinct skeleton once"""
+        codes, distinct = by_skeleton(contents)
+        return self.label_array[self.label_indexes(distinct)[codes]]
+
+    def extract_vouchers(self, key, texts):
+        """Upper-cased voucher codes (or None) found in an array of strings, for one campaign"""
+        voucher_pattern = self.voucher_patterns[key]
+        codes = np.full(len(texts), None, dtype=object)
+        rows = np.arange(len(texts))
+        if pa is not None and len(texts) >= SMALL_BATCH:
+            # On ASCII text RE2 finds the same codes as re; anything else (where
+            # IGNORECASE also folds characters like 'ſ' or 'K') stays with re
+            values = pa.array(texts, type=pa.large_string())
+            is_ascii = pc.string_is_ascii(values).to_numpy(zero_copy_only=False)
+            found = pc.extract_regex(values.filter(is_ascii), self.voucher_re2[key]).field('voucher')
+            codes[is_ascii] = [code.upper() if code else None for code in found.to_pylist()]
+            rows = rows[~is_ascii]
+        for row in rows:
+            match = voucher_pattern.search(texts[row])
+            if match:
+                codes[row] = match.group(1).upper()
+        return codes
+
+    def classify_column(self, contents, template_ids=None, cache=None):
+        """(campaign_keys, voucher_codes) arrays for a column; same as classify() on each value.
+
+        cache is a ClassificationCache(self.label, classify_texts=self.label_texts); with it, each
+        template id and skeleton already seen is answered from the cache.
+        """
+        text_codes, texts = factorize_text(contents)
+        if cache is None:
+            skeleton_codes, distinct = by_skeleton(texts)
+            indexes = self.label_indexes(distinct)[skeleton_codes][text_codes]
+        else:
+            labels = cache.label_column(contents, template_ids)
+            indexes = pd.Series(labels, dtype=object).map(self.label_index).fillna(-1).to_numpy(np.int64)
+
+        # Voucher codes differ per message, so they come from every distinct (text, label)
+        width = len(self.label_array) + 1
+        pair_codes, pairs = pd.factorize(text_codes * width + indexes + 1)
+        pair_texts = texts[pairs // width]
+        pair_indexes = pairs % width - 1
+        voucher_codes = np.full(len(pairs), None, dtype=object)
+        for key in self.voucher_patterns:
+            rows = np.flatnonzero(pair_indexes == self.label_index[key])
+            if len(rows):
+                voucher_codes[rows] = self.extract_vouchers(key, pair_texts[rows])
+        return self.key_array[indexes], voucher_codes[pair_codes]
+
+
+def read_messages(path):
+    """Message contents from an eSMS workbook/CSV, or one message per line of a text file"""
+    path = Path(path)
+    if path.suffix.lower() in ('.xlsx', '.csv'):
+        from esms_reader import iter_chunks
+
+        for df in iter_chunks(path):
+            if 'content' in df.columns:
+                yield from (str(value) for value in df['content'] if value is not None)
+    else:
+        with path.open(encoding='utf-8') as f:
+            yield from (line.rstrip('\n') for line in f)
+
+
+def verify(messages):
+    """Compare the compiled classifier with classify_legacy; returns the messages that differ"""
+    classifier = CampaignClassifier()
+    mismatches = []
+    legacy_secs = compiled_secs = 0.0
+    for content in messages:
+        started = time.perf_counter()
+        expected = classify_legacy(content)
+        legacy_secs += time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = classifier.classify(content)
+        compiled_secs += time.perf_counter() - started
+
+        if actual != expected:
+            mismatches.append((content, expected, actual))
+    return mismatches, legacy_secs, compiled_secs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the compiled campaign classifier against the reference loop')
+    commands = parser.add_subparsers(dest='command', required=True)
+    verify_cmd = commands.add_parser('verify', help='classify a corpus with both and report differences')
+    verify_cmd.add_argument('files', nargs='+', help='eSMS workbooks/CSVs or text files with one message per line')
+    args = parser.parse_args()
+
+    messages = [content for path in args.files for content in read_messages(path)]
+    mismatches, legacy_secs, compiled_secs = verify(messages)
+    print(f"Messages: {len(messages):,}")
+    print(f"  reference loop: {legacy_secs:6.2f}s")
+    print(f"  compiled:       {compiled_secs:6.2f}s")
+    if mismatches:
+        print(f"MISMATCH on {len(mismatches)} messages:")
+        for content, expected, actual in mismatches[:20]:
+            print(f"  {expected} != {actual}: {content[:120]!r}")
+        sys.exit(1)
+    print("Identical results on every message")
+
+
+if __name__ == "__main__":
+    main()
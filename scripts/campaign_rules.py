@@ -0,0 +1,260 @@
+"""
+Content rules for reclassifying stored SMS/ZNS messages, with rule versions.
+
+RULES is checked in order and the first rule that matches decides the
+campaign; a message no rule matches is 'other'. Every rule has a version:
+a fingerprint of its own source chained with the versions of every rule
+before it. reclassify_sms_campaigns.py stores the version of the matching
+rule in sms_zns_messages.campaign_rule_version.
+
+A message still classifies the same way as long as its stored version is
+still one of RULE_VERSIONS. In that case neither its rule nor any rule
+checked before it has changed. So after an edit only messages at or after
+the edited rule, plus the 'other' messages, are stale. Editing the last
+rules touches few rows; editing the first touches them all.
+
+Rules are fingerprinted from their source, so any change inside a rule
+function (even a comment) counts as an edit. Moving, adding or removing a
+rule changes every version from that position on.
+
+classify_column() labels a whole batch. Every rule has a column form in
+COLUMN_RULES, the same test written as contains / startswith / regex masks
+(text_masks.TextColumn) over the lowercase and original text. The rules run
+in priority order, each as a few whole-column calls over the distinct
+skeletons (classification_cache) no earlier rule matched. Given a
+ClassificationCache, only the template ids and skeletons it has not seen are
+classified. The column forms are not part of the rule versions; a rule and
+its column form have to change together (bench_classifiers.py checks that
+they agree).
+"""
+
+import hashlib
+import inspect
+import re
+
+import numpy as np
+
+from classification_cache import by_skeleton
+from text_masks import SMALL_BATCH, TextColumn, both
+
+# Campaign type IDs
+CAMPAIGN_TYPES = {
+    'birthday': 'dc8c2a2a-8a98-4797-8537-c6a832bfe7b6',
+    'otp': 'bdd2ca55-94ce-4a3c-88ad-acbb1c13340e',
+    'eye_check': 'c00ffe61-09c9-4a8f-b8f6-e95a6799dd75',
+    'receipt': '111b8ea0-ac93-4e69-a24c-719bc5bbb0ab',
+    'cash_voucher': '2bccca25-1924-4c4a-8a2f-985ac2741a56',
+    'fmv_voucher': '2f68a995-b058-42fb-8647-5d7ee6dc7563',
+    'npo_voucher': '0c917a74-efd9-462a-8907-008faf397a9c',
+    'warranty': '27017108-fd02-49b9-b0ed-cb75fbc044dd',
+    'winback_6m': '497642c6-395f-4a91-a65d-202f79fdd1b9',
+    'winback_9m': '18f0bf34-e66e-4e1e-95c6-0ecf2489370d',
+    'winback_12m': '4ef02a69-c20d-45d0-8be5-b536013c9e1b',
+    'winback_18m': '7d112eac-14e9-48ec-9967-6522fb7927c8',
+    'advertising': '8c58c1e6-fd9a-4a21-a628-d7eeea29cbc2',
+    'referral': '8f53154c-c9a3-4d71-a667-308902e3cf7e',
+    'welcome': 'aa37a7ae-5ce8-4e0b-bde8-867ff527f5b7',
+    'other': '557d3b2f-5677-4b34-9339-7661b250021f',
+}
+
+
+def is_empty(c, c_lower):
+    return not c
+
+
+def is_birthday(c, c_lower):
+    # JSON template with SN voucher code
+    return c.startswith('[{"Key"') and 'voucher_code' in c and 'SN' in c
+
+
+def is_otp(c, c_lower):
+    # Authentication codes
+    return 'ma xac thuc' in c_lower or 'xac thuc cua ban' in c_lower
+
+
+def is_warranty(c, c_lower):
+    return 'kich hoat bao hanh' in c_lower or 'xac nhan bao hanh' in c_lower
+
+
+def is_cash_voucher(c, c_lower):
+    # Prada, Maui Jim purchases
+    return 'cashvoucher' in c_lower or bool(re.search(r'VC\d+K.*CPM', c))
+
+
+def is_fmv_voucher(c, c_lower):
+    return bool(re.search(r'FMV\d+', c))
+
+
+def is_npo_voucher(c, c_lower):
+    # NPS feedback
+    return 'NPO' in c and ('voucher' in c_lower or '%' in c)
+
+
+def is_eye_check(c, c_lower):
+    # JSON with date and name format ["date","name","phone","date"]
+    return c.startswith('["') and bool(re.search(r'\d{2}/\d{2}/\d{4}', c))
+
+
+def is_receipt(c, c_lower):
+    # Order confirmation with order code
+    return bool(re.search(r'SO\d+-\d+/\d+|BH\d+-\d+/\d+', c)) and 'cam on' in c_lower
+
+
+def is_winback_6m(c, c_lower):
+    return '6 thang' in c_lower or '6 months' in c_lower
+
+
+def is_winback_9m(c, c_lower):
+    return '9 thang' in c_lower or '9 months' in c_lower
+
+
+def is_winback_12m(c, c_lower):
+    return '12 thang' in c_lower or '1 nam' in c_lower
+
+
+def is_winback_18m(c, c_lower):
+    return '18 thang' in c_lower
+
+
+def is_advertising(c, c_lower):
+    # quang cao, sale, uu dai
+    return 'quang cao' in c_lower or 'khuyen mai' in c_lower
+
+
+def is_discount(c, c_lower):
+    return bool(re.search(r'giam.*\d+%', c_lower)) or 'uu dai' in c_lower
+
+
+def is_oeb_voucher(c, c_lower):
+    # OEB voucher (promotion)
+    return 'OEB' in c and '%' in c
+
+
+# (campaign, rule) in priority order
+RULES = [
+    ('other', is_empty),
+    ('birthday', is_birthday),
+    ('otp', is_otp),
+    ('warranty', is_warranty),
+    ('cash_voucher', is_cash_voucher),
+    ('fmv_voucher', is_fmv_voucher),
+    ('npo_voucher', is_npo_voucher),
+    ('eye_check', is_eye_check),
+    ('receipt', is_receipt),
+    ('winback_6m', is_winback_6m),
+    ('winback_9m', is_winback_9m),
+    ('winback_12m', is_winback_12m),
+    ('winback_18m', is_winback_18m),
+    ('advertising', is_advertising),
+    ('advertising', is_discount),
+    ('advertising', is_oeb_voucher),
+]
+DEFAULT_CAMPAIGN = 'other'
+
+
+def rule_versions(rules=RULES, default=DEFAULT_CAMPAIGN):
+    """Version of each rule (chained over the rules before it), then the version for 'no rule matched'"""
+    versions = []
+    chain = hashlib.sha1()
+    for campaign, rule in rules:
+        chain.update(f"{campaign}\0{inspect.getsource(rule)}\0".encode('utf-8'))
+        versions.append(chain.hexdigest()[:12])
+    chain.update(f"default\0{default}".encode('utf-8'))
+    versions.append(chain.hexdigest()[:12])
+    return versions
+
+
+RULE_VERSIONS = rule_versions()
+# Version of the whole rule set: what a message classified by 'no rule matched' carries
+RULES_VERSION = RULE_VERSIONS[-1]
+
+
+def rule_index(content):
+    """Index in RULES of the rule that decides a message (len(RULES) when none does)"""
+    c = str(content) if content else ''
+    c_lower = c.lower()
+    for i, (campaign, rule) in enumerate(RULES):
+        if rule(c, c_lower):
+            return i
+    return len(RULES)
+
+
+def classify_with_version(content):
+    """(campaign, rule_version) for a message"""
+    i = rule_index(content)
+    return CAMPAIGNS[i], VERSIONS[i]
+
+
+def classify_message(content):
+    """Classify message based on content analysis."""
+    return CAMPAIGNS[rule_index(content)]
+
+
+# Column form of each rule: c and c_lower are TextColumns, the result a bool mask. Conjunctions
+# test their rarest part first; both() runs the rest on the rows it kept.
+COLUMN_RULES = {
+    is_empty: lambda c, c_lower: c.empty(),
+    is_birthday: lambda c, c_lower: both(c.startswith('[{"Key"'),
+                                         lambda c: c.contains('voucher_code') & c.contains('SN'), c),
+    is_otp: lambda c, c_lower: c_lower.contains('ma xac thuc') | c_lower.contains('xac thuc cua ban'),
+    is_warranty: lambda c, c_lower: c_lower.contains('kich hoat bao hanh') | c_lower.contains('xac nhan bao hanh'),
+    is_cash_voucher: lambda c, c_lower: c_lower.contains('cashvoucher') | both(c.contains('CPM'),
+                                                                              lambda c: c.search(r'VC\d+K.*CPM'), c),
+    is_fmv_voucher: lambda c, c_lower: c.search(r'FMV\d+'),
+    is_npo_voucher: lambda c, c_lower: both(c.contains('NPO'),
+                                            lambda c, c_lower: c_lower.contains('voucher') | c.contains('%'), c, c_lower),
+    is_eye_check: lambda c, c_lower: both(c.startswith('["'), lambda c: c.search(r'\d{2}/\d{2}/\d{4}'), c),
+    is_receipt: lambda c, c_lower: both(c_lower.contains('cam on'),
+                                        lambda c: c.search(r'SO\d+-\d+/\d+|BH\d+-\d+/\d+'), c),
+    is_winback_6m: lambda c, c_lower: c_lower.contains('6 thang') | c_lower.contains('6 months'),
+    is_winback_9m: lambda c, c_lower: c_lower.contains('9 thang') | c_lower.contains('9 months'),
+    is_winback_12m: lambda c, c_lower: c_lower.contains('12 thang') | c_lower.contains('1 nam'),
+    is_winback_18m: lambda c, c_lower: c_lower.contains('18 thang'),
+    is_advertising: lambda c, c_lower: c_lower.contains('quang cao') | c_lower.contains('khuyen mai'),
+    is_discount: lambda c, c_lower: c_lower.contains('uu dai') | both(c_lower.contains('%'),
+                                                                      lambda c_lower: c_lower.search(r'giam.*\d+%'), c_lower),
+    is_oeb_voucher: lambda c, c_lower: both(c.contains('OEB'), lambda c: c.contains('%'), c),
+}
+
+# Per rule index (len(RULES): no rule matched)
+CAMPAIGNS = np.array([campaign for campaign, rule in RULES] + [DEFAULT_CAMPAIGN], dtype=object)
+VERSIONS = np.array(RULE_VERSIONS, dtype=object)
+
+
+def match_rules(texts):
+    """rule_index() of every string in an array, one whole-column call per rule test"""
+    texts = np.asarray(texts, dtype=object)
+    if len(texts) < SMALL_BATCH:
+        return np.array([rule_index(text) for text in texts], dtype=np.int64)
+    content = TextColumn(texts)
+    content_lower = content.lower()
+    indexes = np.full(len(texts), len(RULES), dtype=np.int64)
+    # Column row -> position in texts, and whether the row is still unlabelled
+    rows = np.arange(len(texts))
+    active = np.ones(len(texts), dtype=bool)
+    for i, (campaign, rule) in enumerate(RULES):
+        if not active.any():
+            break
+        matched = COLUMN_RULES[rule](content, content_lower) & active
+        if matched.any():
+            indexes[rows[matched]] = i
+            active &= ~matched
+            if active.sum() * 2 <= len(active):
+                keep = np.flatnonzero(active)
+                rows, active = rows[keep], active[keep]
+                content, content_lower = content.take(keep), content_lower.take(keep)
+    return indexes
+
+
+def classify_column(contents, template_ids=None, cache=None):
+    """(campaigns, rule_versions) arrays for a column; same as classify_with_version on each value.
+
+    cache is a ClassificationCache(rule_index, classify_texts=match_rules); with it, each
+    template id and skeleton already seen is answered from the cache.
+    """
+    if cache is not None:
+        indexes = cache.label_column(contents, template_ids).astype(np.int64)
+    else:
+        codes, distinct = by_skeleton(contents)
+        indexes = match_rules(distinct)[codes]
+    return CAMPAIGNS[indexes], VERSIONS[indexes]
@@ -0,0 +1,60 @@
+"""
+Writes reclassified campaigns back to sms_zns_messages.
+
+bulk (default): every (id, campaign_type_id, campaign_rule_version) row of a
+batch goes to the apply_campaign_updates RPC (scripts/sql/003), which applies
+them all in one UPDATE ... FROM and skips rows that did not change. A run
+makes one request per batch instead of one per campaign per 50-100 ids, and
+needs no pauses between requests.
+
+chunked: the old path, one .update().in_('id', ...) per campaign and chunk,
+for databases where 003 has not been run yet.
+
+Both take an optional rate_limiter.RateLimiter that paces and retries every
+request.
+"""
+
+APPLY_MODES = ('bulk', 'chunked')
+
+
+def execute(request, limiter=None):
+    if limiter is None:
+        return request.execute()
+    return limiter.call(request.execute)
+
+
+def apply_bulk(client, updates, batch_size=5000, limiter=None):
+    """Send updates through apply_campaign_updates; returns rows whose campaign changed"""
+    changed = 0
+    for i in range(0, len(updates), batch_size):
+        result = execute(client.rpc('apply_campaign_updates', {'updates': updates[i:i + batch_size]}), limiter)
+        changed += result.data or 0
+    return changed
+
+
+def apply_chunked(client, updates, chunk_size=100, limiter=None):
+    """One update request per campaign per chunk of ids; returns rows written"""
+    ids_by_campaign = {}
+    for row in updates:
+        key = (row['campaign_type_id'], row['campaign_rule_version'])
+        ids_by_campaign.setdefault(key, []).append(row['id'])
+
+    updated = 0
+    for (campaign_id, rule_version), ids in ids_by_campaign.items():
+        for i in range(0, len(ids), chunk_size):
+            chunk = ids[i:i + chunk_size]
+            try:
+                execute(client.table('sms_zns_messages').update({
+                    'campaign_type_id': campaign_id,
+                    'campaign_rule_version': rule_version,
+                }).in_('id', chunk), limiter)
+                updated += len(chunk)
+            except Exception as e:
+                print(f"  Error updating chunk: {e}")
+    return updated
+
+
+def apply_updates(client, updates, mode='bulk', limiter=None, **kwargs):
+    if mode == 'bulk':
+        return apply_bulk(client, updates, limiter=limiter)
+    return apply_chunked(client, updates, limiter=limiter, **kwargs)
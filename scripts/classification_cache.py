@@ -0,0 +1,210 @@
+"""
+Memoized campaign classification per message template.
+
+Most eSMS/ZNS traffic is templated, so the same body is classified over and
+over. ClassificationCache wraps a classifier (content -> campaign label) in an
+LRU keyed by:
+
+- template_id, for ZNS messages. The template decides the campaign, but the
+  first few messages of each template are still classified in full. A
+  template whose messages disagree is marked unstable and falls back to
+  content keys.
+- the content skeleton otherwise. Runs of 4+ digits become '00' plus their
+  last two digits, so voucher numbers, order numbers and dates
+  collapse. Every classifier rule only looks at the last two digits of a run,
+  or at whether a run has 4+ digits, so the skeleton classifies exactly like
+  the message.
+
+Voucher codes differ per message and are never cached; only the label is.
+
+For whole columns, by_skeleton() does the same dedupe up front. It factorizes
+the column by skeleton, so a classifier runs once per distinct skeleton and
+the results are broadcast back through the codes. label_column() is lookup()
+for a whole column: it resolves each distinct (template_id, skeleton) pair
+against the cache and hands only the misses to classify_texts, in one call.
+"""
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+LONG_DIGITS = re.compile(r'[0-9]{4,}')
+# The same rewrite for pyarrow's RE2 engine, which has no callable replacement
+LONG_DIGITS_RE2 = r'[0-9]{2,}([0-9]{2})'
+
+# Full classifications of a template before its label is trusted
+CONFIRM_TEMPLATE = 3
+
+
+def skeleton(content):
+    """Content with long digit runs reduced to '00' + their last two digits"""
+    return LONG_DIGITS.sub(lambda match: '00' + match.group()[-2:], content)
+
+
+def factorize_text(contents):
+    """(codes, distinct texts) of a column: contents[i] is texts[codes[i]], missing values as ''"""
+    codes, distinct = pd.factorize(np.asarray(contents, dtype=object), use_na_sentinel=False)
+    texts = np.array([value if isinstance(value, str) else '' if pd.isna(value) else str(value)
+                      for value in distinct], dtype=object)
+    return codes, texts
+
+
+def skeletons(texts):
+    """skeleton() of every string in an array"""
+    if pa is None:
+        return np.array([skeleton(text) for text in texts], dtype=object)
+    values = pa.array(texts, type=pa.large_string())
+    return pc.replace_substring_regex(values, LONG_DIGITS_RE2, r'00\1').to_numpy(zero_copy_only=False)
+
+
+def by_skeleton(contents):
+    """(codes, distinct skeletons): contents[i] has the skeleton distinct[codes[i]]"""
+    # Exact repeats are dropped first so each body is only rewritten once
+    text_codes, texts = factorize_text(contents)
+    codes, distinct = pd.factorize(skeletons(texts))
+    return codes[text_codes], np.asarray(distinct, dtype=object)
+
+
+class ClassificationCache:
+    def __init__(self, classify, maxsize=50000, confirm=CONFIRM_TEMPLATE, classify_texts=None):
+        """classify(content) returns a campaign label; classify_texts(texts), the labels of an array
+        of strings (needed for label_column)"""
+        self.classify = classify
+        self.classify_texts = classify_texts
+        self.maxsize = maxsize
+        self.confirm = confirm
+        self.entries = OrderedDict()
+        self.unconfirmed = {}
+        self.unstable = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, content, template_id=None):
+        if template_id and str(template_id) not in self.unstable:
+            return ('template', str(template_id))
+        return ('content', skeleton(content))
+
+    def store(self, key, label):
+        self.entries[key] = label
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def lookup(self, content, template_id=None):
+        """Campaign label for a message, classifying it only if its template is new"""
+        if not content:
+            return self.classify(content)
+
+        key = self.key(content, template_id)
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        label = self.classify(content)
+        if key[0] == 'template':
+            seen = self.unconfirmed.setdefault(key, [label, 0])
+            if seen[0] != label:
+                # Parameters change the outcome; classify this template's messages by content
+                self.unstable.add(key[1])
+                del self.unconfirmed[key]
+                return label
+            seen[1] += 1
+            if seen[1] < self.confirm:
+                return label
+            del self.unconfirmed[key]
+        self.store(key, label)
+        return label
+
+    def label_column(self, contents, template_ids=None):
+        """lookup() of every message in a column, as an object array of labels"""
+        codes, distinct = by_skeleton(contents)
+        if not len(codes):
+            return np.full(0, None, dtype=object)
+        if template_ids is None:
+            template_codes, templates = np.full(len(codes), -1), []
+        else:
+            template_codes, templates = pd.factorize(np.asarray(template_ids, dtype=object))
+        # Distinct (template, skeleton) pairs; template -1 is none
+        pair_codes, pairs = pd.factorize((template_codes + 1) * len(distinct) + codes)
+        pair_rows = np.bincount(pair_codes, minlength=len(pairs))
+        pair_templates = pairs // len(distinct) - 1
+        pair_skeletons = pairs % len(distinct)
+
+        labels = np.full(len(pairs), None, dtype=object)
+        keys = {}
+        for pair, (template, skel) in enumerate(zip(pair_templates, pair_skeletons)):
+            if not distinct[skel]:
+                keys.setdefault(None, []).append(pair)
+                continue
+            template_id = templates[template] if template >= 0 else None
+            keys.setdefault(self.key(distinct[skel], template_id), []).append(pair)
+
+        # Hits come from the cache; every skeleton behind a miss is classified in one call
+        missed = []
+        for key, key_pairs in keys.items():
+            if key is not None and key in self.entries:
+                self.hits += int(pair_rows[key_pairs].sum())
+                self.entries.move_to_end(key)
+                labels[key_pairs] = [self.entries[key]] * len(key_pairs)
+            else:
+                missed.extend(key_pairs)
+        if not missed:
+            return labels[pair_codes]
+        missed = np.array(missed)
+        skeleton_labels = np.full(len(distinct), None, dtype=object)
+        missed_skeletons = np.unique(pair_skeletons[missed])
+        skeleton_labels[missed_skeletons] = list(self.classify_texts(distinct[missed_skeletons]))
+        labels[missed] = skeleton_labels[pair_skeletons[missed]]
+
+        for key, key_pairs in keys.items():
+            if key is None or key in self.entries:
+                continue
+            # Counted as lookup() would: the rows after a key is stored are hits
+            rows = int(pair_rows[key_pairs].sum())
+            found = set(labels[key_pairs])
+            if key[0] == 'content':
+                self.misses += 1
+                self.hits += rows - 1
+                self.store(key, labels[key_pairs[0]])
+                continue
+            # A template is trusted once `confirm` of its messages agreed on one label
+            seen = self.unconfirmed.setdefault(key, [labels[key_pairs[0]], 0])
+            if len(found) > 1 or seen[0] not in found:
+                self.unstable.add(key[1])
+                del self.unconfirmed[key]
+                # From here on its messages are keyed by content
+                for skel in np.unique(pair_skeletons[key_pairs]):
+                    skel_rows = int(pair_rows[np.asarray(key_pairs)[pair_skeletons[key_pairs] == skel]].sum())
+                    content_key = ('content', distinct[skel])
+                    if content_key not in self.entries:
+                        self.misses += 1
+                        skel_rows -= 1
+                        self.store(content_key, skeleton_labels[skel])
+                    self.hits += skel_rows
+                continue
+            classified = min(rows, self.confirm - seen[1])
+            self.misses += classified
+            self.hits += rows - classified
+            seen[1] += classified
+            if seen[1] >= self.confirm:
+                del self.unconfirmed[key]
+                self.store(key, seen[0])
+        return labels[pair_codes]
+
+    def summary(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups * 100 if lookups else 0.0
+        return (f"Classification cache: {rate:.1f}% hit rate ({self.hits:,} hits, {self.misses:,} misses, "
+                f"{len(self.entries):,} templates, {self.evictions:,} evicted, "
+                f"{len(self.unstable):,} unstable template ids)")
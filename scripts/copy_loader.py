@@ -0,0 +1,135 @@
+"""
+Bulk loader that streams records into Postgres with COPY instead of the REST API.
+
+Records are COPYed into a session temp table shaped like sms_zns_messages.
+Each source file is then moved into the real table with a single
+INSERT ... SELECT. For month-sized loads this is far faster than 500-row JSON
+inserts. The loader has the same submit()/drain()/close() calls as
+insert_pipeline.InsertPipeline, so the importers switch between the two with
+--loader rest|copy.
+
+A chunk that fails to COPY, or a file whose merge is rejected, is bisected
+(dead_letters.bisect_insert) and the offending rows go to the dead-letter file.
+
+Needs psycopg 3 (pip install "psycopg[binary]") and DATABASE_URL set to a
+Postgres connection string. For Supabase use the direct or session-pooler
+connection: the staging table lives for the session, which the transaction
+pooler does not keep. To try a load without touching production, point
+DATABASE_URL at a local Postgres holding the table:
+    pg_dump --schema-only -t sms_zns_messages "$SUPABASE_DB_URL" | psql "$DATABASE_URL"
+"""
+
+import os
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.rows import dict_row
+except ImportError:
+    psycopg = None
+
+from dead_letters import DeadLetters, bisect_insert
+from esms_records import RECORD_COLUMNS
+
+
+class CopyLoader:
+    def __init__(self, dsn=None, table='sms_zns_messages', columns=RECORD_COLUMNS, upsert=False, reject=None):
+        """reject(records, error) receives rows Postgres refused (default: the table's dead-letter file)"""
+        if psycopg is None:
+            raise ImportError('psycopg is not installed (pip install "psycopg[binary]")')
+        dsn = dsn or os.getenv('DATABASE_URL')
+        if not dsn:
+            raise ValueError('DATABASE_URL is not set; the COPY loader connects to Postgres directly')
+
+        self.table = table
+        self.staging = f"{table}_staging"
+        self.columns = list(columns)
+        self.upsert = upsert
+        self.reject = reject or DeadLetters(table).add
+        # Errors caused by the rows themselves; anything else (lost connection) is not bisected
+        self.row_errors = (psycopg.DataError, psycopg.IntegrityError)
+
+        self.conn = psycopg.connect(dsn, autocommit=True)
+        with self.conn.transaction():
+            # Constraints come along so bad values fail at COPY, where a chunk can be bisected
+            self.conn.execute(sql.SQL(
+                "CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ).format(staging=sql.Identifier(self.staging), table=sql.Identifier(table)))
+            self.conn.execute(sql.SQL(
+                "ALTER TABLE {staging} ADD COLUMN staged_id bigserial, ADD COLUMN load_tag text"
+            ).format(staging=sql.Identifier(self.staging)))
+
+    def column_list(self):
+        return sql.SQL(', ').join(map(sql.Identifier, self.columns))
+
+    def tag_condition(self, tag):
+        if tag is None:
+            return sql.SQL('true')
+        return sql.SQL('load_tag = {}').format(sql.Literal(str(tag)))
+
+    def copy(self, records, tag):
+        """COPY one batch into the staging table in its own transaction"""
+        statement = sql.SQL("COPY {staging} ({columns}, load_tag) FROM STDIN").format(
+            staging=sql.Identifier(self.staging), columns=self.column_list(),
+        )
+        load_tag = None if tag is None else str(tag)
+        with self.conn.transaction(), self.conn.cursor() as cur, cur.copy(statement) as copy:
+            for record in records:
+                copy.write_row([record.get(name) for name in self.columns] + [load_tag])
+
+    def submit(self, records, tag=None):
+        """Stage records; they reach the table when their tag is drained"""
+        bisect_insert(records, lambda batch: self.copy(batch, tag), self.reject, split_on=self.row_errors)
+
+    def merge_statement(self, condition):
+        statement = sql.SQL("INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} WHERE {condition}").format(
+            table=sql.Identifier(self.table), columns=self.column_list(),
+            staging=sql.Identifier(self.staging), condition=condition,
+        )
+        if self.upsert:
+            statement += sql.SQL(" ON CONFLICT (message_id) DO NOTHING")
+        return statement
+
+    def merge_ids(self, staged_ids):
+        condition = sql.SQL('staged_id = ANY({})').format(sql.Literal(staged_ids))
+        with self.conn.transaction():
+            self.conn.execute(self.merge_statement(condition))
+
+    def reject_staged(self, staged_ids, error):
+        """Hand staged rows that failed to merge to the reject callback"""
+        with self.conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql.SQL("SELECT {columns} FROM {staging} WHERE staged_id = ANY(%s)").format(
+                columns=self.column_list(), staging=sql.Identifier(self.staging),
+            ), [staged_ids])
+            self.reject(cur.fetchall(), error)
+
+    def drain(self, tag=None):
+        """Merge staged rows (only those under `tag` if given) into the table; returns rows inserted"""
+        condition = self.tag_condition(tag)
+        try:
+            with self.conn.transaction():
+                inserted = self.conn.execute(self.merge_statement(condition)).rowcount
+        except self.row_errors:
+            # One bad row fails the whole statement; bisect the staged rows to find it
+            staged_ids = [row[0] for row in self.conn.execute(sql.SQL(
+                "SELECT staged_id FROM {staging} WHERE {condition} ORDER BY staged_id"
+            ).format(staging=sql.Identifier(self.staging), condition=condition))]
+            inserted = bisect_insert(staged_ids, self.merge_ids, self.reject_staged, split_on=self.row_errors)
+
+        self.conn.execute(sql.SQL("DELETE FROM {staging} WHERE {condition}").format(
+            staging=sql.Identifier(self.staging), condition=condition,
+        ))
+        return inserted
+
+    def close(self):
+        """Merge anything still staged and disconnect (even if the merge fails)"""
+        try:
+            return self.drain()
+        finally:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
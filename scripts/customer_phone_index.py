@@ -0,0 +1,290 @@
+"""
+Local customer phone index: canonical phone -> customer id.
+
+The importers and link scripts used to page the whole customers table into a
+dict on every run. This index keeps the mapping on disk under
+.cache/customer-phones instead, as two sorted arrays: canonical phones as
+int64 (phone_numbers.canonicalize) and customer uuids as 16 raw bytes, 24
+bytes per customer. Both are memory-mapped and searched with
+np.searchsorted, so opening the index costs nothing and every script shares
+the same files.
+
+Only the first build reads the whole table. After that a refresh reads the
+customers whose updated_at (scripts/sql/005) is past the stored
+(updated_at, id) watermark and merges them in. Rows changed within a few
+minutes of the previous refresh are read again, because a transaction that
+commits late can carry an updated_at from before that refresh.
+
+A phone shared by several customers resolves to the highest customer id, as
+the old dicts (filled in id order) did. Deleted customers stay in the index
+until a full rebuild (refresh --full). Without scripts/sql/005 every
+refresh is a full rebuild.
+
+Usage:
+    python scripts/customer_phone_index.py refresh [--full]
+    python scripts/customer_phone_index.py lookup 0912345678 [...]
+    python scripts/customer_phone_index.py stats
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from phone_numbers import canonicalize
+
+INDEX_DIR = Path(__file__).parent.parent / '.cache' / 'customer-phones'
+
+# Bump when the files change layout; older indexes are rebuilt
+INDEX_VERSION = 1
+
+PAGE_SIZE = 5000
+
+# Changes this close to the previous refresh are read again
+OVERLAP = timedelta(minutes=5)
+
+HEX_DIGITS = np.array(list('0123456789abcdef'), dtype='U1')
+# Where each byte's two hex digits go in 8-4-4-4-12 uuid text
+HEX_HIGH = np.array([i * 2 + (i >= 4) + (i >= 6) + (i >= 8) + (i >= 10) for i in range(16)])
+HEX_LOW = HEX_HIGH + 1
+
+
+def customer_bytes(ids):
+    """Customer uuids as 16-byte values"""
+    return np.array([uuid.UUID(str(customer_id)).bytes for customer_id in ids], dtype='S16')
+
+
+def customer_ids(raw):
+    """uuid strings for 16-byte values, formatted with array operations"""
+    octets = np.ascontiguousarray(raw, dtype='S16').view(np.uint8).reshape(-1, 16)
+    chars = np.full((len(octets), 36), '-', dtype='U1')
+    chars[:, HEX_HIGH] = HEX_DIGITS[octets >> 4]
+    chars[:, HEX_LOW] = HEX_DIGITS[octets & 15]
+    return chars.view('U36').ravel().astype(object)
+
+
+def filter_time(value):
+    """A PostgREST timestamp as UTC text that can go in a filter unquoted"""
+    moment = datetime.fromisoformat(value).astimezone(timezone.utc)
+    return moment.isoformat().replace('+00:00', 'Z')
+
+
+class CustomerPhoneIndex:
+    def __init__(self, client=None, index_dir=INDEX_DIR):
+        self.client = client
+        self.index_dir = Path(index_dir)
+        self.meta = self.load_meta()
+        self.phones = self.customers = None
+        self.open()
+
+    @property
+    def meta_path(self):
+        return self.index_dir / 'meta.json'
+
+    def load_meta(self):
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding='utf-8'))
+            if meta.get('version') == INDEX_VERSION and (self.index_dir / meta['generation']).exists():
+                return meta
+        return None
+
+    def open(self):
+        """Memory-map the current generation (empty arrays before the first build)"""
+        if self.meta is None:
+            self.phones = np.zeros(0, dtype=np.int64)
+            self.customers = np.zeros(0, dtype='S16')
+            return
+        generation = self.index_dir / self.meta['generation']
+        self.phones = np.load(generation / 'phones.npy', mmap_mode='r')
+        self.customers = np.load(generation / 'customers.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.phones)
+
+    def lookup(self, phones):
+        """Customer id for each phone (any format phone_numbers reads), None where unknown"""
+        numbers, valid = canonicalize(phones)
+        out = np.full(len(numbers), None, dtype=object)
+        if not len(self.phones):
+            return out
+        # Last entry with this phone: the highest customer id among duplicates
+        position = np.searchsorted(self.phones, numbers, side='right') - 1
+        found = valid & (position >= 0)
+        found[found] = self.phones[position[found]] == numbers[found]
+        if found.any():
+            out[found] = customer_ids(self.customers[position[found]])
+        return out
+
+    def get(self, phone, default=None):
+        customer_id = self.lookup([phone])[0]
+        return default if customer_id is None else customer_id
+
+    def fetch(self, since=None, after=None):
+        """Pages of customers changed at or after since, or after the after row (every customer if
+        neither), in watermark order"""
+        while True:
+            query = self.client.table('customers').select('id, phone, updated_at')\
+                .order('updated_at').order('id').limit(PAGE_SIZE)
+            if after is not None:
+                at = filter_time(after['updated_at'])
+                query = query.or_(f"updated_at.gt.{at},and(updated_at.eq.{at},id.gt.{after['id']})")
+            elif since is not None:
+                query = query.gte('updated_at', since)
+            rows = query.execute().data
+            if not rows:
+                return
+            yield rows
+            after = rows[-1]
+            if len(rows) < PAGE_SIZE:
+                return
+
+    def fetch_changes(self, watermark, refreshed_at):
+        """Pages of customers changed since a run that started at refreshed_at and stopped at watermark"""
+        since = datetime.fromisoformat(refreshed_at) - OVERLAP
+        if datetime.fromisoformat(watermark['updated_at']) <= since:
+            return self.fetch(after=watermark)
+        return self.fetch(since=filter_time(since.isoformat()))
+
+    def fetch_by_id(self):
+        """Pages of every customer in id order, for tables without updated_at"""
+        last_id = None
+        while True:
+            query = self.client.table('customers').select('id, phone').order('id').limit(PAGE_SIZE)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            rows = query.execute().data
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]['id']
+            if len(rows) < PAGE_SIZE:
+                return
+
+    def refresh(self, full=False):
+        """Bring the index up to date with customers; returns the number of customer rows read"""
+        incremental = not full and self.meta is not None and self.meta.get('watermark') is not None
+        started = datetime.now(timezone.utc)
+        if incremental:
+            watermark = self.meta['watermark']
+            pages = self.fetch_changes(watermark, self.meta['refreshed_at'])
+        else:
+            watermark = None
+            pages = self.fetch()
+
+        phones = [np.asarray(self.phones)] if incremental else []
+        customers = [np.asarray(self.customers)] if incremental else []
+        read = 0
+        try:
+            for rows in pages:
+                read += len(rows)
+                if incremental:
+                    # Drop the changed customers' old entries before adding the current ones
+                    keep = ~np.isin(customers[0], customer_bytes([row['id'] for row in rows]))
+                    phones[0], customers[0] = phones[0][keep], customers[0][keep]
+                numbers, valid = canonicalize([row['phone'] for row in rows])
+                phones.append(numbers[valid])
+                customers.append(customer_bytes([row['id'] for row, ok in zip(rows, valid) if ok]))
+                watermark = {'updated_at': rows[-1]['updated_at'], 'id': rows[-1]['id']}
+        except Exception as e:
+            if incremental or 'updated_at' not in str(e):
+                raise
+            print("  customers.updated_at is missing (scripts/sql/005); reading every customer by id")
+            phones, customers, read, watermark = [], [], 0, None
+            for rows in self.fetch_by_id():
+                read += len(rows)
+                numbers, valid = canonicalize([row['phone'] for row in rows])
+                phones.append(numbers[valid])
+                customers.append(customer_bytes([row['id'] for row, ok in zip(rows, valid) if ok]))
+
+        if incremental and not read:
+            self.meta['refreshed_at'] = started.isoformat()
+            self.write_meta()
+            return 0
+        phones = np.concatenate(phones) if phones else np.zeros(0, dtype=np.int64)
+        customers = np.concatenate(customers) if customers else np.zeros(0, dtype='S16')
+        self.save(phones, customers, watermark, started)
+        return read
+
+    def save(self, phones, customers, watermark, refreshed_at):
+        """Write a new generation sorted by (phone, customer) and point meta.json at it"""
+        order = np.lexsort((customers, phones))
+        generation = f"gen-{time.time_ns()}"
+        tmp_dir = self.index_dir / f"{generation}.tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        np.save(tmp_dir / 'phones.npy', phones[order])
+        np.save(tmp_dir / 'customers.npy', customers[order])
+        os.replace(tmp_dir, self.index_dir / generation)
+
+        self.meta = {
+            'version': INDEX_VERSION,
+            'generation': generation,
+            'entries': len(phones),
+            'watermark': watermark,
+            # When the refresh started: changes after this, less OVERLAP, are read next time
+            'refreshed_at': refreshed_at.isoformat(),
+        }
+        self.write_meta()
+        self.open()
+        # Other processes may still have an old generation mapped; those go on a later refresh
+        for path in self.index_dir.glob('gen-*'):
+            if path.name != generation:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def write_meta(self):
+        tmp_path = self.meta_path.with_name(f"{self.meta_path.name}.tmp")
+        tmp_path.write_text(json.dumps(self.meta, indent=2), encoding='utf-8')
+        os.replace(tmp_path, self.meta_path)
+
+
+def load_customer_phone_index(client, full=False):
+    """Open the shared index and refresh it from customers"""
+    index = CustomerPhoneIndex(client)
+    started = time.perf_counter()
+    read = index.refresh(full=full)
+    print(f"Customer phone index: {len(index):,} phones ({read:,} customer rows read, "
+          f"{time.perf_counter() - started:.1f}s)")
+    return index
+
+
+def main():
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    parser = argparse.ArgumentParser(description='Maintain the local customer phone index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    refresh_cmd = commands.add_parser('refresh', help='read customers changed since the last refresh')
+    refresh_cmd.add_argument('--full', action='store_true', help='rebuild from every customer')
+    lookup_cmd = commands.add_parser('lookup', help='customer id for the given phones')
+    lookup_cmd.add_argument('phones', nargs='+')
+    commands.add_parser('stats', help='size and watermark of the index')
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        load_dotenv(Path(__file__).parent.parent / '.env.local')
+        url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        load_customer_phone_index(create_client(url, key), full=args.full)
+    elif args.command == 'lookup':
+        index = CustomerPhoneIndex()
+        for phone, customer_id in zip(args.phones, index.lookup(args.phones)):
+            print(f"  {phone:<16} {customer_id or '-'}")
+    else:
+        index = CustomerPhoneIndex()
+        if index.meta is None:
+            print("No index yet; run: python scripts/customer_phone_index.py refresh")
+            return
+        size = sum(path.stat().st_size for path in (index.index_dir / index.meta['generation']).iterdir())
+        print(f"  phones:     {len(index):,}")
+        print(f"  size:       {size / 1024 / 1024:.1f} MB")
+        print(f"  watermark:  {index.meta['watermark']}")
+        print(f"  refreshed:  {index.meta['refreshed_at']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Failure recovery for batch inserts.
+
+When a batch is rejected, bisect_insert splits it in half and retries each
+half. This finds the bad rows in O(log n) requests per bad row, instead of
+resending the batch one record at a time. Rows the database still rejects on
+their own are appended to a dead-letter file (.cache/dead-letters/<table>.jsonl)
+together with the server error, so they can be fixed and replayed later.
+
+Failures that are not a database response (connection reset, timeout) are not
+bisected. Splitting would only repeat the outage, so the whole batch goes to
+the dead-letter file instead.
+
+Usage:
+    python scripts/dead_letters.py list [--table sms_zns_messages]
+    python scripts/dead_letters.py replay [--table sms_zns_messages] [--upsert]
+    python scripts/dead_letters.py clear [--table sms_zns_messages]
+"""
+
+import argparse
+import json
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from postgrest.exceptions import APIError
+
+DEAD_LETTER_DIR = Path(__file__).parent.parent / '.cache' / 'dead-letters'
+
+
+def dead_letter(record, error):
+    return {
+        'failed_at': datetime.now().isoformat(timespec='seconds'),
+        'error': str(error),
+        'code': getattr(error, 'code', None),
+        'record': record,
+    }
+
+
+class DeadLetters:
+    """Append-only JSONL of rejected rows for one table; safe to share between insert threads"""
+
+    def __init__(self, table='sms_zns_messages', directory=DEAD_LETTER_DIR):
+        self.table = table
+        self.path = Path(directory) / f"{table}.jsonl"
+        self.lock = threading.Lock()
+        self.added = 0
+
+    def add(self, records, error):
+        entries = [dead_letter(record, error) for record in records]
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open('a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            self.added += len(entries)
+
+    def read(self):
+        if not self.path.exists():
+            return []
+        with self.path.open(encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def rewrite(self, entries):
+        """Replace the file with the given entries (used after a replay)"""
+        with self.lock:
+            if not entries:
+                self.path.unlink(missing_ok=True)
+                return
+            tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+            with tmp_path.open('w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            os.replace(tmp_path, self.path)
+
+
+def bisect_insert(batch, write, reject, split_on=APIError):
+    """Insert a batch, splitting it on rejection until the bad rows are isolated.
+
+    write(records) sends one request; reject(records, error) receives rows that
+    could not be inserted. Only split_on errors (the server refusing the data)
+    are bisected. Returns how many rows landed.
+    """
+    try:
+        write(batch)
+        return len(batch)
+    except split_on as e:
+        if len(batch) == 1:
+            reject(batch, e)
+            return 0
+        middle = len(batch) // 2
+        return (bisect_insert(batch[:middle], write, reject, split_on)
+                + bisect_insert(batch[middle:], write, reject, split_on))
+    except Exception as e:
+        reject(batch, e)
+        return 0
+
+
+def replay(client, dead_letters, batch_size=500, upsert=False):
+    """Retry dead-lettered rows; rows rejected again stay in the file with their new error"""
+    entries = dead_letters.read()
+    records = [entry['record'] for entry in entries]
+    table = client.table(dead_letters.table)
+
+    def write(batch):
+        if upsert:
+            return table.upsert(batch, on_conflict='message_id', ignore_duplicates=True).execute()
+        return table.insert(batch).execute()
+
+    still_failing = []
+
+    def reject(batch, error):
+        still_failing.extend(dead_letter(record, error) for record in batch)
+
+    inserted = 0
+    for i in range(0, len(records), batch_size):
+        inserted += bisect_insert(records[i:i + batch_size], write, reject)
+
+    dead_letters.rewrite(still_failing)
+    return inserted, len(still_failing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and replay rows rejected during import')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in [('list', 'summarize rejected rows by error'),
+                            ('replay', 'retry rejected rows'),
+                            ('clear', 'drop every rejected row')]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--table', default='sms_zns_messages')
+        if name == 'replay':
+            command.add_argument('--upsert', action='store_true',
+                                 help='ignore rows whose message_id already exists')
+    args = parser.parse_args()
+
+    dead_letters = DeadLetters(args.table)
+    if args.command == 'list':
+        entries = dead_letters.read()
+        print(f"{dead_letters.path}: {len(entries)} rejected rows")
+        errors = Counter(entry['error'] for entry in entries)
+        for error, count in errors.most_common():
+            print(f"  {count:>7,}  {error[:160]}")
+    elif args.command == 'replay':
+        from dotenv import load_dotenv
+        from supabase import create_client
+
+        load_dotenv(Path(__file__).parent.parent / '.env.local')
+        url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+        key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+        inserted, remaining = replay(create_client(url, key), dead_letters, upsert=args.upsert)
+        print(f"Replayed {inserted} rows, {remaining} still rejected")
+    elif args.command == 'clear':
+        removed = len(dead_letters.read())
+        dead_letters.rewrite([])
+        print(f"Removed {removed} rejected rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Streaming reader for eSMS detail reports.
+Yields the sheet as DataFrame chunks so a month is never fully in memory.
+
+Engines:
+- openpyxl:  read-only mode, streams rows straight from the sheet XML; memory
+             stays flat however big the file (the default for .xlsx)
+- calamine:  Rust-backed reader (pip install python-calamine), much faster, but
+             opt-in: it loads the whole sheet before the first row comes out,
+             so peak memory grows with the file (roughly the sheet's
+             uncompressed size). Use it when the month fits in memory.
+- csv:       fast path for reports saved as .csv
+
+Sources can be paths or ArchiveMembers, i.e. workbooks inside the monthly
+eSMS ZIP downloads, which are read without extracting anything to disk.
+"""
+
+import csv
+import io
+import zipfile
+from pathlib import Path, PurePosixPath
+
+import pandas as pd
+
+from phone_numbers import digit_counts
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+# Rows above the header in the DoiSoat export (header is on row 7)
+HEADER_ROW = 6
+
+CHUNK_ROWS = 20000
+
+COLUMN_MAPPING = {
+    'STT': 'stt',
+    'Mã tin nhắn': 'message_id',
+    'Loại tin nhắn': 'message_type',
+    'Brandname': 'brandname',
+    'Thời gian gửi': 'sent_at',
+    'Nội dung': 'content',
+    'Số điện thoại': 'phone',
+    'Mạng': 'network',
+    'Tổng số tin MT': 'total_mt',
+    'Thành công': 'success_count',
+    'Thất bại': 'fail_count',
+    'ĐƠN GIÁ (VNĐ/MT)': 'unit_price',
+    'THÀNH TIỀN': 'total_cost',
+    'Template Id': 'template_id',
+    'Tên chiến dịch': 'campaign_name',
+}
+
+# Id columns that Excel stores as numbers but we keep as text
+ID_COLUMNS = ['message_id', 'template_id']
+
+ENGINES = ['auto', 'openpyxl', 'calamine', 'csv']
+
+READABLE_SUFFIXES = ('.xlsx', '.csv')
+
+
+class ArchiveMember:
+    """A report inside a ZIP archive; opens as an in-memory copy of just that member"""
+
+    def __init__(self, archive, member):
+        self.archive = Path(archive)
+        self.member = member
+        self.name = PurePosixPath(member).name
+        self.suffix = PurePosixPath(member).suffix
+
+    def open(self, mode='rb'):
+        # xlsx readers need random access, which a compressed zip stream cannot give
+        with zipfile.ZipFile(self.archive) as archive:
+            return io.BytesIO(archive.read(self.member))
+
+    def __str__(self):
+        return f"{self.archive}!{self.member}"
+
+
+def archive_members(archive):
+    """Report files (.xlsx/.csv) inside a ZIP archive"""
+    with zipfile.ZipFile(archive) as zf:
+        names = [info.filename for info in zf.infolist() if not info.is_dir()]
+    return [
+        ArchiveMember(archive, name) for name in names
+        if PurePosixPath(name).suffix.lower() in READABLE_SUFFIXES
+        and not PurePosixPath(name).name.startswith('~$')
+    ]
+
+
+def rows_openpyxl(file_path):
+    """Stream row tuples with openpyxl in read-only mode"""
+    from openpyxl import load_workbook
+    from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+
+    if isinstance(file_path, ArchiveMember):
+        file_path = file_path.open('rb')
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        if isinstance(sheet, ReadOnlyWorksheet):
+            # Read-only sheets stop at the declared <dimension>, which some report
+            # generators write stale; read to the last row actually there (as pandas does)
+            sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def rows_calamine(file_path):
+    """Yield row lists from the first sheet via python-calamine (the sheet is loaded whole first)"""
+    if isinstance(file_path, ArchiveMember):
+        workbook = CalamineWorkbook.from_filelike(file_path.open('rb'))
+    else:
+        workbook = CalamineWorkbook.from_path(str(file_path))
+    yield from workbook.get_sheet_by_index(0).iter_rows()
+
+
+def rows_csv(file_path):
+    """Yield row lists from a CSV export"""
+    if isinstance(file_path, ArchiveMember):
+        f = io.TextIOWrapper(file_path.open('rb'), encoding='utf-8-sig', newline='')
+    else:
+        f = open(file_path, newline='', encoding='utf-8-sig')
+    with f:
+        yield from csv.reader(f)
+
+
+def resolve_engine(file_path, engine='auto'):
+    """Pick a reader for the file"""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown reader engine '{engine}', expected one of {ENGINES}")
+    suffix = file_path.suffix if isinstance(file_path, ArchiveMember) else Path(file_path).suffix
+    if suffix.lower() == '.csv':
+        return 'csv'
+    if engine == 'auto':
+        # Only openpyxl streams; calamine holds the sheet in memory, so it has to be asked for
+        return 'openpyxl'
+    if engine == 'calamine' and CalamineWorkbook is None:
+        raise ImportError("python-calamine is not installed (pip install python-calamine)")
+    return engine
+
+
+def iter_rows(file_path, engine='auto'):
+    """Raw rows of the first sheet from the chosen engine"""
+    engine = resolve_engine(file_path, engine)
+    if engine == 'csv':
+        return rows_csv(file_path)
+    if engine == 'calamine':
+        return rows_calamine(file_path)
+    return rows_openpyxl(file_path)
+
+
+def header_names(header):
+    """Map the header row to English column names"""
+    names = []
+    for i, name in enumerate(header):
+        name = str(name).strip() if name not in (None, '') else f'Unnamed: {i}'
+        names.append(COLUMN_MAPPING.get(name, name))
+    return names
+
+
+def valid_phone_mask(phone):
+    """Rows whose phone has 9-12 digits (drops summary and blank rows)"""
+    digit_count = pd.Series(digit_counts(phone), index=phone.index)
+    return phone.notna() & digit_count.between(9, 12)
+
+
+def integral_to_int(value):
+    """1234.0 -> 1234 so numeric ids read the same from every engine"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def make_chunk(rows, columns):
+    """Build a filtered DataFrame from buffered rows"""
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    df = df.astype(object).where(df.notna(), None)
+    for name in ID_COLUMNS:
+        if name in df.columns:
+            df[name] = pd.Series([integral_to_int(v) for v in df[name]], index=df.index, dtype=object)
+    if 'phone' in df.columns:
+        df = df[valid_phone_mask(df['phone'])]
+    return df
+
+
+def iter_chunks(file_path, chunk_rows=CHUNK_ROWS, engine='auto'):
+    """Yield DataFrame chunks of data rows with English column names"""
+    rows = iter_rows(file_path, engine)
+
+    for _ in range(HEADER_ROW):
+        if next(rows, None) is None:
+            return
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = header_names(header)
+    width = len(columns)
+
+    buffer = []
+    for row in rows:
+        # Empty cells come back as '' from calamine and csv; pandas treats them as missing
+        row = [None if value == '' else value for value in row[:width]]
+        if all(value is None for value in row):
+            continue
+        row.extend([None] * (width - len(row)))
+        buffer.append(row)
+        if len(buffer) >= chunk_rows:
+            chunk = make_chunk(buffer, columns)
+            buffer = []
+            if not chunk.empty:
+                yield chunk
+
+    if buffer:
+        chunk = make_chunk(buffer, columns)
+        if not chunk.empty:
+            yield chunk
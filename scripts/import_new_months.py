@@ -2,14 +2,22 @@
 Import new SMS/ZNS months data
 """
 
+import argparse
 import os
 import re
-import pandas as pd
 from datetime import datetime
 from supabase import create_client
 from dotenv import load_dotenv
 from pathlib import Path
 
+from campaign_classifier import CampaignClassifier
+from classification_cache import ClassificationCache
+from copy_loader import CopyLoader
+from customer_phone_index import CustomerPhoneIndex
+from dead_letters import DeadLetters, bisect_insert
+from esms_reader import iter_chunks
+from esms_records import build_records
+
 load_dotenv(Path(__file__).parent.parent / '.env.local')
 
 SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
@@ -17,24 +25,20 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-CAMPAIGN_PATTERNS = {
-    'birthday': {
-        'patterns': [r'sinh\s*nh[aâ]t', r'birthday', r'sn\d+', r'20%.*sinh\s*nh[aâ]t'],
-        'voucher_pattern': r'(SN\d+[A-Z]*)',
-    },
-    'winback_6m': {'patterns': [r'6\s*th[aá]ng', r'6\s*months?'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-    'winback_9m': {'patterns': [r'9\s*th[aá]ng', r'9\s*months?'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-    'winback_12m': {'patterns': [r'12\s*th[aá]ng', r'12\s*months?', r'1\s*n[aă]m'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-    'winback_18m': {'patterns': [r'18\s*th[aá]ng', r'18\s*months?'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-    'warranty': {'patterns': [r'b[aả]o\s*h[aà]nh', r'warranty', r'x[aá]c\s*nh[aậ]n.*b[aả]o\s*h[aà]nh'], 'voucher_pattern': None},
-    'referral': {'patterns': [r'gi[oớ]i\s*thi[eệ]u', r'referral', r'b[aạ]n\s*b[eè]'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-    'welcome': {'patterns': [r'ch[aà]o\s*m[uừ]ng', r'welcome', r'kh[aá]ch\s*h[aà]ng\s*m[oớ]i'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-    'eye_check': {'patterns': [r'kh[aá]m\s*m[aắ]t', r'ki[eể]m\s*tra\s*m[aắ]t', r'eye\s*check', r'l[iị]ch\s*h[eẹ]n'], 'voucher_pattern': None},
-    'adhoc_campaign': {'patterns': [r'gi[aả]m\s*gi[aá]', r'khuy[eế]n\s*m[aã]i', r'promotion', r'sale', r'ưu\s*đ[aã]i', r'\d+%\s*off'], 'voucher_pattern': r'([A-Z0-9]{6,})'},
-}
-
 campaign_type_cache = {}
 
+# Patterns compiled once; each file's content column is classified in one pass, and
+# each template only until the cache has its label
+classifier = CampaignClassifier()
+campaign_cache = ClassificationCache(classifier.label, classify_texts=classifier.label_texts)
+
+# customer_id is resolved at import from the shared local phone index, so only
+# messages without a matching customer are left for link_customers.py
+customer_phones = CustomerPhoneIndex(supabase)
+
+# Rows the database rejects are kept for scripts/dead_letters.py replay
+dead_letters = DeadLetters('sms_zns_messages')
+
 def load_campaign_types():
     global campaign_type_cache
     result = supabase.table('sms_zns_campaign_types').select('id, name').execute()
@@ -43,43 +47,22 @@ def load_campaign_types():
         campaign_type_cache[name_lower] = row['id']
         campaign_type_cache[row['name'].lower()] = row['id']
 
-def normalize_phone(phone):
-    if not phone:
-        return None
-    phone_str = str(phone).replace('.0', '').strip()
-    phone_str = re.sub(r'\D', '', phone_str)
-    if phone_str.startswith('84') and len(phone_str) > 9:
-        phone_str = '0' + phone_str[2:]
-    if not phone_str.startswith('0') and len(phone_str) == 9:
-        phone_str = '0' + phone_str
-    if len(phone_str) != 10:
-        return None
-    return phone_str
-
-def classify_campaign(content, template_id=None):
-    if not content:
-        return None, None
-    content_lower = content.lower()
-    for campaign_key, config in CAMPAIGN_PATTERNS.items():
-        for pattern in config['patterns']:
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                voucher_code = None
-                if config.get('voucher_pattern'):
-                    match = re.search(config['voucher_pattern'], content, re.IGNORECASE)
-                    if match:
-                        voucher_code = match.group(1).upper()
-                campaign_type_id = campaign_type_cache.get(campaign_key) or campaign_type_cache.get(campaign_key.replace('_', ' '))
-                return campaign_type_id, voucher_code
-    if re.search(r'\d+%|gi[aả]m|voucher', content_lower):
-        return campaign_type_cache.get('adhoc_campaign') or campaign_type_cache.get('adhoc campaign'), None
-    return None, None
-
-def determine_channel(message_type):
-    if not message_type:
-        return 'sms'
-    if 'zalo' in str(message_type).lower():
-        return 'zns'
-    return 'sms'
+def load_customer_phones():
+    """Bring the local customer phone index up to date; on failure the last local copy is used"""
+    try:
+        customer_phones.refresh()
+    except Exception as e:
+        print(f"Warning: Could not refresh customer phones: {e}")
+    print(f"Loaded {len(customer_phones):,} customer phone numbers")
+
+def classify_campaigns(contents, template_ids=None):
+    campaign_keys, voucher_codes = classifier.classify_column(contents, template_ids, cache=campaign_cache)
+    # Map to database campaign type
+    type_ids = {
+        key: campaign_type_cache.get(key) or campaign_type_cache.get(key.replace('_', ' '))
+        for key in set(campaign_keys) if key is not None
+    }
+    return [type_ids.get(key) for key in campaign_keys], voucher_codes
 
 def parse_date_from_filename(filename):
     match = re.search(r'(\d{2})-(\d{2})-(\d{4})_(\d{2})-(\d{2})-(\d{4})', filename)
@@ -89,96 +72,42 @@ def parse_date_from_filename(filename):
     return None
 
 def read_excel_file(file_path):
-    try:
-        df = pd.read_excel(file_path, header=6)
-        column_mapping = {
-            'STT': 'stt', 'Mã tin nhắn': 'message_id', 'Loại tin nhắn': 'message_type',
-            'Brandname': 'brandname', 'Thời gian gửi': 'sent_at', 'Nội dung': 'content',
-            'Số điện thoại': 'phone', 'Mạng': 'network', 'Tổng số tin MT': 'total_mt',
-            'Thành công': 'success_count', 'Thất bại': 'fail_count',
-            'ĐƠN GIÁ (VNĐ/MT)': 'unit_price', 'THÀNH TIỀN': 'total_cost',
-            'Template Id': 'template_id', 'Tên chiến dịch': 'campaign_name',
-        }
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-        if 'phone' in df.columns:
-            df = df[df['phone'].notna()]
-            def is_valid_phone(x):
-                if pd.isna(x):
-                    return False
-                phone_str = str(x).replace('.0', '').strip()
-                digits_only = re.sub(r'\D', '', phone_str)
-                return 9 <= len(digits_only) <= 12
-            df = df[df['phone'].apply(is_valid_phone)]
-        return df
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None
+    # Errors propagate: chunks before the bad one may already be inserted, so main() reports the file
+    return iter_chunks(file_path)
 
 def process_dataframe(df, source_file, report_month):
-    records = []
-    for _, row in df.iterrows():
-        try:
-            phone = normalize_phone(row.get('phone', ''))
-            if not phone:
-                continue
-            content = str(row.get('content', '')) if pd.notna(row.get('content')) else None
-            template_id = str(row.get('template_id', '')) if pd.notna(row.get('template_id')) else None
-            campaign_type_id, voucher_code = classify_campaign(content, template_id)
-            channel = determine_channel(row.get('message_type'))
-            sent_at = None
-            if pd.notna(row.get('sent_at')):
-                try:
-                    if isinstance(row['sent_at'], datetime):
-                        sent_at = row['sent_at'].isoformat()
-                    else:
-                        sent_at = pd.to_datetime(row['sent_at'], dayfirst=True).isoformat()
-                except:
-                    sent_at = datetime.now().isoformat()
-            else:
-                sent_at = datetime.now().isoformat()
-            record = {
-                'message_id': str(row.get('message_id', '')) if pd.notna(row.get('message_id')) else None,
-                'message_type': str(row.get('message_type', '')) if pd.notna(row.get('message_type')) else None,
-                'brandname': str(row.get('brandname', '')) if pd.notna(row.get('brandname')) else None,
-                'channel': channel, 'phone': phone, 'customer_id': None,
-                'content': content[:5000] if content else None,
-                'template_id': template_id, 'campaign_type_id': campaign_type_id,
-                'voucher_code': voucher_code, 'sent_at': sent_at,
-                'network': str(row.get('network', '')) if pd.notna(row.get('network')) else None,
-                'total_mt': int(row.get('total_mt', 1)) if pd.notna(row.get('total_mt')) else 1,
-                'success_count': int(row.get('success_count', 0)) if pd.notna(row.get('success_count')) else 0,
-                'fail_count': int(row.get('fail_count', 0)) if pd.notna(row.get('fail_count')) else 0,
-                'unit_price': float(row.get('unit_price', 0)) if pd.notna(row.get('unit_price')) else 0,
-                'total_cost': float(row.get('total_cost', 0)) if pd.notna(row.get('total_cost')) else 0,
-                'report_month': report_month.isoformat() if report_month else None,
-                'source_file': source_file,
-            }
-            records.append(record)
-        except Exception as e:
-            continue
-    return records
+    return build_records(df, source_file, report_month, classify_campaigns, customer_lookup=customer_phones)
+
+def reject_records(records, error):
+    """Keep rows the database would not take, for scripts/dead_letters.py replay"""
+    print(f"  {len(records)} record(s) rejected: {error}")
+    dead_letters.add(records, error)
 
 def insert_records(records, batch_size=500):
+    """Insert in batches, bisecting a rejected batch down to its bad rows; returns rows that landed"""
     total = len(records)
     inserted = 0
     for i in range(0, total, batch_size):
-        batch = records[i:i + batch_size]
-        try:
-            supabase.table('sms_zns_messages').insert(batch).execute()
-            inserted += len(batch)
-            print(f"  Inserted {inserted}/{total}")
-        except Exception as e:
-            print(f"  Error: {e}")
+        inserted += bisect_insert(records[i:i + batch_size],
+                                  lambda batch: supabase.table('sms_zns_messages').insert(batch).execute(),
+                                  reject_records)
+        print(f"  Inserted {inserted}/{total}")
     return inserted
 
 def main():
+    parser = argparse.ArgumentParser(description='Import the new months of eSMS detail files')
+    parser.add_argument('--loader', choices=['rest', 'copy'], default='rest',
+                        help='rest: batched inserts through Supabase (default); '
+                             'copy: COPY straight into Postgres via DATABASE_URL')
+    args = parser.parse_args()
+
     print("=" * 50)
     print("Import New Months Data")
     print("=" * 50)
 
     load_campaign_types()
+    load_customer_phones()
+    copy_loader = CopyLoader(reject=reject_records) if args.loader == 'copy' else None
 
     # New files to import
     new_files = [
@@ -188,30 +117,61 @@ def main():
     ]
 
     total_records = 0
-    for file_path in new_files:
-        path = Path(file_path)
-        if not path.exists():
-            print(f"File not found: {path.name}")
-            continue
-
-        print(f"\nProcessing: {path.name}")
-        report_month = parse_date_from_filename(path.name)
-        print(f"  Month: {report_month}")
+    failed = []
+    try:
+        for file_path in new_files:
+            path = Path(file_path)
+            if not path.exists():
+                print(f"File not found: {path.name}")
+                continue
 
-        df = read_excel_file(path)
-        if df is None or df.empty:
-            print("  No data")
-            continue
+            print(f"\nProcessing: {path.name}")
+            report_month = parse_date_from_filename(path.name)
+            print(f"  Month: {report_month}")
+
+            rows = 0
+            prepared = 0
+            linked = 0
+            try:
+                for df in read_excel_file(path):
+                    rows += len(df)
+                    records = process_dataframe(df, path.name, report_month)
+                    prepared += len(records)
+                    linked += sum(1 for record in records if record['customer_id'])
+
+                    if records and copy_loader:
+                        copy_loader.submit(records, path.name)
+                    elif records:
+                        inserted = insert_records(records)
+                        total_records += inserted
+            except Exception as e:
+                print(f"  Error reading {path.name}: {e}")
+                failed.append(path.name)
+                if copy_loader:
+                    total_records += copy_loader.drain(path.name)
+                continue
 
-        print(f"  Rows: {len(df)}")
-        records = process_dataframe(df, path.name, report_month)
-        print(f"  Valid records: {len(records)}")
+            if copy_loader:
+                total_records += copy_loader.drain(path.name)
 
-        if records:
-            inserted = insert_records(records)
-            total_records += inserted
+            if rows == 0:
+                print("  No data")
+                continue
 
+            print(f"  Rows: {rows}")
+            print(f"  Valid records: {prepared}")
+            print(f"  Linked to customers: {linked}")
+    finally:
+        # Even when a merge failed, so the connection and its staging table are released
+        if copy_loader:
+            copy_loader.close()
     print(f"\nTotal imported: {total_records}")
+    if failed:
+        print(f"Failed files (partly imported; check and re-import): {', '.join(failed)}")
+    if dead_letters.added:
+        print(f"{dead_letters.added} rejected records saved to {dead_letters.path}")
+        print("  Fix and retry them with: python scripts/dead_letters.py replay")
+    print(campaign_cache.summary())
     print("=" * 50)
 
 if __name__ == "__main__":
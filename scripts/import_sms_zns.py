@@ -3,15 +3,30 @@ SMS/ZNS Data Import Script for Mắt Việt CDP
 This script imports eSMS monthly reports into Supabase database
 """
 
+import argparse
+import json
+import multiprocessing
 import os
 import re
 import zipfile
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from queue import Empty
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from pathlib import Path
 
+from campaign_classifier import CAMPAIGN_PATTERNS, CampaignClassifier
+from classification_cache import ClassificationCache
+from copy_loader import CopyLoader
+from customer_phone_index import CustomerPhoneIndex
+from dead_letters import DeadLetters, bisect_insert
+from esms_reader import archive_members, iter_chunks
+from esms_records import PARSER_VERSION, build_records, fill_import_time
+from insert_pipeline import InsertPipeline
+from known_messages import KnownMessages
+import parse_cache
+
 # Load environment variables
 load_dotenv(Path(__file__).parent.parent / '.env.local')
 
@@ -26,99 +41,23 @@ supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Data directory
 DATA_DIR = Path(r"D:\Power Bi\BC bán hàng\SMs ZNS outbounce")
-EXTRACT_DIR = DATA_DIR / "extracted"
-
-# Campaign type patterns for classification
-CAMPAIGN_PATTERNS = {
-    'birthday': {
-        'patterns': [
-            r'sinh\s*nh[aâ]t',
-            r'birthday',
-            r'sn\d+',  # SN followed by numbers (voucher codes)
-            r'20%.*sinh\s*nh[aâ]t',
-        ],
-        'voucher_pattern': r'(SN\d+[A-Z]*)',
-    },
-    'winback_6m': {
-        'patterns': [
-            r'6\s*th[aá]ng',
-            r'6\s*months?',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-    'winback_9m': {
-        'patterns': [
-            r'9\s*th[aá]ng',
-            r'9\s*months?',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-    'winback_12m': {
-        'patterns': [
-            r'12\s*th[aá]ng',
-            r'12\s*months?',
-            r'1\s*n[aă]m',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-    'winback_18m': {
-        'patterns': [
-            r'18\s*th[aá]ng',
-            r'18\s*months?',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-    'warranty': {
-        'patterns': [
-            r'b[aả]o\s*h[aà]nh',
-            r'warranty',
-            r'x[aá]c\s*nh[aậ]n.*b[aả]o\s*h[aà]nh',
-        ],
-        'voucher_pattern': None,
-    },
-    'referral': {
-        'patterns': [
-            r'gi[oớ]i\s*thi[eệ]u',
-            r'referral',
-            r'b[aạ]n\s*b[eè]',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-    'welcome': {
-        'patterns': [
-            r'ch[aà]o\s*m[uừ]ng',
-            r'welcome',
-            r'kh[aá]ch\s*h[aà]ng\s*m[oớ]i',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-    'eye_check': {
-        'patterns': [
-            r'kh[aá]m\s*m[aắ]t',
-            r'ki[eể]m\s*tra\s*m[aắ]t',
-            r'eye\s*check',
-            r'l[iị]ch\s*h[eẹ]n',
-        ],
-        'voucher_pattern': None,
-    },
-    'adhoc_campaign': {
-        'patterns': [
-            r'gi[aả]m\s*gi[aá]',
-            r'khuy[eế]n\s*m[aã]i',
-            r'promotion',
-            r'sale',
-            r'ưu\s*đ[aã]i',
-            r'\d+%\s*off',
-        ],
-        'voucher_pattern': r'([A-Z0-9]{6,})',
-    },
-}
+
+# ZIP archives already imported, by checksum
+PROCESSED_ARCHIVES_FILE = Path(__file__).parent.parent / '.cache' / 'processed-archives.json'
 
 # Cache for campaign type IDs
 campaign_type_cache = {}
 
-# Cache for customer phone mapping
-customer_phone_cache = {}
+# Patterns compiled once; each file's content column is classified in one pass, and
+# each template only until the cache has its label
+classifier = CampaignClassifier()
+campaign_cache = ClassificationCache(classifier.label, classify_texts=classifier.label_texts)
+
+# Customer phone mapping, memory-mapped from the shared local index
+customer_phones = CustomerPhoneIndex(supabase)
+
+# Rows the database rejected this run
+dead_letters = DeadLetters('sms_zns_messages')
 
 
 def load_campaign_types():
@@ -135,129 +74,88 @@ def load_campaign_types():
 
 
 def load_customer_phones():
-    """Load customer phone numbers for matching"""
-    global customer_phone_cache
+    """Bring the local customer phone index up to date"""
     print("Loading customer phone numbers...")
 
     try:
-        # Fetch customers in batches
-        offset = 0
-        batch_size = 1000
-
-        while True:
-            result = supabase.table('customers').select('id, phone').range(offset, offset + batch_size - 1).execute()
-            if not result.data:
-                break
-
-            for row in result.data:
-                if row.get('phone'):
-                    # Normalize phone number (remove spaces, +84 -> 0)
-                    phone = normalize_phone(row['phone'])
-                    if phone:
-                        customer_phone_cache[phone] = row['id']
-
-            offset += batch_size
-            if len(result.data) < batch_size:
-                break
+        read = customer_phones.refresh()
+        print(f"Read {read:,} changed customer rows")
     except Exception as e:
-        print(f"Warning: Could not load customer phones: {e}")
+        print(f"Warning: Could not refresh customer phones: {e}")
 
-    print(f"Loaded {len(customer_phone_cache)} customer phone numbers")
-    if len(customer_phone_cache) == 0:
+    print(f"Loaded {len(customer_phones)} customer phone numbers")
+    if len(customer_phones) == 0:
         print("Note: Customer matching will be skipped (no phone data in customers table)")
 
 
-def normalize_phone(phone):
-    """Normalize phone number to standard format"""
-    if not phone:
-        return None
-
-    # Convert to string and remove decimal point if present (Excel number format)
-    phone_str = str(phone).replace('.0', '').strip()
-
-    # Remove all non-digits
-    phone_str = re.sub(r'\D', '', phone_str)
-
-    # Handle +84 or 84 prefix
-    if phone_str.startswith('84') and len(phone_str) > 9:
-        phone_str = '0' + phone_str[2:]
-
-    # Ensure it starts with 0
-    if not phone_str.startswith('0') and len(phone_str) == 9:
-        phone_str = '0' + phone_str
-
-    # Validate length (Vietnamese mobile numbers - 10 digits)
-    if len(phone_str) != 10:
-        return None
-
-    return phone_str
-
+def classify_campaigns(contents, template_ids=None):
+    """Campaign type ids and voucher codes for a whole content column"""
+    campaign_keys, voucher_codes = classifier.classify_column(contents, template_ids, cache=campaign_cache)
+    # Map to database campaign type
+    type_ids = {
+        key: campaign_type_cache.get(key) or campaign_type_cache.get(key.replace('_', ' '))
+        for key in set(campaign_keys) if key is not None
+    }
+    return [type_ids.get(key) for key in campaign_keys], voucher_codes
 
-def classify_campaign(content, template_id=None):
-    """Classify message into campaign type based on content and template"""
-    if not content:
-        return None, None
 
-    content_lower = content.lower()
+def is_detail_report(name):
+    """Detail files only (eSMS also ships summary/'sumary' workbooks)"""
+    name = name.lower()
+    return 'summary' not in name and 'sumary' not in name
 
-    # Check each campaign type's patterns
-    for campaign_key, config in CAMPAIGN_PATTERNS.items():
-        for pattern in config['patterns']:
-            if re.search(pattern, content_lower, re.IGNORECASE):
-                # Try to extract voucher code
-                voucher_code = None
-                if config.get('voucher_pattern'):
-                    match = re.search(config['voucher_pattern'], content, re.IGNORECASE)
-                    if match:
-                        voucher_code = match.group(1).upper()
 
-                # Map to database campaign type
-                campaign_type_id = None
-                if campaign_key in campaign_type_cache:
-                    campaign_type_id = campaign_type_cache[campaign_key]
-                elif campaign_key.replace('_', ' ') in campaign_type_cache:
-                    campaign_type_id = campaign_type_cache[campaign_key.replace('_', ' ')]
+def load_processed_archives():
+    """Checksums of ZIP archives whose reports were all imported"""
+    if PROCESSED_ARCHIVES_FILE.exists():
+        return json.loads(PROCESSED_ARCHIVES_FILE.read_text(encoding='utf-8'))
+    return {}
 
-                return campaign_type_id, voucher_code
 
-    # Default to adhoc if has discount mention but no specific match
-    if re.search(r'\d+%|gi[aả]m|voucher', content_lower):
-        return campaign_type_cache.get('adhoc_campaign') or campaign_type_cache.get('adhoc campaign'), None
+def find_archive_reports(reprocess=False):
+    """Detail reports inside the ZIP downloads, read in place without extracting.
 
-    return None, None
+    Returns {zip_path: (checksum, [ArchiveMember, ...])} for archives not yet imported.
+    """
+    zip_files = sorted(DATA_DIR.glob('*.zip'))
+    print(f"Found {len(zip_files)} ZIP files")
+    if not zip_files:
+        return {}
 
+    processed = load_processed_archives()
 
-def determine_channel(message_type):
-    """Determine if message is SMS or ZNS based on message type"""
-    if not message_type:
-        return 'sms'
+    # Checksum archives concurrently; hashlib and file reads release the GIL
+    with ThreadPoolExecutor(max_workers=min(8, len(zip_files))) as pool:
+        checksums = list(pool.map(parse_cache.file_digest, zip_files))
 
-    msg_type_lower = str(message_type).lower()
-
-    if 'zalo' in msg_type_lower:
-        return 'zns'
-
-    return 'sms'
-
-
-def extract_zip_files():
-    """Extract all ZIP files in the data directory"""
-    EXTRACT_DIR.mkdir(exist_ok=True)
+    archives = {}
+    for zip_path, checksum in zip(zip_files, checksums):
+        if checksum in processed and not reprocess:
+            print(f"  Skipping {zip_path.name} (already imported)")
+            continue
+        try:
+            members = [m for m in archive_members(zip_path) if is_detail_report(m.name)]
+        except zipfile.BadZipFile as e:
+            print(f"  Error reading {zip_path.name}: {e}")
+            continue
+        print(f"  {zip_path.name}: {len(members)} detail reports")
+        archives[zip_path] = (checksum, members)
+    return archives
 
-    zip_files = list(DATA_DIR.glob('*.zip'))
-    print(f"Found {len(zip_files)} ZIP files to extract")
 
-    for zip_path in zip_files:
-        print(f"Extracting: {zip_path.name}")
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Extract to a subfolder named after the zip file
-                extract_subdir = EXTRACT_DIR / zip_path.stem
-                extract_subdir.mkdir(exist_ok=True)
-                zip_ref.extractall(extract_subdir)
-                print(f"  Extracted to: {extract_subdir}")
-        except Exception as e:
-            print(f"  Error extracting {zip_path.name}: {e}")
+def mark_archives_processed(archives, failed):
+    """Remember archives whose every report imported, so later runs skip them"""
+    processed = load_processed_archives()
+    for zip_path, (checksum, members) in archives.items():
+        if any(str(member) in failed for member in members):
+            continue
+        processed[checksum] = {
+            'archive': zip_path.name,
+            'reports': [member.member for member in members],
+            'imported_at': datetime.now().isoformat(timespec='seconds'),
+        }
+    PROCESSED_ARCHIVES_FILE.parent.mkdir(parents=True, exist_ok=True)
+    PROCESSED_ARCHIVES_FILE.write_text(json.dumps(processed, indent=2), encoding='utf-8')
 
 
 def parse_date_from_filename(filename):
@@ -275,147 +173,238 @@ def parse_date_from_filename(filename):
 
 
 def read_excel_file(file_path):
-    """Read Excel file with header at row 6"""
+    """Stream the detail sheet (header at row 7) as DataFrame chunks"""
+    return iter_chunks(file_path)
+
+
+def process_dataframe(df, source_file, report_month, fill_sent_at=True):
+    """Process DataFrame and prepare records for insertion"""
+    # Built column-at-a-time; this script has always parsed sent_at month-first
+    return build_records(
+        df, source_file, report_month, classify_campaigns,
+        customer_lookup=customer_phones, dayfirst=False, fill_sent_at=fill_sent_at,
+    )
+
+
+def write_records(records, upsert=False):
+    """Send one insert; with upsert, rows whose message_id already exists are ignored"""
+    table = supabase.table('sms_zns_messages')
+    if upsert:
+        return table.upsert(records, on_conflict='message_id', ignore_duplicates=True).execute()
+    return table.insert(records).execute()
+
+
+def reject_records(records, error, known=None):
+    """Keep rows the database would not take, for scripts/dead_letters.py replay"""
+    print(f"    {len(records)} record(s) rejected: {error}")
+    dead_letters.add(records, error)
+    if known is not None:
+        # Not in the table after all; a later copy of these messages must not be skipped
+        known.forget(records)
+
+
+def insert_batch(batch, upsert=False, known=None):
+    """Insert one batch, bisecting a rejected batch down to its bad rows; returns rows that landed"""
+    return bisect_insert(batch, lambda records: write_records(records, upsert),
+                         lambda records, error: reject_records(records, error, known))
+
+
+def send_records(records, loader, tag, known=None):
+    """Queue a chunk for insert, dropping rows already loaded when running idempotently.
+
+    Returns how many records were queued.
+    """
+    if known is not None:
+        records = known.filter_new(records)
+    if records:
+        loader.submit(records, tag)
+    return len(records)
+
+
+def cache_context():
+    """Everything besides the file content that shapes the parsed records"""
+    return {
+        'parser': PARSER_VERSION,
+        'patterns': CAMPAIGN_PATTERNS,
+        'campaign_types': campaign_type_cache,
+        'dayfirst': False,
+    }
+
+
+def iter_file_records(excel_file, report_month, use_cache=True):
+    """Yield (rows, records) per chunk, from the parse cache when this exact file was parsed before"""
+    if not use_cache or not parse_cache.enabled():
+        for df in read_excel_file(excel_file):
+            yield len(df), process_dataframe(df, excel_file.name, report_month)
+        return
+
+    key = parse_cache.entry_key(excel_file, cache_context())
+    cached = parse_cache.load(key)
+    if cached is not None:
+        meta, chunks = cached
+        print(f"  Loaded {meta['records']} records from parse cache")
+        for rows, records in chunks:
+            # customer_id is not cached (customers change between runs), and the
+            # filename-derived fields belong to this copy of the file
+            customer_ids = customer_phones.lookup([record['phone'] for record in records])
+            for record, customer_id in zip(records, customer_ids):
+                record['customer_id'] = customer_id
+                record['report_month'] = report_month.isoformat()
+                record['source_file'] = excel_file.name
+            # A missing sent_at is cached as null and means the time of this import
+            yield rows, fill_import_time(records)
+        return
+
+    writer = parse_cache.CacheWriter(key, excel_file.name, report_month)
     try:
-        # Read with header at row 6 (0-indexed = 6, because row 6 has the actual headers)
-        df = pd.read_excel(file_path, header=6)
-
-        # Rename columns to English
-        column_mapping = {
-            'STT': 'stt',
-            'Mã tin nhắn': 'message_id',
-            'Loại tin nhắn': 'message_type',
-            'Brandname': 'brandname',
-            'Thời gian gửi': 'sent_at',
-            'Nội dung': 'content',
-            'Số điện thoại': 'phone',
-            'Mạng': 'network',
-            'Tổng số tin MT': 'total_mt',
-            'Thành công': 'success_count',
-            'Thất bại': 'fail_count',
-            'ĐƠN GIÁ (VNĐ/MT)': 'unit_price',
-            'THÀNH TIỀN': 'total_cost',
-            'Template Id': 'template_id',
-            'Tên chiến dịch': 'campaign_name',
-        }
+        for df in read_excel_file(excel_file):
+            records = process_dataframe(df, excel_file.name, report_month, fill_sent_at=False)
+            writer.write(len(df), records)
+            yield len(df), fill_import_time(records)
+    except BaseException:
+        writer.discard()
+        raise
+    writer.commit()
 
-        # Try to rename columns (some files might have slight variations)
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df = df.rename(columns={old_col: new_col})
-
-        # Filter out rows that are not actual data (e.g., summary rows)
-        if 'phone' in df.columns:
-            df = df[df['phone'].notna()]
-            # Check if phone looks like a valid number (integer or string of digits)
-            def is_valid_phone(x):
-                if pd.isna(x):
-                    return False
-                phone_str = str(x).replace('.0', '').strip()
-                # Check if it's mostly digits (allow some formatting)
-                digits_only = re.sub(r'\D', '', phone_str)
-                return len(digits_only) >= 9 and len(digits_only) <= 12
-            df = df[df['phone'].apply(is_valid_phone)]
-
-        return df
 
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return None
+def import_files(excel_files, loader, use_cache=True, known=None):
+    """Parse and insert files one after another.
 
+    Returns (records inserted, set of files that failed to read).
+    """
+    total_records = 0
+    failed = set()
 
-def process_dataframe(df, source_file, report_month):
-    """Process DataFrame and prepare records for insertion"""
-    records = []
+    for excel_file in excel_files:
+        print(f"\nProcessing: {excel_file.name}")
 
-    for _, row in df.iterrows():
-        try:
-            # Normalize phone number
-            phone_raw = str(row.get('phone', '')).replace('.0', '')
-            phone = normalize_phone(phone_raw)
+        # Parse report month from filename
+        report_month = parse_date_from_filename(excel_file.name)
+        if not report_month:
+            print(f"  Could not determine report month, skipping")
+            continue
 
-            if not phone:
-                continue
+        print(f"  Report month: {report_month}")
 
-            # Get content
-            content = str(row.get('content', '')) if pd.notna(row.get('content')) else None
-            template_id = str(row.get('template_id', '')) if pd.notna(row.get('template_id')) else None
-
-            # Classify campaign
-            campaign_type_id, voucher_code = classify_campaign(content, template_id)
-
-            # Determine channel
-            channel = determine_channel(row.get('message_type'))
-
-            # Parse sent_at
-            sent_at = None
-            if pd.notna(row.get('sent_at')):
-                try:
-                    if isinstance(row['sent_at'], datetime):
-                        sent_at = row['sent_at'].isoformat()
-                    else:
-                        sent_at = pd.to_datetime(row['sent_at']).isoformat()
-                except:
-                    sent_at = datetime.now().isoformat()
-            else:
-                sent_at = datetime.now().isoformat()
-
-            # Get customer_id from phone cache
-            customer_id = customer_phone_cache.get(phone)
-
-            record = {
-                'message_id': str(row.get('message_id', '')) if pd.notna(row.get('message_id')) else None,
-                'message_type': str(row.get('message_type', '')) if pd.notna(row.get('message_type')) else None,
-                'brandname': str(row.get('brandname', '')) if pd.notna(row.get('brandname')) else None,
-                'channel': channel,
-                'phone': phone,
-                'customer_id': customer_id,
-                'content': content[:5000] if content else None,  # Limit content length
-                'template_id': template_id,
-                'campaign_type_id': campaign_type_id,
-                'voucher_code': voucher_code,
-                'sent_at': sent_at,
-                'network': str(row.get('network', '')) if pd.notna(row.get('network')) else None,
-                'total_mt': int(row.get('total_mt', 1)) if pd.notna(row.get('total_mt')) else 1,
-                'success_count': int(row.get('success_count', 0)) if pd.notna(row.get('success_count')) else 0,
-                'fail_count': int(row.get('fail_count', 0)) if pd.notna(row.get('fail_count')) else 0,
-                'unit_price': float(row.get('unit_price', 0)) if pd.notna(row.get('unit_price')) else 0,
-                'total_cost': float(row.get('total_cost', 0)) if pd.notna(row.get('total_cost')) else 0,
-                'report_month': report_month.isoformat() if report_month else None,
-                'source_file': source_file,
-            }
-
-            records.append(record)
+        # Stream the sheet in chunks; each chunk is processed and inserted before the next is read
+        rows = 0
+        prepared = 0
+        sent = 0
+        try:
+            for chunk_rows, records in iter_file_records(excel_file, report_month, use_cache):
+                rows += chunk_rows
+                prepared += len(records)
 
+                # Queue for insert; batches go out while the next chunk is parsed
+                sent += send_records(records, loader, str(excel_file), known)
         except Exception as e:
-            print(f"Error processing row: {e}")
+            print(f"  Error reading {excel_file}: {e}")
+            failed.add(str(excel_file))
+            total_records += loader.drain(str(excel_file))
+            continue
+
+        total_records += loader.drain(str(excel_file))
+
+        if rows == 0:
+            print(f"  No data found, skipping")
             continue
 
-    return records
+        print(f"  Found {rows} rows, prepared {prepared} valid records")
+        if known is not None:
+            known.finish_file(report_month.isoformat(), excel_file.name, sent)
+            print(f"  Skipped {prepared - sent} records already imported")
 
+    return total_records, failed
 
-def insert_records(records, batch_size=500):
-    """Insert records into database in batches"""
-    total = len(records)
-    inserted = 0
 
-    for i in range(0, total, batch_size):
-        batch = records[i:i + batch_size]
-        try:
-            result = supabase.table('sms_zns_messages').insert(batch).execute()
-            inserted += len(batch)
-            print(f"  Inserted {inserted}/{total} records")
-        except Exception as e:
-            print(f"  Error inserting batch: {e}")
-            # Try inserting one by one to identify problematic records
-            for record in batch:
-                try:
-                    supabase.table('sms_zns_messages').insert(record).execute()
-                    inserted += 1
-                except Exception as e2:
-                    print(f"    Failed to insert record: {e2}")
+def init_parse_worker(campaign_types):
+    """Seed a pool worker with the reference data loaded by the parent process.
+
+    Customer phones need no copy: workers map the same index files.
+    """
+    campaign_type_cache.update(campaign_types)
+
+
+def parse_file(excel_file, queue, use_cache=True):
+    """Pool task: parse and classify one file, handing record chunks to the insert stage"""
+    key = str(excel_file)
+    try:
+        report_month = parse_date_from_filename(excel_file.name)
+        if not report_month:
+            queue.put(('skipped', key, 'could not determine report month'))
+            return
+
+        rows = 0
+        prepared = 0
+        for chunk_rows, records in iter_file_records(excel_file, report_month, use_cache):
+            rows += chunk_rows
+            prepared += len(records)
+            if records:
+                # Blocks while the insert stage is behind, so parsed data never piles up
+                queue.put(('records', key, records))
+
+        queue.put(('done', key, (report_month, rows, prepared)))
+    except Exception as e:
+        queue.put(('failed', key, str(e)))
+
+
+def import_files_parallel(excel_files, workers, loader, use_cache=True, known=None):
+    """Parse files in a process pool while this process inserts their records.
+
+    Returns (records inserted, set of files that failed).
+    """
+    manager = multiprocessing.Manager()
+    queue = manager.Queue(maxsize=workers * 2)
+    sent_by_file = {str(f): 0 for f in excel_files}
+    finished = 0
+    total_records = 0
+    failed = {str(f) for f in excel_files}
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_parse_worker,
+        initargs=(dict(campaign_type_cache),),
+    ) as pool:
+        futures = [pool.submit(parse_file, excel_file, queue, use_cache) for excel_file in excel_files]
+
+        while finished < len(excel_files):
+            try:
+                kind, key, payload = queue.get(timeout=5)
+            except Empty:
+                # A worker that died outright never reports back
+                if all(future.done() for future in futures):
+                    print("  Parse workers exited before reporting every file")
+                    break
+                continue
+
+            name = Path(key).name
+            if kind == 'records':
+                sent_by_file[key] += send_records(payload, loader, key, known)
+                continue
+
+            # The file's last batches must land before its totals (and known counts) are read
+            inserted = loader.drain(key)
+            total_records += inserted
+            finished += 1
+            progress = f"[{finished}/{len(excel_files)}]"
+            if kind != 'failed':
+                failed.discard(key)
+            if kind == 'done':
+                report_month, rows, prepared = payload
+                if rows == 0:
+                    print(f"{progress} {name}: no data found, skipped")
+                else:
+                    print(f"{progress} {name} ({report_month}): {rows} rows, "
+                          f"{prepared} valid records, {inserted} inserted")
+                    if known is not None:
+                        known.finish_file(report_month.isoformat(), name, sent_by_file[key])
+            elif kind == 'skipped':
+                print(f"{progress} {name}: {payload}, skipped")
+            else:
+                print(f"{progress} {name}: failed - {payload}")
 
-    return inserted
+    manager.shutdown()
+    return total_records, failed
 
 
 def calculate_monthly_stats():
@@ -427,6 +416,23 @@ def calculate_monthly_stats():
 
 def main():
     """Main import function"""
+    parser = argparse.ArgumentParser(description='Import eSMS SMS/ZNS reports into Supabase')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='parse files in a pool of N processes (default: 1, sequential)')
+    parser.add_argument('--loader', choices=['rest', 'copy'], default='rest',
+                        help='rest: batched inserts through Supabase (default); '
+                             'copy: COPY straight into Postgres via DATABASE_URL (see copy_loader.py)')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='insert batches kept in flight at once with the rest loader (default: 4)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='re-parse every workbook instead of reusing the parse cache')
+    parser.add_argument('--idempotent', action='store_true',
+                        help='skip messages already imported and upsert on message_id '
+                             '(needs scripts/sql/001_sms_zns_messages_message_id_unique.sql)')
+    parser.add_argument('--reprocess-archives', action='store_true',
+                        help='read ZIP archives even if they were imported before')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("SMS/ZNS Data Import Script")
     print("=" * 60)
@@ -436,57 +442,56 @@ def main():
     load_campaign_types()
     load_customer_phones()
 
-    # Step 2: Extract ZIP files
-    print("\n[2/5] Extracting ZIP files...")
-    extract_zip_files()
+    # Step 2: Open ZIP archives in place
+    print("\n[2/5] Reading ZIP archives...")
+    archives = find_archive_reports(args.reprocess_archives)
 
     # Step 3: Find all Excel files
     print("\n[3/5] Finding Excel files...")
     excel_files = list(DATA_DIR.glob('*.xlsx'))
 
-    # Also check extracted directories (including nested Report folders)
-    if EXTRACT_DIR.exists():
-        # Recursively find all xlsx files
-        excel_files.extend(EXTRACT_DIR.glob('**/*.xlsx'))
+    # Plus the detail reports inside each archive (including nested Report folders)
+    for checksum, members in archives.values():
+        excel_files.extend(members)
 
     # Filter to only include detail files (not summary files)
-    excel_files = [f for f in excel_files if 'summary' not in f.name.lower() and 'sumary' not in f.name.lower()]
+    excel_files = [f for f in excel_files if is_detail_report(f.name)]
 
     print(f"Found {len(excel_files)} Excel files to process")
 
-    # Step 4: Process each file
-    print("\n[4/5] Processing files...")
-    total_records = 0
+    # Rerun-safe mode: skip messages already in the table, upsert the rest
+    known = KnownMessages(supabase) if args.idempotent else None
 
-    for excel_file in excel_files:
-        print(f"\nProcessing: {excel_file.name}")
+    if args.loader == 'copy':
+        # Straight to Postgres: COPY into a staging table, one merge per file
+        loader = CopyLoader(upsert=args.idempotent,
+                            reject=lambda records, error: reject_records(records, error, known))
+    else:
+        # Keep several insert batches in flight; round trips, not the database, bound throughput
+        loader = InsertPipeline(
+            lambda batch: insert_batch(batch, upsert=args.idempotent, known=known),
+            concurrency=args.concurrency,
+        )
 
-        # Parse report month from filename
-        report_month = parse_date_from_filename(excel_file.name)
-        if not report_month:
-            print(f"  Could not determine report month, skipping")
-            continue
-
-        print(f"  Report month: {report_month}")
-
-        # Read Excel file
-        df = read_excel_file(excel_file)
-        if df is None or df.empty:
-            print(f"  No data found, skipping")
-            continue
-
-        print(f"  Found {len(df)} rows")
-
-        # Process data
-        records = process_dataframe(df, excel_file.name, report_month)
-        print(f"  Prepared {len(records)} valid records")
-
-        # Insert records
-        if records:
-            inserted = insert_records(records)
-            total_records += inserted
+    # Step 4: Process each file
+    with loader:
+        if args.workers > 1:
+            print(f"\n[4/5] Processing files with {args.workers} parse workers...")
+            total_records, failed = import_files_parallel(
+                excel_files, args.workers, loader, not args.no_cache, known
+            )
+        else:
+            print("\n[4/5] Processing files...")
+            total_records, failed = import_files(excel_files, loader, not args.no_cache, known)
+
+    mark_archives_processed(archives, failed)
 
     print(f"\n[5/5] Total records inserted: {total_records}")
+    if campaign_cache.hits or campaign_cache.misses:
+        print(campaign_cache.summary())
+    if dead_letters.added:
+        print(f"{dead_letters.added} rejected records saved to {dead_letters.path}")
+        print("  Fix and retry them with: python scripts/dead_letters.py replay")
 
     # Step 5: Calculate monthly stats
     calculate_monthly_stats()
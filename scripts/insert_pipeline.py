@@ -0,0 +1,120 @@
+"""
+Pipelined batch inserts for the import scripts.
+
+Insert throughput over PostgREST is bound by round-trip latency, not by the
+database, so sending 500-row batches one at a time leaves the link idle most
+of the time. InsertPipeline keeps up to `concurrency` batches in flight on an
+asyncio loop running in a background thread. The blocking insert call runs via
+asyncio.to_thread, so any sync writer (the supabase client, a COPY loader) can
+be plugged in.
+
+submit() blocks once `max_pending` batches are queued, which holds the parser
+back instead of letting parsed records pile up in memory. Progress is printed
+in submission order even though batches finish out of order.
+"""
+
+import asyncio
+import threading
+from collections import Counter
+
+
+class InsertPipeline:
+    def __init__(self, insert_batch, concurrency=4, batch_size=500, max_pending=None):
+        """insert_batch(records) sends one batch and returns how many rows landed"""
+        self.insert_batch = insert_batch
+        self.concurrency = max(1, concurrency)
+        self.batch_size = batch_size
+
+        self.cond = threading.Condition()
+        self.submitted_batches = 0
+        self.submitted_rows = 0
+        self.pending = Counter()
+        self.inserted = Counter()
+
+        # Ordered progress: batch results wait here until every earlier batch finished
+        self.finished = {}
+        self.next_report = 0
+        self.reported_rows = 0
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.run(self.start(max_pending or self.concurrency * 2))
+
+    def run(self, coro):
+        """Run a coroutine on the pipeline loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def start(self, max_pending):
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def worker(self):
+        while True:
+            seq, tag, batch = await self.queue.get()
+            try:
+                inserted = await asyncio.to_thread(self.insert_batch, batch)
+            except Exception as e:
+                print(f"  Error inserting batch: {e}")
+                inserted = 0
+            finally:
+                self.queue.task_done()
+            self.finish(seq, tag, inserted)
+
+    def finish(self, seq, tag, inserted):
+        with self.cond:
+            self.pending[tag] -= 1
+            self.inserted[tag] += inserted
+            self.finished[seq] = inserted
+            while self.next_report in self.finished:
+                self.reported_rows += self.finished.pop(self.next_report)
+                self.next_report += 1
+                print(f"  Inserted {self.reported_rows}/{self.submitted_rows} records")
+            self.cond.notify_all()
+
+    def submit(self, records, tag=None):
+        """Queue records for insert in batches; blocks while the pipeline is full"""
+        for i in range(0, len(records), self.batch_size):
+            batch = records[i:i + self.batch_size]
+            with self.cond:
+                seq = self.submitted_batches
+                self.submitted_batches += 1
+                self.submitted_rows += len(batch)
+                self.pending[tag] += 1
+            self.run(self.queue.put((seq, tag, batch)))
+
+    def drain(self, tag=None):
+        """Wait for queued batches (only those submitted under `tag` if given).
+
+        Returns the rows inserted for that tag, or for every tag, since the last drain.
+        """
+        with self.cond:
+            if tag is None:
+                self.cond.wait_for(lambda: not any(self.pending.values()))
+                inserted = sum(self.inserted.values())
+                self.inserted.clear()
+            else:
+                self.cond.wait_for(lambda: self.pending[tag] == 0)
+                inserted = self.inserted.pop(tag, 0)
+            self.pending.pop(tag, None)
+            return inserted
+
+    def close(self):
+        """Finish outstanding batches and stop the loop thread"""
+        inserted = self.drain()
+        self.run(self.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        return inserted
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
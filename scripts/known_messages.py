@@ -0,0 +1,155 @@
+"""
+Local record of which eSMS messages are already in sms_zns_messages.
+
+Lets the importers drop already-loaded rows before sending anything. Keys are
+message_id; rows without one are covered by their source_file instead, but
+only once finish_file() has recorded that file as fully imported. The finished
+files are never inferred from rows in the table: an interrupted import leaves
+some of a file's rows behind, and taking the file as done would drop the rest
+on the rerun. (Its id-less rows are sent again instead, so the rows that did
+land before the interruption can end up in the table twice.)
+
+The ids are kept per report_month under .cache/known-messages and are only
+re-read from the table when that month's row count no longer matches what we
+recorded, so a rerun costs one count query per month. Finished files are kept
+next to them and survive that refresh.
+"""
+
+import json
+import re
+import threading
+from pathlib import Path
+
+STATE_DIR = Path(__file__).parent.parent / '.cache' / 'known-messages'
+
+PAGE_SIZE = 1000
+
+
+def message_key(message_id):
+    """Dedup key for a message_id; older imports stored numeric ids as '123.0'"""
+    if re.fullmatch(r'\d+\.0', message_id):
+        return message_id[:-2]
+    return message_id
+
+
+class KnownMessages:
+    def __init__(self, client, table='sms_zns_messages', state_dir=STATE_DIR):
+        self.client = client
+        self.table = table
+        self.state_dir = Path(state_dir)
+        self.months = {}
+        # filter_new runs on the reading thread, forget on insert threads
+        self.lock = threading.RLock()
+
+    def state_path(self, month):
+        return self.state_dir / f"{month}.json"
+
+    def finished_path(self, month):
+        return self.state_dir / f"{month}.finished.json"
+
+    def load_finished(self, month):
+        """Source files finish_file() recorded for a month"""
+        path = self.finished_path(month)
+        if not path.exists():
+            return set()
+        return set(json.loads(path.read_text(encoding='utf-8')))
+
+    def table_count(self, month):
+        result = self.client.table(self.table).select('id', count='exact', head=True)\
+            .eq('report_month', month).execute()
+        return result.count or 0
+
+    def fetch_month(self, month):
+        """Read a month's message ids, paging by id"""
+        ids = set()
+        last_id = None
+        while True:
+            query = self.client.table(self.table).select('id, message_id')\
+                .eq('report_month', month).order('id').limit(PAGE_SIZE)
+            if last_id is not None:
+                query = query.gt('id', last_id)
+            result = query.execute()
+            if not result.data:
+                break
+            for row in result.data:
+                if row.get('message_id'):
+                    ids.add(message_key(row['message_id']))
+            last_id = result.data[-1]['id']
+            if len(result.data) < PAGE_SIZE:
+                break
+        return ids
+
+    def load(self, month):
+        """Known keys for a report month, refreshed from the table if it changed"""
+        if month in self.months:
+            return self.months[month]
+
+        count = self.table_count(month)
+        path = self.state_path(month)
+        state = None
+        if path.exists():
+            state = json.loads(path.read_text(encoding='utf-8'))
+            if state['count'] != count:
+                state = None
+
+        if state is None:
+            print(f"  Refreshing known message ids for {month} ({count:,} rows in table)...")
+            state = {'count': count, 'ids': self.fetch_month(month)}
+            self.save(month, state)
+        else:
+            state = {'count': count, 'ids': set(state['ids'])}
+        state['source_files'] = self.load_finished(month)
+
+        self.months[month] = state
+        return state
+
+    def save(self, month, state):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.state_path(month).write_text(json.dumps({
+            'count': state['count'],
+            'ids': sorted(state['ids']),
+        }), encoding='utf-8')
+
+    def save_finished(self, month, source_files):
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.finished_path(month).write_text(json.dumps(sorted(source_files)), encoding='utf-8')
+
+    def filter_new(self, records):
+        """Drop records already in the table (or sent earlier in this run)"""
+        fresh = []
+        with self.lock:
+            for record in records:
+                state = self.load(record['report_month'])
+                message_id = record.get('message_id')
+                if message_id:
+                    key = message_key(message_id)
+                    if key in state['ids']:
+                        continue
+                    state['ids'].add(key)
+                elif record['source_file'] in state['source_files']:
+                    continue
+                fresh.append(record)
+        return fresh
+
+    def forget(self, records):
+        """Undo filter_new for records the database rejected, so a later copy of them is sent"""
+        with self.lock:
+            for record in records:
+                state = self.months.get(record.get('report_month'))
+                if state is not None and record.get('message_id'):
+                    state['ids'].discard(message_key(record['message_id']))
+
+    def finish_file(self, month, source_file, sent):
+        """Record a file as loaded; keep the local set only if the table agrees with it"""
+        with self.lock:
+            state = self.load(month)
+            state['source_files'].add(source_file)
+            self.save_finished(month, state['source_files'])
+            expected = state['count'] + sent
+            state['count'] = self.table_count(month)
+            if state['count'] == expected:
+                self.save(month, state)
+            else:
+                # Some rows did not land; re-read this month from the table next time
+                self.state_path(month).unlink(missing_ok=True)
+                del self.months[month]
@@ -1,14 +1,25 @@
 """
 Link SMS/ZNS messages to customers via phone number.
 This enables revenue attribution for all months.
+
+Scans every unlinked message of every month in the table, several months at
+a time. For routine runs, link_new_customers.py links only the customers
+added since the last run.
+
+Usage:
+    python scripts/link_customers.py [--workers N]
 """
 
+import argparse
 import os
-import time
 from supabase import create_client
 from dotenv import load_dotenv
 from pathlib import Path
 
+from customer_phone_index import load_customer_phone_index
+from partitions import discover_months, run_partitions
+from rate_limiter import RateLimiter
+
 load_dotenv(Path(__file__).parent.parent / '.env.local')
 
 SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
@@ -16,70 +27,50 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_
 
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Paces every request; speeds up while the backend keeps up, backs off on 429/5xx
+limiter = RateLimiter(name='link')
+
 
 def get_customer_phone_map():
-    """Build a map of phone -> customer_id."""
+    """The local phone -> customer_id index, refreshed from customers."""
     print("Loading customer phone map...")
-    phone_map = {}
-    offset = 0
-    batch_size = 1000
-
-    while True:
-        result = supabase.table('customers')\
-            .select('id, phone')\
-            .not_.is_('phone', 'null')\
-            .range(offset, offset + batch_size - 1)\
-            .execute()
-
-        if not result.data:
-            break
-
-        for row in result.data:
-            if row['phone']:
-                phone_map[row['phone']] = row['id']
-
-        offset += batch_size
-        if len(result.data) < batch_size:
-            break
-
-    print(f"  Loaded {len(phone_map):,} customer phones")
-    return phone_map
+    return load_customer_phone_index(supabase)
 
 
 def link_messages_for_month(month, phone_map):
     """Link messages to customers for a specific month."""
     print(f"\nProcessing {month}...")
 
-    # Get unlinked messages for this month
+    # Get unlinked messages for this month, paging by id so phones without a
+    # customer are not fetched again on every batch
     batch_size = 300
     total_updated = 0
     batch_num = 0
+    last_id = None
 
     while True:
         batch_num += 1
-        time.sleep(1)  # Rate limiting
-
-        try:
-            result = supabase.table('sms_zns_messages')\
-                .select('id, phone')\
-                .eq('report_month', month)\
-                .is_('customer_id', 'null')\
-                .limit(batch_size)\
-                .execute()
-        except Exception as e:
-            print(f"  Error fetching: {e}")
-            time.sleep(3)
-            continue
+
+        query = supabase.table('sms_zns_messages')\
+            .select('id, phone')\
+            .eq('report_month', month)\
+            .is_('customer_id', 'null')\
+            .order('id')\
+            .limit(batch_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        # A failed fetch fails the month, which run_partitions retries
+        result = limiter.call(query.execute)
 
         if not result.data:
             break
+        last_id = result.data[-1]['id']
 
         # Group by customer_id for batch updates
         updates_by_customer = {}
-        for row in result.data:
-            phone = row['phone']
-            if phone and phone in phone_map:
-                cust_id = phone_map[phone]
+        customer_ids = phone_map.lookup([row['phone'] for row in result.data])
+        for row, cust_id in zip(result.data, customer_ids):
+            if cust_id:
                 if cust_id not in updates_by_customer:
                     updates_by_customer[cust_id] = []
                 updates_by_customer[cust_id].append(row['id'])
@@ -90,21 +81,27 @@ def link_messages_for_month(month, phone_map):
             for i in range(0, len(ids), chunk_size):
                 chunk = ids[i:i + chunk_size]
                 try:
-                    supabase.table('sms_zns_messages')\
-                        .update({'customer_id': cust_id})\
-                        .in_('id', chunk)\
-                        .execute()
+                    limiter.call(supabase.table('sms_zns_messages')
+                                 .update({'customer_id': cust_id})
+                                 .in_('id', chunk)
+                                 .execute)
                     total_updated += len(chunk)
                 except Exception as e:
                     print(f"  Error updating batch: {e}")
-                time.sleep(0.3)
 
-        print(f"  Batch {batch_num}: +{len(result.data)}, linked: {total_updated:,}")
+        print(f"  {month} batch {batch_num}: +{len(result.data)}, linked: {total_updated:,}")
+
+        if len(result.data) < batch_size:
+            break
 
     return total_updated
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Link unlinked messages to customers, month by month')
+    parser.add_argument('--workers', type=int, help='months linked at the same time')
+    args = parser.parse_args()
+
     print("=" * 60)
     print("Linking SMS/ZNS Messages to Customers")
     print("=" * 60)
@@ -112,21 +109,19 @@ def main():
     # Build phone map
     phone_map = get_customer_phone_map()
 
-    # Process each month
-    months = [
-        '2025-05-01', '2025-06-01', '2025-07-01', '2025-08-01',
-        '2025-09-01', '2025-10-01', '2025-11-01', '2025-12-01',
-        '2026-01-01'
-    ]
+    months = discover_months(supabase)
+    print(f"Found {len(months)} months to process")
 
-    total_linked = 0
-    for month in months:
-        linked = link_messages_for_month(month, phone_map)
-        total_linked += linked
-        print(f"  {month}: {linked:,} messages linked")
+    linked, failed = run_partitions(months, lambda month: link_messages_for_month(month, phone_map),
+                                    workers=args.workers)
 
     print(f"\n{'=' * 60}")
-    print(f"Total linked: {total_linked:,}")
+    for month in sorted(linked):
+        print(f"  {month}: {linked[month]:,} messages linked")
+    print(f"Total linked: {sum(linked.values()):,}")
+    if failed:
+        print(f"Failed months (run again to retry): {', '.join(sorted(failed))}")
+    print(limiter.summary())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""
+Link SMS/ZNS messages to customers that are new or changed since the last run.
+
+link_customers.py and friends work from the message side: they re-read every
+unlinked message of a hard-coded month list, and most of those never match
+anyone. This job works from the customer side instead. It reads the
+customers whose updated_at (scripts/sql/005) is past the watermark saved by
+the previous run. It then resolves their phones through the local phone index
+(customer_phone_index.py) and sends them to link_messages_by_phone
+(scripts/sql/006). That function updates only the unlinked messages carrying
+those phones, found through a partial index on unlinked rows.
+
+A daily run touches the day's new customers, not the message history. The
+first run (or --restart) goes through every customer once.
+
+Usage:
+    python scripts/link_new_customers.py [--restart]
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+from customer_phone_index import load_customer_phone_index
+from phone_numbers import normalize_phones
+from rate_limiter import RateLimiter
+
+load_dotenv(Path(__file__).parent.parent / '.env.local')
+
+SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+
+supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Paces every request; speeds up while the backend keeps up, backs off on 429/5xx
+limiter = RateLimiter(name='link')
+
+# Watermark of the last customer linked, and when that run started
+STATE_FILE = Path(__file__).parent.parent / '.cache' / 'link-new-customers.json'
+
+# Phones per link_messages_by_phone call
+LINK_BATCH = 1000
+
+
+def load_state():
+    if STATE_FILE.exists():
+        return json.loads(STATE_FILE.read_text(encoding='utf-8'))
+    return None
+
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = STATE_FILE.with_name(f"{STATE_FILE.name}.tmp")
+    tmp_path.write_text(json.dumps(state, indent=2), encoding='utf-8')
+    os.replace(tmp_path, STATE_FILE)
+
+
+def phone_links(index, rows):
+    """[{phone, customer_id}] for a page of customers, one customer per phone"""
+    phones = [phone for phone in normalize_phones([row['phone'] for row in rows]) if phone]
+    phones = sorted(set(phones))
+    # The index decides which customer owns a shared phone, as at import
+    owners = index.lookup(phones)
+    return [{'phone': phone, 'customer_id': owner} for phone, owner in zip(phones, owners) if owner]
+
+
+def link_phones(links):
+    linked = 0
+    for i in range(0, len(links), LINK_BATCH):
+        result = limiter.call(supabase.rpc('link_messages_by_phone', {'links': links[i:i + LINK_BATCH]}).execute)
+        linked += result.data or 0
+    return linked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Link messages to customers created or changed since the last run')
+    parser.add_argument('--restart', action='store_true',
+                        help='forget the watermark and go through every customer')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Linking Messages to New Customers")
+    print("=" * 60)
+
+    started = datetime.now(timezone.utc).isoformat()
+    index = load_customer_phone_index(supabase)
+
+    state = None if args.restart else load_state()
+    if state:
+        print(f"Customers changed since {state['watermark']['updated_at']}")
+        pages = index.fetch_changes(state['watermark'], state['refreshed_at'])
+    else:
+        print("No watermark yet; going through every customer")
+        pages = index.fetch()
+
+    customers = 0
+    phones = 0
+    linked = 0
+    for rows in pages:
+        links = phone_links(index, rows)
+        linked += link_phones(links)
+        customers += len(rows)
+        phones += len(links)
+        # Saved per page, so an interrupted run resumes after the last page it linked
+        save_state({'watermark': {'updated_at': rows[-1]['updated_at'], 'id': rows[-1]['id']},
+                    'refreshed_at': started})
+        print(f"  {customers:,} customers, {phones:,} phones, {linked:,} messages linked")
+
+    if state and not customers:
+        save_state({**state, 'refreshed_at': started})
+
+    print(f"\nTotal linked: {linked:,} messages ({customers:,} customers checked)")
+    print(limiter.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,15 @@
 Link SMS/ZNS messages to customers via phone number matching
 """
 
+import argparse
 import os
 from supabase import create_client
 from dotenv import load_dotenv
 from pathlib import Path
 
+from customer_phone_index import load_customer_phone_index
+from partitions import discover_months, run_partitions
+
 load_dotenv(Path(__file__).parent.parent / '.env.local')
 
 SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
@@ -15,85 +19,71 @@ SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def build_phone_mapping():
-    """Build phone -> customer_id mapping"""
+    """The local phone -> customer_id index, refreshed from customers"""
     print("Building phone to customer mapping...")
+    return load_customer_phone_index(supabase)
 
-    phone_to_customer = {}
-    offset = 0
-    batch_size = 1000
+def update_month(month, phone_to_customer):
+    """Update customer_id in one month's SMS messages"""
+    # Page by id: linked rows leave the filter, so offsets would skip rows
+    batch_size = 500
+    month_updated = 0
+    processed = 0
+    last_id = None
 
     while True:
-        result = supabase.table('customers').select('id, phone').not_.is_('phone', 'null').range(offset, offset + batch_size - 1).execute()
+        query = supabase.table('sms_zns_messages').select('id, phone').eq('report_month', month).is_('customer_id', 'null').order('id').limit(batch_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        result = query.execute()
 
         if not result.data:
             break
+        last_id = result.data[-1]['id']
+
+        updates = []
+        customer_ids = phone_to_customer.lookup([row['phone'] for row in result.data])
+        for row, customer_id in zip(result.data, customer_ids):
+            if customer_id:
+                updates.append({'id': row['id'], 'customer_id': customer_id})
 
-        for row in result.data:
-            if row['phone']:
-                phone_to_customer[row['phone']] = row['id']
+        # Batch update
+        for upd in updates:
+            try:
+                supabase.table('sms_zns_messages').update({'customer_id': upd['customer_id']}).eq('id', upd['id']).execute()
+                month_updated += 1
+            except Exception as e:
+                pass
 
-        offset += batch_size
-        print(f"  Loaded {len(phone_to_customer)} customers...")
+        processed += len(result.data)
+        print(f"  {month}: processed {processed} messages, updated {month_updated}...")
 
         if len(result.data) < batch_size:
             break
 
-    print(f"Total customers with phones: {len(phone_to_customer)}")
-    return phone_to_customer
+    print(f"  {month}: Updated {month_updated} messages")
+    return month_updated
 
-def update_sms_customer_ids(phone_to_customer):
-    """Update customer_id in SMS messages"""
+def update_sms_customer_ids(phone_to_customer, workers=None):
+    """Update customer_id in SMS messages, several months at a time"""
     print("\nUpdating SMS messages with customer IDs...")
 
-    months = [
-        '2025-02-01', '2025-03-01', '2025-04-01', '2025-05-01', '2025-06-01',
-        '2025-07-01', '2025-08-01', '2025-09-01', '2025-10-01', '2025-11-01',
-        '2025-12-01', '2026-01-01'
-    ]
-
-    total_updated = 0
-
-    for month in months:
-        print(f"\nProcessing {month}...")
-
-        # Get messages without customer_id for this month
-        offset = 0
-        batch_size = 500
-        month_updated = 0
-
-        while True:
-            result = supabase.table('sms_zns_messages').select('id, phone').eq('report_month', month).is_('customer_id', 'null').range(offset, offset + batch_size - 1).execute()
+    months = discover_months(supabase)
+    print(f"Found {len(months)} months to process")
 
-            if not result.data:
-                break
-
-            updates = []
-            for row in result.data:
-                customer_id = phone_to_customer.get(row['phone'])
-                if customer_id:
-                    updates.append({'id': row['id'], 'customer_id': customer_id})
-
-            # Batch update
-            for upd in updates:
-                try:
-                    supabase.table('sms_zns_messages').update({'customer_id': upd['customer_id']}).eq('id', upd['id']).execute()
-                    month_updated += 1
-                except Exception as e:
-                    pass
-
-            offset += batch_size
-            print(f"  Processed {offset} messages, updated {month_updated}...", end='\r')
-
-            if len(result.data) < batch_size:
-                break
-
-        print(f"  {month}: Updated {month_updated} messages")
-        total_updated += month_updated
+    updated, failed = run_partitions(months, lambda month: update_month(month, phone_to_customer), workers=workers)
+    total_updated = sum(updated.values())
 
     print(f"\nTotal updated: {total_updated}")
+    if failed:
+        print(f"Failed months (run again to retry): {', '.join(sorted(failed))}")
     return total_updated
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Link SMS/ZNS messages to customers by phone')
+    parser.add_argument('--workers', type=int, help='months linked at the same time')
+    args = parser.parse_args()
+
     phone_map = build_phone_mapping()
-    update_sms_customer_ids(phone_map)
+    update_sms_customer_ids(phone_map, workers=args.workers)
     print("\nDone!")
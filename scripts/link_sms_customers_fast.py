@@ -2,11 +2,15 @@
 Fast bulk link SMS/ZNS messages to customers via SQL
 """
 
+import argparse
 import os
 from supabase import create_client
 from dotenv import load_dotenv
 from pathlib import Path
 
+from customer_phone_index import load_customer_phone_index
+from partitions import discover_months, run_partitions
+
 load_dotenv(Path(__file__).parent.parent / '.env.local')
 
 SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
@@ -37,78 +41,71 @@ def link_by_month(month):
         print(f"  {month}: Error - {e}")
         return False
 
-def link_via_temp_table():
-    """Alternative: Create a mapping and update in bulk"""
-    print("Building phone mapping...")
-
-    # Get all customer phones
-    phones = {}
-    offset = 0
-    batch_size = 5000
+def link_month_via_upsert(month, phones):
+    """Link one month's unlinked messages with batched upserts"""
+    # Page by id: linked rows leave the filter, so offsets would skip rows
+    batch_size = 1000
+    month_updated = 0
+    processed = 0
+    last_id = None
 
     while True:
-        result = supabase.table('customers').select('id, phone').not_.is_('phone', 'null').range(offset, offset + batch_size - 1).execute()
+        query = supabase.table('sms_zns_messages').select('id, phone').eq('report_month', month).is_('customer_id', 'null').order('id').limit(batch_size)
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        result = query.execute()
+
         if not result.data:
             break
-        for r in result.data:
-            phones[r['phone']] = r['id']
-        offset += batch_size
+        last_id = result.data[-1]['id']
+
+        # Build batch updates
+        updates = []
+        customer_ids = phones.lookup([row['phone'] for row in result.data])
+        for row, customer_id in zip(result.data, customer_ids):
+            if customer_id:
+                updates.append({'id': row['id'], 'customer_id': customer_id})
+
+        # Batch upsert
+        if updates:
+            try:
+                supabase.table('sms_zns_messages').upsert(updates, on_conflict='id').execute()
+                month_updated += len(updates)
+            except Exception as e:
+                print(f"  {month}: Error: {e}")
+
+        processed += len(result.data)
+        print(f"  {month}: processed {processed}, updated {month_updated}...")
+
         if len(result.data) < batch_size:
             break
 
-    print(f"Loaded {len(phones)} customer phones")
-
-    # Process SMS messages in chunks
-    months = [
-        '2025-02-01', '2025-03-01', '2025-04-01', '2025-05-01', '2025-06-01',
-        '2025-07-01', '2025-08-01', '2025-09-01', '2025-10-01', '2025-11-01',
-        '2025-12-01', '2026-01-01'
-    ]
-
-    total_updated = 0
+    print(f"  {month}: Updated {month_updated} messages")
+    return month_updated
 
-    for month in months:
-        print(f"\nProcessing {month}...")
-
-        # Get messages needing update
-        offset = 0
-        batch_size = 1000
-        month_updated = 0
-
-        while True:
-            result = supabase.table('sms_zns_messages').select('id, phone').eq('report_month', month).is_('customer_id', 'null').range(offset, offset + batch_size - 1).execute()
-
-            if not result.data:
-                break
-
-            # Build batch updates
-            updates = []
-            for row in result.data:
-                customer_id = phones.get(row['phone'])
-                if customer_id:
-                    updates.append({'id': row['id'], 'customer_id': customer_id})
-
-            # Batch upsert
-            if updates:
-                try:
-                    supabase.table('sms_zns_messages').upsert(updates, on_conflict='id').execute()
-                    month_updated += len(updates)
-                except Exception as e:
-                    print(f"  Error: {e}")
+def link_via_temp_table(workers=None):
+    """Alternative: Create a mapping and update in bulk"""
+    print("Building phone mapping...")
 
-            offset += batch_size
-            print(f"  Processed {offset}, updated {month_updated}...", end='\r')
+    # Local index of customer phones; only customers changed since the last run are read
+    phones = load_customer_phone_index(supabase)
 
-            if len(result.data) < batch_size:
-                break
+    months = discover_months(supabase)
+    print(f"Found {len(months)} months to process")
 
-        print(f"  {month}: Updated {month_updated} messages")
-        total_updated += month_updated
+    # Months run side by side; one that keeps failing is reported, not fatal
+    updated, failed = run_partitions(months, lambda month: link_month_via_upsert(month, phones), workers=workers)
+    if failed:
+        print(f"Failed months (run again to retry): {', '.join(sorted(failed))}")
 
-    return total_updated
+    return sum(updated.values())
 
 if __name__ == "__main__":
-    total = link_via_temp_table()
+    parser = argparse.ArgumentParser(description='Bulk link SMS/ZNS messages to customers by phone')
+    parser.add_argument('--workers', type=int, help='months linked at the same time')
+    args = parser.parse_args()
+
+    total = link_via_temp_table(workers=args.workers)
     print(f"\nTotal updated: {total}")
 
     # Check final count
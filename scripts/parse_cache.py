@@ -0,0 +1,228 @@
+"""
+Content-addressed cache of parsed eSMS reports.
+
+Entries are keyed by the SHA-256 of the source workbook plus a fingerprint of
+everything else that shapes the records (parser version, campaign patterns,
+campaign type ids). Each entry stores the classified records as Parquet, one
+row group per parsed chunk, so an unchanged month reloads without touching
+Excel. customer_id is not cached; importers fill it from the current phone map.
+
+Needs pyarrow (pip install pyarrow); without it the importers parse as usual.
+
+Usage:
+    python scripts/parse_cache.py list
+    python scripts/parse_cache.py invalidate <workbook-or-key> [...]
+    python scripts/parse_cache.py prune [--max-mb N]
+    python scripts/parse_cache.py clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CACHE_DIR = Path(os.getenv('ESMS_PARSE_CACHE_DIR') or Path(__file__).parent.parent / '.cache' / 'esms-parse')
+MAX_BYTES = int(os.getenv('ESMS_PARSE_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+STRING_COLUMNS = [
+    'message_id', 'message_type', 'brandname', 'channel', 'phone', 'content',
+    'template_id', 'campaign_type_id', 'voucher_code', 'sent_at', 'network',
+]
+INT_COLUMNS = ['total_mt', 'success_count', 'fail_count']
+FLOAT_COLUMNS = ['unit_price', 'total_cost']
+META_COLUMNS = ['report_month', 'source_file']
+
+
+def schema():
+    """Arrow schema of a cached record (everything but customer_id)"""
+    fields = [(name, pa.string()) for name in STRING_COLUMNS]
+    fields += [(name, pa.int64()) for name in INT_COLUMNS]
+    fields += [(name, pa.float64()) for name in FLOAT_COLUMNS]
+    fields += [(name, pa.string()) for name in META_COLUMNS]
+    return pa.schema(fields)
+
+
+def enabled():
+    """True when pyarrow is available"""
+    return pq is not None
+
+
+def file_digest(path):
+    """SHA-256 of a file's content (a path or an esms_reader.ArchiveMember)"""
+    digest = hashlib.sha256()
+    source = Path(path) if isinstance(path, str) else path
+    with source.open('rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(context):
+    """Short hash of the parse settings an entry was built with"""
+    encoded = json.dumps(context, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def entry_key(path, context):
+    """Cache key for a workbook parsed under the given settings"""
+    return f"{file_digest(path)}-{fingerprint(context)}"
+
+
+def entry_paths(key):
+    return CACHE_DIR / f"{key}.parquet", CACHE_DIR / f"{key}.json"
+
+
+def load(key):
+    """Return (meta, chunks) for a cached entry, or None on a miss.
+
+    chunks yields (rows, records) in the order the file was parsed.
+    """
+    data_path, meta_path = entry_paths(key)
+    if not data_path.exists() or not meta_path.exists():
+        return None
+
+    meta = json.loads(meta_path.read_text(encoding='utf-8'))
+    # Touch on use so eviction drops the least recently used entries first
+    os.utime(data_path)
+
+    def chunks():
+        parquet = pq.ParquetFile(data_path)
+        for i, rows in enumerate(meta['group_rows']):
+            yield rows, parquet.read_row_group(i).to_pylist()
+        if meta['unmatched_rows']:
+            yield meta['unmatched_rows'], []
+
+    return meta, chunks()
+
+
+class CacheWriter:
+    """Writes one entry chunk by chunk; nothing is visible until commit()"""
+
+    def __init__(self, key, source_file, report_month):
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        self.key = key
+        self.data_path, self.meta_path = entry_paths(key)
+        self.tmp_path = self.data_path.with_name(f"{self.data_path.name}.{os.getpid()}.tmp")
+        self.writer = pq.ParquetWriter(self.tmp_path, schema())
+        self.meta = {
+            'key': key,
+            'source_file': source_file,
+            'report_month': report_month.isoformat() if report_month else None,
+            'rows': 0,
+            'records': 0,
+            'group_rows': [],
+            'unmatched_rows': 0,
+        }
+
+    def write(self, rows, records):
+        """Add one parsed chunk (its sheet row count and resulting records)"""
+        self.meta['rows'] += rows
+        if not records:
+            self.meta['unmatched_rows'] += rows
+            return
+        self.writer.write_table(pa.Table.from_pylist(records, schema=schema()))
+        self.meta['group_rows'].append(rows)
+        self.meta['records'] += len(records)
+
+    def commit(self):
+        """Publish the entry and trim the cache back under its size limit"""
+        self.writer.close()
+        self.meta['created_at'] = datetime.now().isoformat(timespec='seconds')
+        os.replace(self.tmp_path, self.data_path)
+        self.meta_path.write_text(json.dumps(self.meta, indent=2), encoding='utf-8')
+        prune()
+
+    def discard(self):
+        self.writer.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+def entries():
+    """Cached entries with their metadata, most recently used first"""
+    found = []
+    for meta_path in CACHE_DIR.glob('*.json'):
+        data_path = meta_path.with_suffix('.parquet')
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            stat = data_path.stat()
+        except (OSError, ValueError):
+            continue
+        meta['size'] = stat.st_size
+        meta['last_used'] = stat.st_mtime
+        found.append(meta)
+    return sorted(found, key=lambda meta: meta['last_used'], reverse=True)
+
+
+def remove(key):
+    for path in entry_paths(key):
+        path.unlink(missing_ok=True)
+
+
+def prune(max_bytes=MAX_BYTES):
+    """Evict least recently used entries until the cache fits in max_bytes"""
+    kept = 0
+    removed = 0
+    for meta in entries():
+        kept += meta['size']
+        if kept > max_bytes:
+            remove(meta['key'])
+            removed += 1
+    return removed
+
+
+def invalidate(targets):
+    """Drop entries matching a workbook path, a key prefix or a source file name"""
+    removed = 0
+    for target in targets:
+        prefix = file_digest(target) if Path(target).is_file() else target
+        for meta in entries():
+            if meta['key'].startswith(prefix) or meta['source_file'] == target:
+                remove(meta['key'])
+                removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and manage the eSMS parse cache')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='show cached entries')
+    invalidate_cmd = commands.add_parser('invalidate', help='drop entries for workbooks, keys or file names')
+    invalidate_cmd.add_argument('targets', nargs='+')
+    prune_cmd = commands.add_parser('prune', help='evict least recently used entries')
+    prune_cmd.add_argument('--max-mb', type=int, default=MAX_BYTES // (1024 * 1024))
+    commands.add_parser('clear', help='drop every entry')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        cached = entries()
+        total = sum(meta['size'] for meta in cached)
+        print(f"Cache: {CACHE_DIR}")
+        print(f"{len(cached)} entries, {total / 1024 / 1024:.1f} MB (limit {MAX_BYTES // 1024 // 1024} MB)")
+        for meta in cached:
+            last_used = datetime.fromtimestamp(meta['last_used']).strftime('%Y-%m-%d %H:%M')
+            print(f"  {meta['key'][:12]}  {meta['report_month']}  {meta['records']:>7,} records  "
+                  f"{meta['size'] / 1024 / 1024:6.1f} MB  used {last_used}  {meta['source_file']}")
+    elif args.command == 'invalidate':
+        print(f"Removed {invalidate(args.targets)} entries")
+    elif args.command == 'prune':
+        print(f"Removed {prune(args.max_mb * 1024 * 1024)} entries")
+    elif args.command == 'clear':
+        cached = entries()
+        for meta in cached:
+            remove(meta['key'])
+        print(f"Removed {len(cached)} entries")
+
+
+if __name__ == "__main__":
+    if not enabled():
+        sys.exit("pyarrow is not installed (pip install pyarrow)")
+    main()
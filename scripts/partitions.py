@@ -0,0 +1,119 @@
+"""
+Partition discovery and a bounded worker pool for per-month jobs.
+
+The link and stats scripts used to carry hard-coded lists of report_month
+values, which went stale as months were imported (refresh_sms_stats.py was
+missing 2025-03, 2025-07 and 2025-08). discover_partitions() reads the
+months and channels actually in sms_zns_messages.
+
+It runs a loose index scan from the client: "first month after the last one
+found" is one indexed probe (order by report_month, limit 1), so finding
+every partition costs a few dozen tiny queries however many rows each month
+holds. The (report_month, channel) index from scripts/sql/007 keeps the
+channel probes just as cheap.
+
+run_partitions() fans a per-partition function out over a thread pool (the
+work is round trips to Supabase, not CPU). A partition that fails is retried
+after a jittered exponential backoff, and the others keep going.
+
+Usage:
+    python scripts/partitions.py
+"""
+
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+TABLE = 'sms_zns_messages'
+
+
+def distinct_values(client, column, filters=(), table=TABLE):
+    """Distinct non-null values of a column in ascending order, one indexed probe per value"""
+    values = []
+    while True:
+        query = client.table(table).select(column).not_.is_(column, 'null').order(column).limit(1)
+        for name, value in filters:
+            query = query.eq(name, value)
+        if values:
+            query = query.gt(column, values[-1])
+        rows = query.execute().data
+        if not rows:
+            return values
+        values.append(rows[0][column])
+
+
+def discover_months(client, table=TABLE):
+    """report_month values present in the table ('YYYY-MM-DD', ascending)"""
+    return distinct_values(client, 'report_month', table=table)
+
+
+def discover_partitions(client, table=TABLE):
+    """(report_month, channel) pairs present in the table"""
+    return [
+        (month, channel)
+        for month in discover_months(client, table)
+        for channel in distinct_values(client, 'channel', [('report_month', month)], table)
+    ]
+
+
+def partition_name(partition):
+    return ' '.join(str(part) for part in partition) if isinstance(partition, tuple) else str(partition)
+
+
+def run_partition(work, partition, retries, base_delay):
+    for attempt in range(retries + 1):
+        try:
+            return work(partition)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            print(f"  {partition_name(partition)}: {e}; retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def run_partitions(partitions, work, workers=None, retries=2, base_delay=2.0):
+    """Call work(partition) for every partition on a bounded pool.
+
+    Returns ({partition: result}, {partition: exception}) for the partitions
+    that finished and those that still failed after their retries.
+    """
+    workers = workers or min(8, (os.cpu_count() or 2) * 2)
+    results = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(run_partition, work, partition, retries, base_delay): partition
+            for partition in partitions
+        }
+        for future in as_completed(futures):
+            partition = futures[future]
+            try:
+                results[partition] = future.result()
+            except Exception as e:
+                failures[partition] = e
+                print(f"  {partition_name(partition)}: failed ({e})")
+    return results, failures
+
+
+def main():
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv(Path(__file__).parent.parent / '.env.local')
+    url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+    key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+    client = create_client(url, key)
+
+    started = time.perf_counter()
+    partitions = discover_partitions(client)
+    print(f"{len(partitions)} partitions ({time.perf_counter() - started:.1f}s):")
+    for month, channel in partitions:
+        print(f"  {month}  {channel}")
+
+
+if __name__ == "__main__":
+    main()
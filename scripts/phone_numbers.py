@@ -0,0 +1,141 @@
+"""
+Phone canonicalization shared by the importers, the link scripts and the
+customer phone index.
+
+eSMS exports and the customers table hold the same numbers in several forms:
+Excel floats (912345678.0), +84/84 prefixes, 9 digits without the leading 0,
+spaces and dashes. canonicalize() turns a whole column into int64 numbers and
+a validity mask with array operations instead of a re.sub per row;
+format_phones() gives back the 10-digit strings stored in
+sms_zns_messages.phone.
+
+The rules are the ones normalize_phone has always applied:
+  - keep the digits only (a trailing Excel '.0' is dropped first)
+  - 84 + 9 digits -> 0 + 9 digits
+  - 9 digits not starting with 0 -> 0 + 9 digits
+  - anything that is not then 10 digits (or is 84 + 8 digits) is invalid
+A canonical number is that 10-digit string read as an integer, so it formats
+back with a zero pad and equal numbers always mean the same phone.
+
+Numbers stored in the cells (floats and ints) never go through strings.
+Text goes through pyarrow's RE2 kernels when pyarrow is installed, pandas
+string methods otherwise.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+# Everything that is not part of the number, including an Excel '.0' suffix
+NOT_DIGITS = r'\.0$|\D'
+
+# Cell types read as numbers (not bool, which is an int subclass)
+NUMBER_TYPES = [int, float, np.int64, np.int32, np.float64, np.float32]
+
+# 10**n for the digit count of numeric cells
+POWERS_OF_TEN = 10 ** np.arange(1, 19, dtype=np.int64)
+
+
+def apply_rules(length, value):
+    """(canonical, valid) from each number's digit count and its digits read as an integer"""
+    country = (length == 11) & (value // 10**9 == 84)
+    national = (length == 10) & (value // 10**8 != 84)
+    # 9 digits with a leading 0 would stay 9 digits long
+    short = (length == 9) & (value >= 10**8)
+    valid = country | national | short
+    canonical = np.where(country, value % 10**9, value)
+    return np.where(valid, canonical, 0), valid
+
+
+def read_numbers(values):
+    """(digit count, value) for cells Excel stored as numbers"""
+    values = np.asarray(values, dtype=np.float64)
+    whole = np.isfinite(values) & (values >= 0) & (values < 1e18)
+    whole[whole] = values[whole] == np.floor(values[whole])
+    value = np.where(whole, values, 0).astype(np.int64)
+    length = np.searchsorted(POWERS_OF_TEN, value, side='right') + 1
+    return np.where(whole, length, 0), value
+
+
+def read_text(texts):
+    """(digit count, value) for an object array of strings; value is only read for 9-11 digits"""
+    value = np.zeros(len(texts), dtype=np.int64)
+    if pa is not None:
+        digits = pc.replace_substring_regex(pa.array(texts, type=pa.string()), pattern=NOT_DIGITS, replacement='')
+        length = pc.utf8_length(digits).to_numpy(zero_copy_only=False)
+        candidates = (length >= 9) & (length <= 11)
+        value[candidates] = pc.cast(digits.filter(pa.array(candidates)), pa.int64()).to_numpy()
+    else:
+        digits = pd.Series(texts, dtype=object).str.replace(NOT_DIGITS, '', regex=True)
+        length = digits.str.len().to_numpy()
+        candidates = (length >= 9) & (length <= 11)
+        value[candidates] = digits[candidates].astype(np.int64).to_numpy()
+    return length, value
+
+
+def read_phones(values):
+    """(digit count, value) for a column mixing numbers, strings and missing cells"""
+    values = np.asarray(values.to_numpy() if isinstance(values, pd.Series) else values)
+    if values.dtype.kind in 'iuf':
+        return read_numbers(values)
+    if values.dtype.kind in 'US':
+        return read_text(values.astype(str).astype(object))
+
+    values = values.astype(object)
+    kind = pd.api.types.infer_dtype(values, skipna=False)
+    if kind == 'string':
+        return read_text(values)
+    if kind in ('floating', 'integer', 'mixed-integer-float'):
+        return read_numbers(values.astype(np.float64))
+
+    length = np.zeros(len(values), dtype=np.int64)
+    value = np.zeros(len(values), dtype=np.int64)
+    types = np.fromiter(map(type, values), dtype=object, count=len(values))
+    is_number = np.isin(types, NUMBER_TYPES)
+    is_text = types == str
+    if is_number.any():
+        length[is_number], value[is_number] = read_numbers(values[is_number].astype(np.float64))
+    if is_text.any():
+        length[is_text], value[is_text] = read_text(values[is_text])
+    return length, value
+
+
+def canonicalize(values):
+    """(numbers, valid) for a column of phones: canonical phones as int64 (0 where invalid) and a bool mask"""
+    return apply_rules(*read_phones(values))
+
+
+def digit_counts(values):
+    """Number of digits in each phone cell (0 for missing cells)"""
+    return read_phones(values)[0]
+
+
+def format_phones(numbers, valid):
+    """10-digit phone strings, None where invalid"""
+    out = np.full(len(numbers), None, dtype=object)
+    if not valid.any():
+        return out
+    if pa is not None:
+        text = pc.utf8_lpad(pc.cast(pa.array(numbers[valid]), pa.string()), width=10, padding='0')
+        out[valid] = text.to_numpy(zero_copy_only=False)
+    else:
+        out[valid] = np.char.zfill(numbers[valid].astype(str), 10).astype(object)
+    return out
+
+
+def normalize_phones(values):
+    """Canonical 10-digit strings for a column, None where the phone is invalid"""
+    return format_phones(*canonicalize(values))
+
+
+def normalize_phone(phone):
+    """Canonical 10-digit string for one phone, or None"""
+    if phone is None or phone == '':
+        return None
+    return normalize_phones(np.array([phone], dtype=object))[0]
+
@@ -0,0 +1,208 @@
+"""
+Adaptive request pacing for the scripts that talk to Supabase in loops.
+
+The link and reclassify scripts used to sleep a fixed time around every
+request (1s before each fetch, 0.3s after each update) and wait a flat 3s on
+any error. So they spent most of their runtime asleep when the backend was
+idle, and still hammered it when it was struggling.
+
+RateLimiter paces calls with a token bucket whose rate follows AIMD:
+  - every call that returns within target_latency adds `increase` calls/sec
+  - a slow call, or a throttling error, multiplies the rate by `decrease`
+    (at most once per cooldown, so one bad moment is not counted many times)
+  - HTTP 429/5xx, statement timeouts and dropped connections are retried
+    after a jittered exponential backoff (sleep uniform(0, base * 2**attempt),
+    capped at max_delay, or longer if a Retry-After header asks); any other
+    error is raised at once
+
+postgrest's APIError carries only the error body, not the response, so its
+status is the one PostgREST sends for the body's code (a Postgres SQLSTATE
+or a PGRST code). Exceptions that keep the httpx response, such as
+httpx.HTTPStatusError, give their real status and Retry-After.
+
+Usage:
+    limiter = RateLimiter(name='link')
+    result = limiter.call(lambda: query.execute())
+    print(limiter.summary())
+"""
+
+import random
+import threading
+import time
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# HTTP statuses that mean "slow down", not "this request is wrong"
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Postgres / PostgREST error codes that are load, not bad requests
+RETRY_CODES = {
+    '57014',     # statement timeout
+    '53300',     # too many connections
+    '40001',     # serialization failure
+    '40P01',     # deadlock
+    'PGRST003',  # timed out waiting for a pool connection
+}
+
+
+# 5xx statuses PostgREST answers Postgres errors with, by SQLSTATE class
+# (https://postgrest.org/en/stable/references/errors.html); other classes are 4xx
+SERVER_ERROR_CLASSES = {
+    '08': 503, '09': 500, '25': 500, '2D': 500, '38': 500, '39': 500, '3B': 500, '40': 500,
+    '53': 503, '54': 500, '55': 500, '57': 500, '58': 500, 'F0': 500, 'HV': 500, 'P0': 500, 'XX': 500,
+}
+# Codes in those classes that PostgREST answers with a 4xx
+CLIENT_ERROR_CODES = {'25006', 'P0001'}
+# PostgREST's own 5xx codes
+POSTGREST_STATUSES = {'PGRST000': 503, 'PGRST001': 503, 'PGRST002': 503, 'PGRST003': 504, 'PGRSTX00': 500}
+
+
+def error_response(error):
+    """The HTTP response behind a client exception (on it or on its cause), if any.
+
+    httpx's HTTPStatusError has one; postgrest's APIError does not, only the
+    code from the response body.
+    """
+    while error is not None:
+        response = getattr(error, 'response', None)
+        if response is not None and getattr(response, 'status_code', None):
+            return response
+        error = error.__cause__
+    return None
+
+
+def error_status(error):
+    """HTTP status of a failed request: the response's, or the one PostgREST sends for the error's code"""
+    response = error_response(error)
+    if response is not None:
+        return response.status_code
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        # APIError for a body that was not JSON carries the status as its code
+        return code
+    if not isinstance(code, str):
+        return None
+    if code.isdigit() and len(code) == 3:
+        return int(code)
+    if code in POSTGREST_STATUSES:
+        return POSTGREST_STATUSES[code]
+    if len(code) == 5 and code not in CLIENT_ERROR_CODES:
+        return SERVER_ERROR_CLASSES.get(code[:2])
+    return None
+
+
+def is_retryable(error):
+    """True for errors that come from load on the backend rather than from the request"""
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return error_status(error) in RETRY_STATUSES or getattr(error, 'code', None) in RETRY_CODES
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After), when the error carries its response"""
+    response = error_response(error)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    def __init__(self, rate=10.0, min_rate=0.2, max_rate=100.0, burst=None,
+                 target_latency=2.0, increase=0.5, decrease=0.5,
+                 max_retries=5, base_delay=0.5, max_delay=30.0, name='requests'):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst or max(1.0, rate)
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.name = name
+
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.refilled_at = time.monotonic()
+        self.decreased_at = 0.0
+
+        self.calls = 0
+        self.retries = 0
+        self.slowdowns = 0
+        self.waited = 0.0
+
+    def acquire(self):
+        """Block until the bucket has a token for one call"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+                self.refilled_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def sleep(self, seconds):
+        self.waited += seconds
+        time.sleep(seconds)
+
+    def on_success(self, latency):
+        with self.lock:
+            self.calls += 1
+            if latency > self.target_latency:
+                self.slow_down()
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.burst = max(self.burst, min(self.rate, self.max_rate))
+
+    def slow_down(self):
+        """Multiplicative decrease, once per cooldown; caller holds the lock"""
+        now = time.monotonic()
+        if now - self.decreased_at < self.target_latency:
+            return
+        self.decreased_at = now
+        self.slowdowns += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        # A burst above the new rate would let the next refill undo the slowdown
+        self.burst = max(1.0, min(self.burst, self.rate))
+        self.tokens = min(self.tokens, 0)
+
+    def backoff(self, attempt, error):
+        """Jittered exponential delay before retry number attempt (0-based)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error) or 0)
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn paced by the bucket, retrying throttling errors; other errors are raised"""
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            started = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                    self.slow_down()
+                delay = self.backoff(attempt, e)
+                print(f"  {self.name}: {getattr(e, 'code', None) or error_status(e) or type(e).__name__}, retry {attempt + 1} in {delay:.1f}s "
+                      f"(rate {self.rate:.1f}/s)")
+                self.sleep(delay)
+                continue
+            self.on_success(time.monotonic() - started)
+            return result
+
+    def summary(self):
+        return (f"{self.name}: {self.calls:,} calls, {self.retries:,} retries, {self.slowdowns:,} slowdowns, "
+                f"{self.waited:.1f}s waiting, rate now {self.rate:.1f}/s")
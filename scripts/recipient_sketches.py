@@ -0,0 +1,298 @@
+"""
+Mergeable unique-recipient sketches for the SMS/ZNS stats caches.
+
+unique_recipients in sms_monthly_stats_cache and sms_campaign_stats_cache is
+a plain integer, and two of them cannot be added: a phone messaged in April
+and in May would be counted twice. So "unique reach in Q2" or "birthday
+across all months" meant rescanning sms_zns_messages.
+
+The stats pass (sms_stats.py) now also keeps a sketch of the phones in every
+(report_month, channel, campaign_type_id) cell and stores it in
+sms_recipient_sketches (scripts/sql/008). Reach for any set of months,
+channels and campaigns is the union of the matching cells' sketches:
+  - roaring bitmap (pyroaring BitMap64) over the canonical int64 phones:
+    exact, a few bytes per phone
+  - HyperLogLog with 2**14 registers: about 0.8% error, 16 KB whatever the
+    count, merged by taking the larger register
+Without pyroaring only the HLL is stored and reach is an estimate.
+
+Phones are keyed by phone_keys(): the canonical number, or for text that
+does not parse as a phone a hash with the sign bit set, so the sketch counts
+exactly the recipients the cache rows count.
+
+The dashboard gets reach from the sms_unique_reach() RPC (scripts/sql/009),
+which unions the HLL registers inside Postgres; the HLL is stored as its raw
+registers so SQL can read them.
+
+Usage:
+    python scripts/recipient_sketches.py reach [--months 2025-04 2025-05 ...]
+        [--channels sms zns] [--campaigns Birthday Uncategorized ...] [--approx]
+"""
+
+import argparse
+import base64
+import hashlib
+import math
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from phone_numbers import canonicalize
+
+try:
+    from pyroaring import BitMap64
+except ImportError:
+    BitMap64 = None
+
+# 2**PRECISION registers; standard error 1.04 / sqrt(2**PRECISION)
+PRECISION = 14
+
+# Sketch rows per insert; a cell's bitmap can run to a few hundred KB
+INSERT_BATCH = 20
+# Sketch rows per read page
+READ_PAGE = 100
+
+UNCATEGORIZED = 'Uncategorized'
+
+
+def phone_keys(phones):
+    """(keys, counted) for a column of phones: int64 key of every non-empty phone, and which rows have one.
+
+    A phone that canonicalizes is its canonical number; any other text is a
+    63-bit hash of it with the sign bit set, which no canonical number has.
+    """
+    phones = np.asarray(phones, dtype=object)
+    keys, valid = canonicalize(phones)
+    unparsed = ~valid & pd.notna(phones) & (phones != '')
+    if unparsed.any():
+        digests = b''.join(hashlib.blake2b(str(phone).encode('utf-8'), digest_size=8).digest()
+                           for phone in phones[unparsed])
+        hashed = np.frombuffer(digests, dtype='<u8') | np.uint64(1 << 63)
+        keys = keys.copy()
+        keys[unparsed] = hashed.view(np.int64)
+    return keys, valid | unparsed
+
+
+def hash_phones(numbers):
+    """64-bit mix (splitmix64 finalizer) of canonical phones"""
+    with np.errstate(over='ignore'):
+        z = np.asarray(numbers, dtype=np.int64).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+class HyperLogLog:
+    def __init__(self, precision=PRECISION, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, numbers):
+        if not len(numbers):
+            return
+        hashes = hash_phones(numbers)
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.intp)
+        # Rank: position of the first 1 bit in the remaining 50 bits (width + 1 when all zero);
+        # they fit a float exactly, so frexp's exponent is their bit length
+        rest = (hashes & np.uint64((1 << width) - 1)).astype(np.float64)
+        rank = (width + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        """Ertl's improved raw estimator: no bias correction tables, good from 0 to billions"""
+        m = len(self.registers)
+        q = 64 - self.precision
+        histogram = np.bincount(self.registers, minlength=q + 2)
+        z = m * tau(1 - histogram[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + histogram[k])
+        z += m * sigma(histogram[0] / m)
+        return int(round(m * m / (2 * math.log(2)) / z)) if z else 0
+
+    def to_bytes(self):
+        """The registers, one byte each (sms_unique_reach reads them in SQL)"""
+        return self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) & (len(data) - 1):
+            # Rows saved before the registers were stored raw
+            data = zlib.decompress(data)
+        registers = np.frombuffer(data, dtype=np.uint8).copy()
+        return cls(int(math.log2(len(registers))), registers)
+
+
+def sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+class RecipientSketch:
+    """Distinct phone keys (phone_keys): exact (roaring, or a set without pyroaring) plus an HLL"""
+
+    def __init__(self, exact=None, hll=None):
+        if exact is None:
+            exact = BitMap64() if BitMap64 is not None else set()
+        self.exact = exact
+        self.hll = hll or HyperLogLog()
+
+    def add(self, numbers):
+        numbers = np.asarray(numbers, dtype=np.int64)
+        if BitMap64 is not None and isinstance(self.exact, BitMap64):
+            self.exact |= BitMap64(numbers.view(np.uint64))
+        elif self.exact is not None:
+            self.exact.update(numbers.tolist())
+        self.hll.add(numbers)
+
+    def merge(self, other):
+        if self.exact is not None and other.exact is not None:
+            self.exact |= other.exact
+        else:
+            self.exact = None
+        self.hll.merge(other.hll)
+
+    def count(self, exact=True):
+        """Distinct phones; the HLL estimate when asked, or when an exact part is missing"""
+        if exact and self.exact is not None:
+            return len(self.exact)
+        return self.hll.count()
+
+    def row(self):
+        """Columns of sms_recipient_sketches (base64 text, as PostgREST carries it)"""
+        roaring = self.exact.serialize() if BitMap64 is not None and isinstance(self.exact, BitMap64) else None
+        return {
+            'recipients': self.count(),
+            'roaring': base64.b64encode(roaring).decode('ascii') if roaring is not None else None,
+            'hll': base64.b64encode(self.hll.to_bytes()).decode('ascii'),
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        sketch = cls(hll=HyperLogLog.from_bytes(base64.b64decode(row['hll'])))
+        # No bitmap stored, or no pyroaring to read it: only the estimate is left
+        sketch.exact = None
+        if row.get('roaring') and BitMap64 is not None:
+            sketch.exact = BitMap64.deserialize(base64.b64decode(row['roaring']))
+        return sketch
+
+
+def save_sketches(client, aggregator):
+    """Replace sms_recipient_sketches with one row per (month, channel, campaign) cell"""
+    rows = [
+        {'report_month': month, 'channel': channel, 'campaign_type_id': campaign_id,
+         **stats.recipients.row()}
+        for (month, channel, campaign_id), stats in aggregator.groups.items()
+        if month and channel
+    ]
+    client.table('sms_recipient_sketches').delete().neq('id', 0).execute()
+    for i in range(0, len(rows), INSERT_BATCH):
+        client.table('sms_recipient_sketches').insert(rows[i:i + INSERT_BATCH]).execute()
+    return rows
+
+
+def load_sketches(client, months=None, channels=None):
+    """Sketch rows for the given months and channels (all when None)"""
+    rows = []
+    while True:
+        query = client.table('sms_recipient_sketches')\
+            .select('id, report_month, channel, campaign_type_id, recipients, roaring, hll')\
+            .order('id').limit(READ_PAGE)
+        if months:
+            query = query.in_('report_month', list(months))
+        if channels:
+            query = query.in_('channel', list(channels))
+        if rows:
+            query = query.gt('id', rows[-1]['id'])
+        page = query.execute().data
+        rows.extend(page)
+        if len(page) < READ_PAGE:
+            return rows
+
+
+def unique_reach(client, months=None, channels=None, campaign_ids=None, exact=True):
+    """Distinct phones messaged in any of the months x channels x campaigns (None = all; a None
+    campaign id is uncategorized). Returns (count, exact)."""
+    sketch = None
+    for row in load_sketches(client, months, channels):
+        if campaign_ids is not None and row['campaign_type_id'] not in campaign_ids:
+            continue
+        cell = RecipientSketch.from_row(row)
+        if sketch is None:
+            sketch = cell
+        else:
+            sketch.merge(cell)
+    if sketch is None:
+        return 0, True
+    exact = exact and sketch.exact is not None
+    return sketch.count(exact), exact
+
+
+def month_start(value):
+    """'2025-04' or '2025-04-01' -> '2025-04-01'"""
+    return value if len(value) == 10 else f"{value}-01"
+
+
+def main():
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    parser = argparse.ArgumentParser(description='Unique recipients for any mix of months, channels and campaigns')
+    commands = parser.add_subparsers(dest='command', required=True)
+    reach_cmd = commands.add_parser('reach', help='distinct phones messaged in the selection')
+    reach_cmd.add_argument('--months', nargs='+', help='YYYY-MM (default: every month)')
+    reach_cmd.add_argument('--channels', nargs='+', choices=['sms', 'zns'])
+    reach_cmd.add_argument('--campaigns', nargs='+', help=f"campaign type names, or {UNCATEGORIZED}")
+    reach_cmd.add_argument('--approx', action='store_true', help='use the HyperLogLog estimates')
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent.parent / '.env.local')
+    url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+    key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+    client = create_client(url, key)
+
+    campaign_ids = None
+    if args.campaigns:
+        types = client.table('sms_zns_campaign_types').select('id, name').execute().data
+        ids = {ct['name'].lower(): ct['id'] for ct in types}
+        ids[UNCATEGORIZED.lower()] = None
+        unknown = [name for name in args.campaigns if name.lower() not in ids]
+        if unknown:
+            parser.error(f"unknown campaigns: {', '.join(unknown)} (known: {', '.join(ct['name'] for ct in types)})")
+        campaign_ids = {ids[name.lower()] for name in args.campaigns}
+
+    months = [month_start(month) for month in args.months] if args.months else None
+    count, exact = unique_reach(client, months, args.channels, campaign_ids, exact=not args.approx)
+    print(f"Unique recipients: {count:,}{'' if exact else ' (HyperLogLog estimate)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+One streaming pass over sms_zns_messages for the SMS/ZNS stats caches.
+
+The refresh scripts used to run a separate scan for every (month, channel)
+and campaign, and kept the rows of each scan in a list only to sum three
+columns and count distinct phones. aggregate_messages() reads the table once
+and adds each page into running totals per (report_month, channel,
+campaign_type_id) cell. The MONTHLY and CAMPAIGN cache rows are roll-ups of
+those cells, and so are the recipient sketches (recipient_sketches.py)
+saved for each cell. Memory holds the totals and the sketches, never the
+rows.
+
+The pass is split into 16 shards by the first hex digit of the message uuid.
+The shards run on the partitions.run_partitions pool, each paging by id with
+its own totals, and are merged at the end. A failed shard is retried from
+its start, so no row is counted twice.
+
+Cost is total_cost, or unit_price * total_mt (total_mt at least 1) where the
+import left total_cost empty.
+"""
+
+import numpy as np
+import pandas as pd
+
+from partitions import run_partitions
+from rate_limiter import RateLimiter
+from recipient_sketches import RecipientSketch, phone_keys
+
+# PostgREST returns at most 1000 rows per request by default
+PAGE_SIZE = 1000
+
+COLUMNS = 'id, report_month, channel, campaign_type_id, phone, success_count, unit_price, total_mt, total_cost'
+
+# Message ids are random uuids, so their first hex digit splits the table evenly
+SHARDS = '0123456789abcdef'
+
+# Finest grouping; the others are roll-ups of it
+CELL = ('report_month', 'channel', 'campaign_type_id')
+MONTHLY = ('report_month', 'channel')
+CAMPAIGN = ('campaign_type_id', 'channel')
+
+# Paces every page; retries timeouts and 5xx before a shard is failed
+limiter = RateLimiter(name='stats')
+
+
+class GroupStats:
+    def __init__(self):
+        self.total_messages = 0
+        self.successful_messages = 0
+        self.total_cost = 0.0
+        self.recipients = RecipientSketch()
+
+    def merge(self, stats):
+        self.total_messages += stats.total_messages
+        self.successful_messages += stats.successful_messages
+        self.total_cost += stats.total_cost
+        self.recipients.merge(stats.recipients)
+
+    def row(self):
+        return {
+            'total_messages': self.total_messages,
+            'successful_messages': self.successful_messages,
+            'unique_recipients': self.recipients.count(),
+            'total_cost': self.total_cost,
+        }
+
+
+def group_key(key):
+    key = key if isinstance(key, tuple) else (key,)
+    return tuple(None if pd.isna(part) else part for part in key)
+
+
+class StatsAggregator:
+    """Running totals per CELL"""
+
+    def __init__(self):
+        self.groups = {}
+        self.rows = 0
+
+    def add(self, rows):
+        """Fold one page of message rows into the totals"""
+        frame = pd.DataFrame(rows)
+        successful = pd.to_numeric(frame['success_count'], errors='coerce').fillna(0).to_numpy(np.int64)
+        cost = pd.to_numeric(frame['total_cost'], errors='coerce').fillna(0).to_numpy(float)
+        unit_price = pd.to_numeric(frame['unit_price'], errors='coerce').fillna(0).to_numpy(float)
+        total_mt = pd.to_numeric(frame['total_mt'], errors='coerce').fillna(0).to_numpy(float)
+        cost = np.where(cost != 0, cost, unit_price * np.where(total_mt != 0, total_mt, 1))
+
+        keys, counted = phone_keys(frame['phone'].to_numpy(object))
+
+        for key, index in frame.groupby(list(CELL), dropna=False).indices.items():
+            stats = self.groups.setdefault(group_key(key), GroupStats())
+            stats.total_messages += len(index)
+            stats.successful_messages += int(successful[index].sum())
+            stats.total_cost += float(cost[index].sum())
+            stats.recipients.add(keys[index][counted[index]])
+        self.rows += len(rows)
+
+    def merge(self, aggregator):
+        for key, stats in aggregator.groups.items():
+            self.groups.setdefault(key, GroupStats()).merge(stats)
+        self.rows += aggregator.rows
+
+    def results(self, grouping):
+        """{key: GroupStats} rolled up to a grouping (columns of CELL), in key order (None first)"""
+        positions = [CELL.index(column) for column in grouping]
+        groups = {}
+        for key, stats in self.groups.items():
+            groups.setdefault(tuple(key[i] for i in positions), GroupStats()).merge(stats)
+        return {key: groups[key] for key in sorted(groups, key=lambda key: [(part is not None, part) for part in key])}
+
+
+def shard_pages(client, shard, page_size=PAGE_SIZE):
+    """Pages of the messages whose id starts with one hex digit, in id order"""
+    upper = SHARDS[SHARDS.index(shard) + 1] if shard != SHARDS[-1] else None
+    last_id = f"{shard}0000000-0000-0000-0000-000000000000"
+    first = True
+    while True:
+        query = client.table('sms_zns_messages').select(COLUMNS).order('id').limit(page_size)
+        query = query.gte('id', last_id) if first else query.gt('id', last_id)
+        if upper:
+            query = query.lt('id', f"{upper}0000000-0000-0000-0000-000000000000")
+        rows = limiter.call(query.execute).data
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+        first = False
+        if len(rows) < page_size:
+            return
+
+
+def aggregate_messages(client, workers=None):
+    """Totals for every CELL, from one pass over sms_zns_messages"""
+    def aggregate_shard(shard):
+        aggregator = StatsAggregator()
+        for rows in shard_pages(client, shard):
+            aggregator.add(rows)
+        print(f"    shard {shard}: {aggregator.rows:,} messages")
+        return aggregator
+
+    shards, failed = run_partitions(list(SHARDS), aggregate_shard, workers=workers)
+    if failed:
+        # Partial totals would be written as if they were complete
+        raise RuntimeError(f"stats scan failed for shards {', '.join(sorted(failed))}")
+
+    total = StatsAggregator()
+    for aggregator in shards.values():
+        total.merge(aggregator)
+    print(f"  Aggregated {total.rows:,} messages ({limiter.summary()})")
+    return total
+
+
+def save_monthly_stats(client, aggregator):
+    """Replace sms_monthly_stats_cache with the MONTHLY totals, in one insert"""
+    rows = [
+        {'report_month': month, 'channel': channel, **stats.row()}
+        for (month, channel), stats in aggregator.results(MONTHLY).items()
+        if month and channel
+    ]
+    client.table('sms_monthly_stats_cache').delete().neq('id', 0).execute()
+    if rows:
+        client.table('sms_monthly_stats_cache').insert(rows).execute()
+    return rows
+
+
+def save_campaign_stats(client, aggregator, campaign_names):
+    """Replace sms_campaign_stats_cache with the CAMPAIGN totals, in one insert"""
+    rows = [
+        {'campaign_name': campaign_names.get(campaign_id, campaign_id) if campaign_id else 'Uncategorized',
+         'message_channel': channel, **stats.row()}
+        for (campaign_id, channel), stats in aggregator.results(CAMPAIGN).items()
+        if channel
+    ]
+    client.table('sms_campaign_stats_cache').delete().neq('id', 0).execute()
+    if rows:
+        client.table('sms_campaign_stats_cache').insert(rows).execute()
+    return rows
@@ -0,0 +1,26 @@
+-- Unique message_id so the importers can upsert (--idempotent) instead of
+-- inserting duplicates when a folder is imported twice.
+-- Run once in the Supabase SQL editor.
+
+-- Older imports stored numeric ids as '123.0'; bring them in line with '123'
+UPDATE sms_zns_messages
+SET message_id = left(message_id, -2)
+WHERE message_id ~ '^\d+\.0$';
+
+-- Drop duplicate copies left by earlier reruns, keeping one row per message_id
+-- (prefer the copy already linked to a customer)
+DELETE FROM sms_zns_messages m
+USING (
+  SELECT ctid,
+         row_number() OVER (
+           PARTITION BY message_id
+           ORDER BY (customer_id IS NULL), ctid
+         ) AS copy
+  FROM sms_zns_messages
+  WHERE message_id IS NOT NULL
+) d
+WHERE m.ctid = d.ctid AND d.copy > 1;
+
+-- NULL message_ids never conflict, so id-less rows are still allowed
+CREATE UNIQUE INDEX IF NOT EXISTS sms_zns_messages_message_id_key
+  ON sms_zns_messages (message_id);
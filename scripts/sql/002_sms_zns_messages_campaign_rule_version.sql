@@ -0,0 +1,11 @@
+-- Version of the campaign rule that classified each message (see
+-- scripts/campaign_rules.py). reclassify_sms_campaigns.py only revisits rows
+-- whose version is NULL or no longer current, instead of the whole table.
+-- Run once in the Supabase SQL editor.
+
+ALTER TABLE sms_zns_messages
+  ADD COLUMN IF NOT EXISTS campaign_rule_version text;
+
+-- Stale rows are found from the index alone, without reading message bodies
+CREATE INDEX IF NOT EXISTS sms_zns_messages_campaign_rule_version_idx
+  ON sms_zns_messages (campaign_rule_version, id);
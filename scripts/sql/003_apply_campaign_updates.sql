@@ -0,0 +1,23 @@
+-- Set-based campaign updates for the reclassify scripts: one call applies a
+-- whole batch of (id, campaign_type_id, campaign_rule_version) rows with a
+-- single UPDATE ... FROM, instead of one PATCH per campaign per 50-100 ids.
+-- Rows are read with the table's own row type, so id keeps its column type
+-- and the join uses the primary key.
+-- Run once in the Supabase SQL editor (after 002).
+
+CREATE OR REPLACE FUNCTION apply_campaign_updates(updates jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+  WITH updated AS (
+    UPDATE sms_zns_messages m
+    SET campaign_type_id = u.campaign_type_id,
+        campaign_rule_version = u.campaign_rule_version
+    FROM jsonb_populate_recordset(NULL::sms_zns_messages, updates) u
+    WHERE m.id = u.id
+      AND (m.campaign_type_id IS DISTINCT FROM u.campaign_type_id
+           OR m.campaign_rule_version IS DISTINCT FROM u.campaign_rule_version)
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM updated;
+$$;
@@ -0,0 +1,130 @@
+-- Voucher code index: every voucher code the importers extracted, with the
+-- message that issued it, so redemption/attribution is a primary-key lookup
+-- instead of a scan over sms_zns_messages.
+--
+-- Kept in step by statement-level triggers. Each insert or update statement
+-- on sms_zns_messages (REST batches, the COPY loader's merge,
+-- apply_campaign_updates, customer linking) writes its changed rows here in
+-- one set-based statement. Rows imported before this file are filled by
+--     python scripts/voucher_index.py backfill
+-- Run once in the Supabase SQL editor (after 003).
+
+-- Same column types as sms_zns_messages
+CREATE TABLE IF NOT EXISTS sms_voucher_codes AS
+SELECT voucher_code, id AS message_id, customer_id, campaign_type_id, sent_at
+FROM sms_zns_messages
+WITH NO DATA;
+
+ALTER TABLE sms_voucher_codes
+  ALTER COLUMN voucher_code SET NOT NULL,
+  ALTER COLUMN message_id SET NOT NULL;
+
+-- A code can be sent to many customers (shared promo codes), so the key is the pair;
+-- lookups by code use its leading column
+CREATE UNIQUE INDEX IF NOT EXISTS sms_voucher_codes_pkey
+  ON sms_voucher_codes (voucher_code, message_id);
+CREATE INDEX IF NOT EXISTS sms_voucher_codes_message_id_idx
+  ON sms_voucher_codes (message_id);
+CREATE INDEX IF NOT EXISTS sms_voucher_codes_customer_id_idx
+  ON sms_voucher_codes (customer_id) WHERE customer_id IS NOT NULL;
+
+-- Codes are stored trimmed and upper-case; look them up the same way
+CREATE OR REPLACE FUNCTION normalize_voucher_code(code text)
+RETURNS text
+LANGUAGE sql IMMUTABLE
+AS $$ SELECT nullif(upper(btrim(code)), '') $$;
+
+CREATE OR REPLACE FUNCTION sync_sms_voucher_codes()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    DELETE FROM sms_voucher_codes v
+    USING changed_rows c
+    WHERE v.message_id = c.id;
+  END IF;
+
+  INSERT INTO sms_voucher_codes (voucher_code, message_id, customer_id, campaign_type_id, sent_at)
+  SELECT normalize_voucher_code(voucher_code), id, customer_id, campaign_type_id, sent_at
+  FROM changed_rows
+  WHERE normalize_voucher_code(voucher_code) IS NOT NULL
+  ON CONFLICT (voucher_code, message_id) DO UPDATE
+  SET customer_id = excluded.customer_id,
+      campaign_type_id = excluded.campaign_type_id,
+      sent_at = excluded.sent_at;
+  RETURN NULL;
+END;
+$$;
+
+-- Transition tables allow one event per trigger, hence two
+DROP TRIGGER IF EXISTS sms_voucher_codes_insert ON sms_zns_messages;
+CREATE TRIGGER sms_voucher_codes_insert
+  AFTER INSERT ON sms_zns_messages
+  REFERENCING NEW TABLE AS changed_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION sync_sms_voucher_codes();
+
+DROP TRIGGER IF EXISTS sms_voucher_codes_update ON sms_zns_messages;
+CREATE TRIGGER sms_voucher_codes_update
+  AFTER UPDATE ON sms_zns_messages
+  REFERENCING NEW TABLE AS changed_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION sync_sms_voucher_codes();
+
+-- Deleted messages take their codes with them
+CREATE OR REPLACE FUNCTION drop_sms_voucher_codes()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  DELETE FROM sms_voucher_codes v
+  USING removed_rows r
+  WHERE v.message_id = r.id;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS sms_voucher_codes_delete ON sms_zns_messages;
+CREATE TRIGGER sms_voucher_codes_delete
+  AFTER DELETE ON sms_zns_messages
+  REFERENCING OLD TABLE AS removed_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION drop_sms_voucher_codes();
+
+-- Backfill for rows imported before the triggers existed: one keyset page per
+-- call, so each call stays well inside the statement timeout.
+-- Returns {"last_id": ..., "scanned": n, "indexed": n}; last_id is null when done.
+CREATE OR REPLACE FUNCTION backfill_sms_voucher_codes(after_id sms_zns_messages.id%TYPE, batch_size integer DEFAULT 20000)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  page_last sms_zns_messages.id%TYPE;
+  page_rows integer;
+  page_indexed integer;
+BEGIN
+  WITH page AS (
+    SELECT id, voucher_code, customer_id, campaign_type_id, sent_at
+    FROM sms_zns_messages
+    WHERE after_id IS NULL OR id > after_id
+    ORDER BY id
+    LIMIT batch_size
+  ), indexed AS (
+    INSERT INTO sms_voucher_codes (voucher_code, message_id, customer_id, campaign_type_id, sent_at)
+    SELECT normalize_voucher_code(voucher_code), id, customer_id, campaign_type_id, sent_at
+    FROM page
+    WHERE normalize_voucher_code(voucher_code) IS NOT NULL
+    ON CONFLICT (voucher_code, message_id) DO UPDATE
+    SET customer_id = excluded.customer_id,
+        campaign_type_id = excluded.campaign_type_id,
+        sent_at = excluded.sent_at
+    RETURNING 1
+  )
+  SELECT (SELECT id FROM page ORDER BY id DESC LIMIT 1), (SELECT count(*) FROM page), (SELECT count(*) FROM indexed)
+  INTO page_last, page_rows, page_indexed;
+
+  RETURN jsonb_build_object(
+    'last_id', CASE WHEN page_rows < batch_size THEN NULL ELSE page_last END,
+    'scanned', page_rows,
+    'indexed', page_indexed
+  );
+END;
+$$;
@@ -0,0 +1,33 @@
+-- Last change time of each customer row, kept by a trigger. The local phone
+-- index (scripts/customer_phone_index.py) refreshes from the last
+-- (updated_at, id) it has seen instead of re-reading every customer.
+-- Run once in the Supabase SQL editor.
+
+ALTER TABLE customers
+  ADD COLUMN IF NOT EXISTS updated_at timestamptz;
+
+-- Existing rows count as changed when they were created
+UPDATE customers SET updated_at = coalesce(created_at, now()) WHERE updated_at IS NULL;
+
+ALTER TABLE customers
+  ALTER COLUMN updated_at SET DEFAULT now(),
+  ALTER COLUMN updated_at SET NOT NULL;
+
+CREATE OR REPLACE FUNCTION touch_customers_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS customers_updated_at ON customers;
+CREATE TRIGGER customers_updated_at
+  BEFORE UPDATE ON customers
+  FOR EACH ROW EXECUTE FUNCTION touch_customers_updated_at();
+
+-- Changes since a watermark are a range scan in watermark order
+CREATE INDEX IF NOT EXISTS customers_updated_at_id_idx
+  ON customers (updated_at, id);
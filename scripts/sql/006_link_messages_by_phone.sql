@@ -0,0 +1,25 @@
+-- Reverse linking (scripts/link_new_customers.py): new or changed customers
+-- are matched against the messages still waiting for a customer, instead of
+-- every unlinked message being re-read month by month.
+-- Run once in the Supabase SQL editor.
+
+-- Only unlinked rows are indexed, so the index shrinks as messages get linked
+CREATE INDEX IF NOT EXISTS sms_zns_messages_unlinked_phone_idx
+  ON sms_zns_messages (phone)
+  WHERE customer_id IS NULL;
+
+-- links: [{"phone": "0912345678", "customer_id": "..."}]; returns messages linked
+CREATE OR REPLACE FUNCTION link_messages_by_phone(links jsonb)
+RETURNS integer
+LANGUAGE sql
+AS $$
+  WITH linked AS (
+    UPDATE sms_zns_messages m
+    SET customer_id = l.customer_id
+    FROM jsonb_populate_recordset(NULL::sms_zns_messages, links) l
+    WHERE m.phone = l.phone
+      AND m.customer_id IS NULL
+    RETURNING 1
+  )
+  SELECT count(*)::integer FROM linked;
+$$;
@@ -0,0 +1,9 @@
+-- Partition discovery (scripts/partitions.py) finds the months and channels
+-- in sms_zns_messages with one "next value after X" probe each. This index
+-- answers both kinds of probe (next month; next channel within a month) from
+-- its first entry past X, and serves the per-month and per-month-and-channel
+-- filters of the link and stats scripts.
+-- Run once in the Supabase SQL editor.
+
+CREATE INDEX IF NOT EXISTS sms_zns_messages_report_month_channel_idx
+  ON sms_zns_messages (report_month, channel);
@@ -0,0 +1,26 @@
+-- Unique-recipient sketches behind sms_monthly_stats_cache and
+-- sms_campaign_stats_cache: one row per (report_month, channel,
+-- campaign_type_id) cell, written by the refresh scripts' stats pass
+-- (scripts/sms_stats.py). Unique reach for any mix of months, channels and
+-- campaigns is the union of the matching rows:
+--     python scripts/recipient_sketches.py reach --months 2025-04 2025-05 2025-06
+-- or, from the dashboard, the sms_unique_reach() RPC (009).
+-- Run once in the Supabase SQL editor.
+
+CREATE TABLE IF NOT EXISTS sms_recipient_sketches (
+  id bigserial PRIMARY KEY,
+  report_month date NOT NULL,
+  channel text NOT NULL,
+  campaign_type_id uuid,          -- NULL: uncategorized
+  recipients integer NOT NULL,    -- distinct valid phones in the cell
+  roaring text,                   -- base64 portable roaring bitmap (64-bit) of canonical phones; exact
+  hll text NOT NULL,              -- base64 HyperLogLog registers (2^14 bytes); approximate, unioned in SQL by 009
+  refreshed_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS sms_recipient_sketches_month_channel_idx
+  ON sms_recipient_sketches (report_month, channel);
+
+-- Phone-level data: only the service role (refresh and reach scripts) reads it;
+-- the dashboard gets counts through sms_unique_reach()
+ALTER TABLE sms_recipient_sketches ENABLE ROW LEVEL SECURITY;
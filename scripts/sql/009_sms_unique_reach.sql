@@ -0,0 +1,130 @@
+-- Unique reach for the dashboard (sms-analytics page): distinct phones
+-- messaged in any mix of months, channels and campaigns, from the
+-- sms_recipient_sketches cells (008) instead of a scan of sms_zns_messages.
+-- The matching cells' HyperLogLog registers are merged inside Postgres
+-- (per-register max) and estimated with Ertl's improved raw estimator, the
+-- same as HyperLogLog.count() in scripts/recipient_sketches.py: about 0.8%
+-- error. Only the count leaves the database, so the function runs as its
+-- owner and signed-in users need no access to the sketches themselves.
+-- Exact counts (the roaring bitmaps) stay with
+--     python scripts/recipient_sketches.py reach
+-- Run once in the Supabase SQL editor (after 008), then refresh the stats so
+-- the sketches are rewritten with raw registers.
+
+CREATE OR REPLACE FUNCTION sms_hll_sigma(x double precision)
+RETURNS double precision
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  y double precision := 1;
+  z double precision := x;
+  previous double precision;
+BEGIN
+  IF x = 1 THEN
+    RETURN 'Infinity';
+  END IF;
+  LOOP
+    x := x * x;
+    previous := z;
+    z := z + x * y;
+    y := y + y;
+    EXIT WHEN z = previous;
+  END LOOP;
+  RETURN z;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION sms_hll_tau(x double precision)
+RETURNS double precision
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  y double precision := 1;
+  z double precision := 1 - x;
+  previous double precision;
+BEGIN
+  IF x = 0 OR x = 1 THEN
+    RETURN 0;
+  END IF;
+  LOOP
+    x := sqrt(x);
+    previous := z;
+    y := y * 0.5;
+    z := z - (1 - x) ^ 2 * y;
+    EXIT WHEN z = previous;
+  END LOOP;
+  RETURN z / 3;
+END;
+$$;
+
+-- months / channels / campaign_type_ids: NULL for all. With campaign_type_ids
+-- given, uncategorized messages count only when uncategorized is true.
+CREATE OR REPLACE FUNCTION sms_unique_reach(
+  months date[] DEFAULT NULL,
+  channels text[] DEFAULT NULL,
+  campaign_type_ids uuid[] DEFAULT NULL,
+  uncategorized boolean DEFAULT false
+)
+RETURNS bigint
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  ranks integer[];
+  counts integer[];
+  m integer;
+  q integer;
+  histogram integer[];
+  z double precision;
+BEGIN
+  -- Merged register values, as (rank, how many registers hold it). The cells
+  -- are materialized so each one is decoded once, not once per register.
+  WITH cells AS MATERIALIZED (
+    SELECT decode(hll, 'base64') AS registers
+    FROM sms_recipient_sketches
+    WHERE (months IS NULL OR report_month = ANY (months))
+      AND (channels IS NULL OR channel = ANY (channels))
+      AND (campaign_type_ids IS NULL
+           OR campaign_type_id = ANY (campaign_type_ids)
+           OR (uncategorized AND campaign_type_id IS NULL))
+  ),
+  merged AS (
+    SELECT max(get_byte(c.registers, i)) AS rank
+    FROM cells c, generate_series(0, length(c.registers) - 1) AS i
+    GROUP BY i
+  ),
+  buckets AS (
+    SELECT rank, count(*)::integer AS registers FROM merged GROUP BY rank
+  )
+  SELECT array_agg(rank), array_agg(registers), coalesce(sum(registers), 0)
+  INTO ranks, counts, m
+  FROM buckets;
+  IF m = 0 THEN
+    RETURN 0;
+  END IF;
+
+  q := 64 - round(log(2, m))::integer;
+  histogram := array_fill(0, ARRAY[q + 2], ARRAY[0]);
+  FOR j IN 1..array_length(ranks, 1) LOOP
+    histogram[ranks[j]] := counts[j];
+  END LOOP;
+
+  z := m * sms_hll_tau(1 - histogram[q + 1]::double precision / m);
+  FOR k IN REVERSE q..1 LOOP
+    z := 0.5 * (z + histogram[k]);
+  END LOOP;
+  z := z + m * sms_hll_sigma(histogram[0]::double precision / m);
+  IF z = 0 THEN
+    RETURN 0;
+  END IF;
+  RETURN round(m::double precision * m / (2 * ln(2)) / z)::bigint;
+END;
+$$;
+
+-- Signed-in dashboard users only
+REVOKE EXECUTE ON FUNCTION sms_unique_reach(date[], text[], uuid[], boolean) FROM PUBLIC, anon;
+GRANT EXECUTE ON FUNCTION sms_unique_reach(date[], text[], uuid[], boolean) TO authenticated;
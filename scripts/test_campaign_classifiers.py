@@ -0,0 +1,122 @@
+"""
+Column classifiers against their per-message originals:
+  - CampaignClassifier.classify_column vs classify_legacy (campaign_classifier.py)
+  - campaign_rules.classify_column / match_rules vs classify_with_version / rule_index
+on the golden corpus (scripts/fixtures/classifier_golden.jsonl) plus variants
+that stress case folding and Unicode digits and spaces, with and without the
+ClassificationCache, and with and without pyarrow.
+    python scripts/test_campaign_classifiers.py
+"""
+
+import random
+import unittest
+from unittest import mock
+
+import campaign_classifier
+import classification_cache
+import text_masks
+from bench_classifiers import column_passes, load_corpus
+from campaign_classifier import CampaignClassifier, classify_legacy
+from campaign_rules import classify_column, classify_with_version, match_rules, rule_index
+from classification_cache import ClassificationCache
+from text_masks import SMALL_BATCH
+
+# Characters whose re and RE2 (or str.lower and IGNORECASE) readings differ
+ODD_TEXTS = [
+    '', 'ı', 'ſ', 'GIẢM 20%', 'gıảm 20%', 'VOUCHER ſn12345', 'Ma xac thuc cua ban', 'Mã xác thực ١٢٣٤',
+    'FMV٣٣', 'Giam ٥٠%', 'cam on SO١٢-٣/٤', 'K KELVIN VC50K CPM', 'OEB 10%', 'NPO voucher',
+]
+
+
+def variants(text, rng):
+    """The text and a few spellings of it that classify differently, or should not"""
+    return [
+        text,
+        text.upper(),
+        text.replace('i', 'ı').replace('s', 'ſ'),
+        text.replace(' ', ' '),
+        ''.join('٣' if char.isdigit() and rng.random() < 0.3 else char for char in text),
+    ]
+
+
+def without_pyarrow():
+    """Patch every module that picks a pyarrow path, so the pandas / re fallbacks run"""
+    patches = [mock.patch.object(module, name, None)
+               for module in (text_masks, campaign_classifier, classification_cache)
+               for name in ('pa', 'pc') if hasattr(module, name)]
+    for patch in patches:
+        patch.start()
+    return patches
+
+
+class ColumnClassifierTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = load_corpus()
+        rng = random.Random(0)
+        texts = [variant for entry in cls.corpus for variant in variants(entry['content'], rng)]
+        # Above SMALL_BATCH, so the column (mask) paths run, not the per-row fallback
+        cls.texts = list(dict.fromkeys(texts + ODD_TEXTS))
+        assert len(cls.texts) >= SMALL_BATCH
+        cls.contents = cls.texts + [None]
+
+    def check_patterns(self, classifier, cache=None):
+        keys, vouchers = classifier.classify_column(self.contents, cache=cache)
+        expected = [classify_legacy(content) for content in self.contents]
+        self.assertEqual(list(zip(keys, vouchers)), expected)
+
+    def check_rules(self, cache=None):
+        campaigns, versions = classify_column(self.contents, cache=cache)
+        self.assertEqual(list(zip(campaigns, versions)), [classify_with_version(content) for content in self.contents])
+
+    def test_patterns_column(self):
+        self.check_patterns(CampaignClassifier())
+
+    def test_patterns_column_cached(self):
+        classifier = CampaignClassifier()
+        cache = ClassificationCache(classifier.label, classify_texts=classifier.label_texts)
+        self.check_patterns(classifier, cache)
+        # Second pass is answered from the cache
+        self.check_patterns(classifier, cache)
+        self.assertGreater(cache.hits, 0)
+
+    def test_patterns_small_batch(self):
+        classifier = CampaignClassifier()
+        contents = self.contents[:SMALL_BATCH // 4]
+        keys, vouchers = classifier.classify_column(contents)
+        self.assertEqual(list(zip(keys, vouchers)), [classify_legacy(content) for content in contents])
+
+    def test_rules_column(self):
+        self.check_rules()
+        self.assertEqual(list(match_rules(self.texts)), [rule_index(text) for text in self.texts])
+
+    def test_rules_column_cached(self):
+        cache = ClassificationCache(rule_index, classify_texts=match_rules)
+        self.check_rules(cache)
+        self.check_rules(cache)
+        self.assertGreater(cache.hits, 0)
+
+    def test_without_pyarrow(self):
+        patches = without_pyarrow()
+        try:
+            self.check_patterns(CampaignClassifier())
+            self.check_rules()
+        finally:
+            for patch in patches:
+                patch.stop()
+
+    def test_template_cache_on_golden_corpus(self):
+        # Templates in the corpus keep one label, so trusting a confirmed template changes nothing
+        contents, template_ids = column_passes(self.corpus, repeat=5)
+        classifier = CampaignClassifier()
+        cache = ClassificationCache(classifier.label, classify_texts=classifier.label_texts)
+        keys, vouchers = classifier.classify_column(contents, template_ids, cache=cache)
+        self.assertEqual(list(zip(keys, vouchers)), [classify_legacy(content) for content in contents])
+
+        rules_cache = ClassificationCache(rule_index, classify_texts=match_rules)
+        campaigns, versions = classify_column(contents, template_ids, cache=rules_cache)
+        self.assertEqual(list(zip(campaigns, versions)), [classify_with_version(content) for content in contents])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+campaign_updates against a real Postgres (skipped unless DATABASE_URL is set).
+
+Each test runs in a throwaway schema holding a small sms_zns_messages and
+the apply_campaign_updates function from scripts/sql/003, so the production
+table is never touched. PgClient stands in for the part of the Supabase
+client campaign_updates calls (rpc, and table().update().in_()).
+    DATABASE_URL=postgresql://localhost/postgres python scripts/test_campaign_updates.py
+"""
+
+import os
+import unittest
+import uuid
+from pathlib import Path
+
+from campaign_updates import apply_bulk, apply_chunked
+
+try:
+    import psycopg
+    from psycopg import sql
+    from psycopg.types.json import Jsonb
+except ImportError:
+    psycopg = None
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+SQL_DIR = Path(__file__).parent / 'sql'
+
+BIRTHDAY = '11111111-1111-1111-1111-111111111111'
+OTP = '22222222-2222-2222-2222-222222222222'
+
+
+class Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class Request:
+    def __init__(self, run):
+        self.run = run
+
+    def execute(self):
+        return Result(self.run())
+
+
+class UpdateRequest(Request):
+    def __init__(self, conn, table, values):
+        self.conn, self.table, self.values = conn, table, values
+
+    def in_(self, column, ids):
+        statement = sql.SQL("UPDATE {table} SET {assignments} WHERE {column} = ANY(%s)").format(
+            table=sql.Identifier(self.table), column=sql.Identifier(column),
+            assignments=sql.SQL(', ').join(
+                sql.SQL('{} = {}').format(sql.Identifier(name), sql.Literal(value))
+                for name, value in self.values.items()
+            ),
+        )
+        self.run = lambda: self.conn.execute(statement, [ids]).rowcount
+        return self
+
+
+class PgClient:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def rpc(self, name, params):
+        statement = sql.SQL("SELECT {}(%s)").format(sql.Identifier(name))
+        return Request(lambda: self.conn.execute(statement, [Jsonb(params['updates'])]).fetchone()[0])
+
+    def table(self, name):
+        client = self
+
+        class Table:
+            def update(self, values):
+                return UpdateRequest(client.conn, name, values)
+        return Table()
+
+
+@unittest.skipUnless(DATABASE_URL and psycopg, 'needs DATABASE_URL and psycopg')
+class CampaignUpdatesTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = psycopg.connect(DATABASE_URL, autocommit=True)
+        self.schema = f"test_campaign_updates_{uuid.uuid4().hex[:8]}"
+        self.conn.execute(sql.SQL("CREATE SCHEMA {}").format(sql.Identifier(self.schema)))
+        self.conn.execute(sql.SQL("SET search_path = {}").format(sql.Identifier(self.schema)))
+        self.conn.execute("""
+            CREATE TABLE sms_zns_messages (
+              id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+              content text,
+              campaign_type_id uuid
+            )
+        """)
+        self.conn.execute((SQL_DIR / '002_sms_zns_messages_campaign_rule_version.sql').read_text(encoding='utf-8'))
+        self.conn.execute((SQL_DIR / '003_apply_campaign_updates.sql').read_text(encoding='utf-8'))
+        self.client = PgClient(self.conn)
+
+    def tearDown(self):
+        self.conn.execute(sql.SQL("DROP SCHEMA {} CASCADE").format(sql.Identifier(self.schema)))
+        self.conn.close()
+
+    def seed(self, rows):
+        """Insert (campaign_type_id, campaign_rule_version) rows; returns their ids"""
+        return [
+            str(self.conn.execute(
+                "INSERT INTO sms_zns_messages (campaign_type_id, campaign_rule_version) VALUES (%s, %s) RETURNING id",
+                row,
+            ).fetchone()[0])
+            for row in rows
+        ]
+
+    def state(self):
+        return {
+            str(row[0]): (row[1] and str(row[1]), row[2])
+            for row in self.conn.execute("SELECT id, campaign_type_id, campaign_rule_version FROM sms_zns_messages")
+        }
+
+    def updates(self, ids):
+        """Every row to BIRTHDAY under rule version v2"""
+        return [{'id': id_, 'campaign_type_id': BIRTHDAY, 'campaign_rule_version': 'v2'} for id_ in ids]
+
+    def seed_mixed(self):
+        return self.seed([
+            (BIRTHDAY, 'v2'),   # already current
+            (BIRTHDAY, 'v1'),   # only the rule version moves
+            (OTP, 'v1'),        # campaign changes
+            (None, None),       # never classified
+        ])
+
+    def test_bulk_counts_changed_rows(self):
+        ids = self.seed_mixed()
+        self.assertEqual(apply_bulk(self.client, self.updates(ids)), 3)
+        self.assertEqual(self.state(), {id_: (BIRTHDAY, 'v2') for id_ in ids})
+        # A second run finds nothing to change
+        self.assertEqual(apply_bulk(self.client, self.updates(ids)), 0)
+
+    def test_bulk_batches_add_up(self):
+        ids = self.seed_mixed()
+        self.assertEqual(apply_bulk(self.client, self.updates(ids), batch_size=1), 3)
+        self.assertEqual(self.state(), {id_: (BIRTHDAY, 'v2') for id_ in ids})
+
+    def test_bulk_writes_rule_version_per_row(self):
+        ids = self.seed([(None, None), (None, None)])
+        updates = [
+            {'id': ids[0], 'campaign_type_id': OTP, 'campaign_rule_version': 'a1'},
+            {'id': ids[1], 'campaign_type_id': None, 'campaign_rule_version': 'b2'},
+        ]
+        self.assertEqual(apply_bulk(self.client, updates), 2)
+        self.assertEqual(self.state(), {ids[0]: (OTP, 'a1'), ids[1]: (None, 'b2')})
+
+    def test_chunked_matches_bulk(self):
+        ids = self.seed_mixed()
+        # chunked writes every row it is given, changed or not
+        self.assertEqual(apply_chunked(self.client, self.updates(ids), chunk_size=3), 4)
+        chunked = self.state()
+
+        self.conn.execute("TRUNCATE sms_zns_messages")
+        ids = self.seed_mixed()
+        apply_bulk(self.client, self.updates(ids))
+        self.assertEqual(sorted(chunked.values()), sorted(self.state().values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+CopyLoader against a real Postgres (skipped unless DATABASE_URL is set).
+
+Each test loads into its own throwaway copy of sms_zns_messages (same
+columns, unique message_id as in scripts/sql/001), never the table itself.
+A local server is enough:
+    DATABASE_URL=postgresql://localhost/postgres python scripts/test_copy_loader.py
+"""
+
+import os
+import unittest
+
+from copy_loader import CopyLoader, psycopg
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+
+TABLE = f"sms_zns_messages_copy_test_{os.getpid()}"
+
+TABLE_DDL = """
+CREATE TABLE {table} (
+  id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+  message_id text,
+  message_type text,
+  brandname text,
+  channel text,
+  phone text,
+  customer_id uuid,
+  content text,
+  template_id text,
+  campaign_type_id uuid,
+  voucher_code text,
+  sent_at timestamptz,
+  network text,
+  total_mt integer,
+  success_count integer,
+  fail_count integer,
+  unit_price numeric,
+  total_cost numeric,
+  report_month date,
+  source_file text
+);
+CREATE UNIQUE INDEX {table}_message_id_key ON {table} (message_id);
+"""
+
+
+def record(message_id, **values):
+    return {
+        'message_id': message_id, 'channel': 'sms', 'phone': '0912345678', 'content': 'Cam on quy khach',
+        'sent_at': '2025-04-02T09:30:00', 'total_mt': 1, 'success_count': 1, 'fail_count': 0,
+        'unit_price': 550.0, 'total_cost': 550.0, 'report_month': '2025-04-01', 'source_file': 'test.xlsx',
+        **values,
+    }
+
+
+@unittest.skipUnless(DATABASE_URL and psycopg, 'needs DATABASE_URL and psycopg')
+class CopyLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = psycopg.connect(DATABASE_URL, autocommit=True)
+        self.conn.execute(TABLE_DDL.format(table=TABLE))
+        self.rejected = []
+
+    def tearDown(self):
+        self.conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        self.conn.close()
+
+    def loader(self, upsert=False):
+        return CopyLoader(DATABASE_URL, table=TABLE, upsert=upsert,
+                          reject=lambda records, error: self.rejected.extend(records))
+
+    def message_ids(self):
+        return sorted(row[0] or '' for row in self.conn.execute(f"SELECT message_id FROM {TABLE}"))
+
+    def test_drain_merges_only_its_file(self):
+        with self.loader() as loader:
+            loader.submit([record('1'), record('2')], 'a.xlsx')
+            loader.submit([record('3')], 'b.xlsx')
+            self.assertEqual(loader.drain('a.xlsx'), 2)
+            self.assertEqual(self.message_ids(), ['1', '2'])
+            self.assertEqual(loader.drain('b.xlsx'), 1)
+            self.assertEqual(loader.drain('a.xlsx'), 0)
+        self.assertEqual(self.message_ids(), ['1', '2', '3'])
+        row = self.conn.execute(f"SELECT total_mt, unit_price, report_month::text FROM {TABLE} WHERE message_id = '1'").fetchone()
+        self.assertEqual((row[0], float(row[1]), row[2]), (1, 550.0, '2025-04-01'))
+
+    def test_plain_mode_rejects_duplicates(self):
+        with self.loader() as loader:
+            loader.submit([record('1'), record('2')], 'a.xlsx')
+            self.assertEqual(loader.drain('a.xlsx'), 2)
+            # Re-imported file: two known messages, one new, one without an id
+            loader.submit([record('1'), record('2'), record('3'), record(None)], 'a.xlsx')
+            self.assertEqual(loader.drain('a.xlsx'), 2)
+        self.assertEqual(self.message_ids(), ['', '1', '2', '3'])
+        self.assertEqual(sorted(r['message_id'] for r in self.rejected), ['1', '2'])
+
+    def test_upsert_mode_skips_duplicates(self):
+        with self.loader(upsert=True) as loader:
+            loader.submit([record('1'), record('2')], 'a.xlsx')
+            self.assertEqual(loader.drain('a.xlsx'), 2)
+            loader.submit([record('1'), record('2'), record('3'), record(None)], 'a.xlsx')
+            self.assertEqual(loader.drain('a.xlsx'), 2)
+        self.assertEqual(self.message_ids(), ['', '1', '2', '3'])
+        self.assertEqual(self.rejected, [])
+
+    def test_bad_row_is_rejected_at_copy(self):
+        with self.loader() as loader:
+            loader.submit([record('1'), record('2', total_mt='not a number'), record('3')], 'a.xlsx')
+            self.assertEqual(loader.drain('a.xlsx'), 2)
+        self.assertEqual(self.message_ids(), ['1', '3'])
+        self.assertEqual([r['message_id'] for r in self.rejected], ['2'])
+
+    def test_close_merges_what_is_left(self):
+        loader = self.loader()
+        loader.submit([record('1')], 'a.xlsx')
+        loader.submit([record('2')], 'b.xlsx')
+        self.assertEqual(loader.close(), 2)
+        self.assertEqual(self.message_ids(), ['1', '2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+bisect_insert: how a rejected batch is split down to its bad rows.
+    python scripts/test_dead_letters.py
+"""
+
+import tempfile
+import unittest
+
+from postgrest.exceptions import APIError
+
+from dead_letters import DeadLetters, bisect_insert
+
+
+class Table:
+    """Stands in for one insert endpoint: refuses any batch holding a bad row"""
+
+    def __init__(self, bad=(), error=None):
+        self.bad = set(bad)
+        self.error = error
+        self.rows = []
+        self.requests = 0
+
+    def write(self, batch):
+        self.requests += 1
+        if self.error is not None:
+            raise self.error
+        refused = [row for row in batch if row in self.bad]
+        if refused:
+            raise APIError({'code': '22P02', 'message': f"invalid input: {refused[0]}"})
+        self.rows.extend(batch)
+
+
+class BisectInsertTest(unittest.TestCase):
+    def setUp(self):
+        self.rejected = []
+
+    def reject(self, records, error):
+        self.rejected.append((list(records), error))
+
+    def test_clean_batch_is_one_request(self):
+        table = Table()
+        self.assertEqual(bisect_insert(list(range(100)), table.write, self.reject), 100)
+        self.assertEqual(table.requests, 1)
+        self.assertEqual(self.rejected, [])
+
+    def test_bad_rows_are_isolated(self):
+        table = Table(bad={13, 77})
+        self.assertEqual(bisect_insert(list(range(100)), table.write, self.reject), 98)
+        self.assertEqual(sorted(table.rows), [row for row in range(100) if row not in (13, 77)])
+        self.assertEqual([records for records, error in self.rejected], [[13], [77]])
+        self.assertTrue(all(isinstance(error, APIError) for records, error in self.rejected))
+        # Two bad rows in 100: a few requests per level of the split, not one per row
+        self.assertLess(table.requests, 30)
+
+    def test_all_bad(self):
+        table = Table(bad=range(4))
+        self.assertEqual(bisect_insert(list(range(4)), table.write, self.reject), 0)
+        self.assertEqual(sorted(row for records, error in self.rejected for row in records), [0, 1, 2, 3])
+
+    def test_other_errors_reject_the_whole_batch(self):
+        # A dropped connection says nothing about the rows; splitting would repeat the outage
+        table = Table(error=ConnectionError('reset by peer'))
+        self.assertEqual(bisect_insert(list(range(10)), table.write, self.reject), 0)
+        self.assertEqual(table.requests, 1)
+        self.assertEqual([records for records, error in self.rejected], [list(range(10))])
+
+    def test_split_on(self):
+        table = Table(error=ValueError('bad row'))
+        bisect_insert([1, 2], table.write, self.reject, split_on=ValueError)
+        self.assertEqual([records for records, error in self.rejected], [[1], [2]])
+
+
+class DeadLettersTest(unittest.TestCase):
+    def test_add_read_rewrite(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dead_letters = DeadLetters('sms_zns_messages', directory=directory)
+            dead_letters.add([{'message_id': '1'}, {'message_id': '2'}],
+                             APIError({'code': '23505', 'message': 'duplicate key'}))
+            entries = dead_letters.read()
+            self.assertEqual(dead_letters.added, 2)
+            self.assertEqual([entry['record']['message_id'] for entry in entries], ['1', '2'])
+            self.assertEqual({entry['code'] for entry in entries}, {'23505'})
+            dead_letters.rewrite(entries[1:])
+            self.assertEqual([entry['record']['message_id'] for entry in dead_letters.read()], ['2'])
+            dead_letters.rewrite([])
+            self.assertEqual(dead_letters.read(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
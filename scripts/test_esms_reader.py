@@ -0,0 +1,31 @@
+"""
+esms_reader on workbooks the report generators actually produce.
+    python scripts/test_esms_reader.py
+"""
+
+import unittest
+from pathlib import Path
+
+from esms_reader import iter_chunks
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+
+# Header on row 7 and five data rows (sheet rows 8-12), but the sheet's
+# <dimension> tag claims A1:M9, as stale exports do
+STALE_DIMENSION = FIXTURES / 'esms_stale_dimension.xlsx'
+
+
+def message_ids(file_path, **kwargs):
+    return [message_id for chunk in iter_chunks(file_path, **kwargs) for message_id in chunk['message_id']]
+
+
+class StaleDimensionTest(unittest.TestCase):
+    def test_default_engine_reads_past_declared_range(self):
+        self.assertEqual(message_ids(STALE_DIMENSION), [f'MSG{i:04d}' for i in range(1, 6)])
+
+    def test_openpyxl_reads_past_declared_range(self):
+        self.assertEqual(len(message_ids(STALE_DIMENSION, engine='openpyxl', chunk_rows=2)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
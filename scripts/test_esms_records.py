@@ -0,0 +1,80 @@
+"""
+build_records against the per-row iterrows loop the importers used before it.
+    python scripts/test_esms_records.py
+"""
+
+import unittest
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from bench_process_dataframe import classify_campaigns, make_frame, process_dataframe_iterrows
+from esms_records import RECORD_COLUMNS, build_records, fill_import_time
+
+REPORT_MONTH = date(2025, 7, 1)
+SOURCE_FILE = 'info@matkinh.com.vn_01-07-2025_31-07-2025_detail.xlsx'
+
+
+def sheet(**columns):
+    """One-row detail frame; any column given overrides the defaults"""
+    row = {
+        'message_id': 1234567890, 'message_type': 'Brandname CSKH', 'brandname': 'MATVIET',
+        'sent_at': '02/07/2025 09:30:00', 'content': 'Cam on quy khach', 'phone': 912345678.0,
+        'network': 'Viettel', 'total_mt': 1, 'success_count': 1, 'fail_count': 0,
+        'unit_price': 390.0, 'total_cost': 390.0, 'template_id': '245123',
+    }
+    row.update(columns)
+    return pd.DataFrame([row])
+
+
+class BuildRecordsTest(unittest.TestCase):
+    def test_matches_iterrows(self):
+        df = make_frame(3000)
+        expected = process_dataframe_iterrows(df, SOURCE_FILE, REPORT_MONTH)
+        actual = build_records(df, SOURCE_FILE, REPORT_MONTH, classify_campaigns)
+        self.assertEqual(len(actual), len(expected))
+        for i, (got, want) in enumerate(zip(actual, expected)):
+            self.assertEqual(got, want, f"record {i}")
+
+    def test_columns_and_types(self):
+        [record] = build_records(sheet(), SOURCE_FILE, REPORT_MONTH, classify_campaigns)
+        self.assertEqual(list(record), RECORD_COLUMNS)
+        self.assertEqual(record['phone'], '0912345678')
+        self.assertEqual(record['message_id'], '1234567890')
+        self.assertEqual(record['sent_at'], '2025-07-02T09:30:00')
+        self.assertEqual(record['report_month'], '2025-07-01')
+        self.assertIs(type(record['total_mt']), int)
+        self.assertIs(type(record['unit_price']), float)
+
+    def test_invalid_rows_are_dropped(self):
+        self.assertEqual(build_records(sheet(phone='Tong cong'), SOURCE_FILE, REPORT_MONTH, classify_campaigns), [])
+        self.assertEqual(build_records(sheet(total_mt='abc'), SOURCE_FILE, REPORT_MONTH, classify_campaigns), [])
+
+    def test_missing_values_get_defaults(self):
+        [record] = build_records(sheet(total_mt=np.nan, unit_price=None, content=None, network=None),
+                                 SOURCE_FILE, REPORT_MONTH, classify_campaigns)
+        self.assertEqual((record['total_mt'], record['unit_price']), (1, 0.0))
+        self.assertIsNone(record['content'])
+        self.assertIsNone(record['network'])
+
+    def test_month_first(self):
+        [record] = build_records(sheet(sent_at='07/02/2025 09:30'), SOURCE_FILE, REPORT_MONTH,
+                                 classify_campaigns, dayfirst=False)
+        self.assertEqual(record['sent_at'], '2025-07-02T09:30:00')
+
+    def test_missing_sent_at(self):
+        before = datetime.now().isoformat()
+        [filled] = build_records(sheet(sent_at=None), SOURCE_FILE, REPORT_MONTH, classify_campaigns)
+        self.assertGreaterEqual(filled['sent_at'], before)
+
+        # Left empty for the parse cache, stamped when handed to the loader
+        [cached] = build_records(sheet(sent_at=None), SOURCE_FILE, REPORT_MONTH, classify_campaigns,
+                                 fill_sent_at=False)
+        self.assertIsNone(cached['sent_at'])
+        [stamped] = fill_import_time([cached])
+        self.assertGreaterEqual(stamped['sent_at'], before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+phone_numbers: the canonicalization rules, and the column API against the
+per-row normalize_phone it replaced.
+    python scripts/test_phone_numbers.py
+"""
+
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import phone_numbers
+from bench_phone_numbers import make_columns, normalize_phone
+from phone_numbers import canonicalize, digit_counts, normalize_phones
+
+# cell -> canonical phone (None: invalid)
+CASES = {
+    '0912345678': '0912345678',
+    '912345678': '0912345678',           # 9 digits, no leading 0
+    912345678.0: '0912345678',           # Excel float
+    912345678: '0912345678',
+    '84912345678': '0912345678',         # country code
+    '+84 91 234 5678': '0912345678',
+    84912345678.0: '0912345678',
+    '0912-345-678': '0912345678',
+    '0912345678.0': '0912345678',        # text with Excel's '.0'
+    '8491234567': None,                  # 84 + 8 digits
+    '012345678': None,                   # 9 digits with a leading 0
+    '091234567': None,
+    '09123456789': None,                 # 11 digits, not 84...
+    'Tong cong': None,
+    '': None,
+    None: None,
+    np.nan: None,
+    912345678.5: None,
+    -912345678.0: None,
+}
+
+
+class CanonicalizeTest(unittest.TestCase):
+    def check_cases(self):
+        cells = np.array(list(CASES), dtype=object)
+        self.assertEqual(list(normalize_phones(cells)), list(CASES.values()))
+        numbers, valid = canonicalize(cells)
+        for cell, number, ok, expected in zip(cells, numbers, valid, CASES.values()):
+            self.assertEqual(bool(ok), expected is not None, cell)
+            self.assertEqual(int(number), int(expected) if expected else 0, cell)
+
+    def test_rules(self):
+        self.check_cases()
+
+    def test_rules_without_pyarrow(self):
+        with mock.patch.object(phone_numbers, 'pa', None), mock.patch.object(phone_numbers, 'pc', None):
+            self.check_cases()
+
+    def test_column_kinds(self):
+        # All-float, all-text and mixed columns take different paths
+        self.assertEqual(list(normalize_phones(np.array([912345678.0, 84912345678.0, np.nan]))),
+                         ['0912345678', '0912345678', None])
+        self.assertEqual(list(normalize_phones(np.array(['912345678', '+84912345678']))),
+                         ['0912345678', '0912345678'])
+        self.assertEqual(list(normalize_phones(np.array([912345678, 84912345678]))),
+                         ['0912345678', '0912345678'])
+
+    def test_digit_counts(self):
+        self.assertEqual(list(digit_counts(np.array(['+84 91 234 5678', 912345678.0, None], dtype=object))),
+                         [11, 9, 0])
+
+    def test_matches_per_row_normalize_phone(self):
+        for name, values in make_columns(5000).items():
+            with self.subTest(column=name):
+                self.assertEqual(list(normalize_phones(values)), [normalize_phone(value) for value in values])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+Boolean masks over a column of strings, for the column classifiers.
+
+TextColumn wraps an array of strings and answers contains / startswith /
+search with one call over the whole column. With pyarrow the calls are its
+RE2 kernels; without it they are pandas str methods, which run re on each
+value.
+
+Callers narrow a column with take() as rows get labelled. A take costs
+about as much as one test, so the classifiers only compact once half the
+rows are done and mask the finished ones out until then. both() runs the
+second half of a conjunction only on the rows the first half kept.
+
+RE2 and re disagree on two escapes for non-ASCII text. re's \\d and \\s
+cover every Unicode digit and space, while RE2's are ASCII only (and its
+\\p{Nd} follows an older Unicode than Python's). re2_pattern() spells them
+out as the ranges of characters re itself matches, so a translated pattern
+matches exactly the strings the original does.
+"""
+
+import re
+import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+
+@lru_cache(maxsize=None)
+def char_class(escape):
+    """RE2 class body (no brackets) of the characters re's escape matches"""
+    every_char = np.arange(sys.maxunicode + 1, dtype='<u4').tobytes().decode('utf-32-le', 'surrogatepass')
+    return ''.join(
+        f"\\x{{{ord(run[0]):x}}}" + (f"-\\x{{{ord(run[-1]):x}}}" if len(run) > 1 else '')
+        for run in re.findall(escape + '+', every_char)
+    )
+
+
+# Below this many strings a per-row loop beats the fixed cost of the column calls
+SMALL_BATCH = 256
+
+# re escapes whose RE2 meaning is narrower
+WIDE_ESCAPES = (r'\d', r'\s')
+
+
+def re2_pattern(pattern):
+    """A re pattern spelled for RE2, matching the same strings"""
+    out = []
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\' and i + 1 < len(pattern):
+            escape = pattern[i:i + 2]
+            if escape in WIDE_ESCAPES:
+                ranges = char_class(escape)
+                out.append(ranges if in_class else f"[{ranges}]")
+            else:
+                out.append(escape)
+            i += 2
+            continue
+        if char == '[' and not in_class:
+            in_class = True
+        elif char == ']' and in_class:
+            in_class = False
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+def both(mask, test, *columns):
+    """mask & test(*columns), with test only given the rows mask kept (columns taken to those rows)"""
+    rows = np.flatnonzero(mask)
+    mask = mask.copy()
+    if len(rows):
+        mask[rows] = test(*(column.take(rows) for column in columns))
+    return mask
+
+
+class TextColumn:
+    def __init__(self, texts):
+        texts = np.asarray(texts, dtype=object)
+        if pa is not None:
+            self.values = pa.array(texts, type=pa.large_string())
+        else:
+            self.values = pd.Series(texts, dtype=object)
+
+    @classmethod
+    def wrap(cls, values):
+        column = cls.__new__(cls)
+        column.values = values
+        return column
+
+    def __len__(self):
+        return len(self.values)
+
+    def take(self, rows):
+        """The column restricted to some rows"""
+        if pa is not None:
+            return TextColumn.wrap(self.values.take(pa.array(rows, type=pa.int64())))
+        return TextColumn.wrap(self.values.iloc[rows])
+
+    def to_numpy(self):
+        if pa is not None:
+            return self.values.to_numpy(zero_copy_only=False)
+        return self.values.to_numpy(dtype=object)
+
+    def map_rows(self, rows, func):
+        """The column with func(text) in place of the text of some rows"""
+        if not len(rows):
+            return self
+        if pa is not None:
+            replaced = [func(text) for text in self.values.take(pa.array(rows, type=pa.int64())).to_pylist()]
+            mask = np.zeros(len(self), dtype=bool)
+            mask[rows] = True
+            return TextColumn.wrap(pc.replace_with_mask(self.values, pa.array(mask), pa.array(replaced, type=pa.large_string())))
+        values = self.values.copy()
+        values.iloc[rows] = values.iloc[rows].map(func)
+        return TextColumn.wrap(values)
+
+    def lower(self):
+        """str.lower() of every string"""
+        if pa is None:
+            return TextColumn.wrap(self.values.str.lower())
+        # ascii_lower is exact for ASCII text; str.lower() of the ascii-lowered text is str.lower()
+        lowered = TextColumn.wrap(pc.ascii_lower(self.values))
+        non_ascii = np.flatnonzero(~self.mask(pc.string_is_ascii(self.values)))
+        return lowered.map_rows(non_ascii, str.lower)
+
+    def mask(self, result):
+        if pa is not None:
+            return result.to_numpy(zero_copy_only=False)
+        return result.to_numpy(dtype=bool)
+
+    def empty(self):
+        if pa is not None:
+            return self.mask(pc.equal(pc.utf8_length(self.values), 0))
+        return self.mask(self.values.str.len() == 0)
+
+    def contains(self, literal):
+        if pa is not None:
+            # RE2 finds an escaped literal faster than match_substring scans for it
+            return self.mask(pc.match_substring_regex(self.values, re.escape(literal)))
+        return self.mask(self.values.str.contains(literal, regex=False))
+
+    def startswith(self, prefix):
+        if pa is not None:
+            return self.mask(pc.starts_with(self.values, prefix))
+        return self.mask(self.values.str.startswith(prefix))
+
+    def search(self, pattern, flags=0):
+        """Rows where re.search(pattern, text, flags) finds a match"""
+        if pa is not None:
+            return self.mask(pc.match_substring_regex(self.values, re2_pattern(pattern),
+                                                      ignore_case=bool(flags & re.IGNORECASE)))
+        return self.mask(self.values.str.contains(pattern, flags=flags, regex=True))
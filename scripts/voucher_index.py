@@ -0,0 +1,108 @@
+"""
+Voucher code index (sms_voucher_codes, scripts/sql/004).
+
+Every voucher code extracted at import is kept in sms_voucher_codes with the
+message that issued it, its customer, campaign type and send time. Triggers on
+sms_zns_messages keep it current on import, reclassification and customer
+linking, so finding who received a code is a primary-key lookup.
+
+Usage:
+    python scripts/voucher_index.py backfill [--batch-size 20000] [--restart]
+    python scripts/voucher_index.py lookup SN123456 [FMV123456 ...]
+
+backfill indexes messages imported before the triggers existed. It pages
+through the table by id, one backfill_sms_voucher_codes call per page, and
+checkpoints the last id so an interrupted run resumes where it stopped.
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+load_dotenv(Path(__file__).parent.parent / '.env.local')
+
+SUPABASE_URL = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+
+supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Checkpoint of an unfinished backfill
+STATE_FILE = Path(__file__).parent.parent / '.cache' / 'voucher-backfill.json'
+
+
+def normalize_voucher_code(code):
+    """Same normalization as the SQL side: trimmed, upper-case, None if empty"""
+    code = str(code or '').strip().upper()
+    return code or None
+
+
+def load_checkpoint():
+    if STATE_FILE.exists():
+        return json.loads(STATE_FILE.read_text(encoding='utf-8'))
+    return None
+
+
+def save_checkpoint(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = STATE_FILE.with_name(f"{STATE_FILE.name}.tmp")
+    tmp_path.write_text(json.dumps(state, indent=2), encoding='utf-8')
+    os.replace(tmp_path, STATE_FILE)
+
+
+def backfill(batch_size=20000, restart=False):
+    state = None if restart else load_checkpoint()
+    if state:
+        print(f"Resuming after id {state['last_id']} ({state['scanned']:,} scanned, {state['indexed']:,} indexed)")
+    else:
+        state = {'last_id': None, 'scanned': 0, 'indexed': 0}
+
+    while True:
+        page = supabase.rpc('backfill_sms_voucher_codes', {
+            'after_id': state['last_id'], 'batch_size': batch_size,
+        }).execute().data
+        state['scanned'] += page['scanned']
+        state['indexed'] += page['indexed']
+        if page['last_id'] is None:
+            break
+        state['last_id'] = page['last_id']
+        save_checkpoint(state)
+        print(f"  {state['scanned']:,} messages scanned, {state['indexed']:,} voucher codes indexed")
+
+    STATE_FILE.unlink(missing_ok=True)
+    print(f"Backfill done: {state['scanned']:,} messages scanned, {state['indexed']:,} voucher codes indexed")
+
+
+def lookup(codes):
+    """Index rows for the given voucher codes"""
+    codes = [code for code in map(normalize_voucher_code, codes) if code]
+    if not codes:
+        return []
+    return supabase.table('sms_voucher_codes').select('*').in_('voucher_code', codes).order('sent_at').execute().data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain and query the voucher code index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill_cmd = commands.add_parser('backfill', help='index vouchers of messages imported before the triggers')
+    backfill_cmd.add_argument('--batch-size', type=int, default=20000)
+    backfill_cmd.add_argument('--restart', action='store_true', help='ignore the saved checkpoint')
+    lookup_cmd = commands.add_parser('lookup', help='show which messages issued the given codes')
+    lookup_cmd.add_argument('codes', nargs='+')
+    args = parser.parse_args()
+
+    if args.command == 'backfill':
+        backfill(args.batch_size, args.restart)
+    else:
+        rows = lookup(args.codes)
+        for row in rows:
+            print(f"  {row['voucher_code']:<16} message {row['message_id']}  customer {row['customer_id']}  "
+                  f"campaign {row['campaign_type_id']}  sent {row['sent_at']}")
+        print(f"{len(rows)} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -226,6 +226,7 @@ export default function SMSAnalyticsPage() {
   const [selectedCampaign, setSelectedCampaign] = useState<string>("all");
   const [lang, setLang] = useState<"en" | "vi">("vi");
   const [expandedCampaigns, setExpandedCampaigns] = useState<Set<string>>(new Set());
+  const [reach, setReach] = useState<{ all: number; sms: number; zns: number } | null>(null);
 
   const t = translations[lang];
 
@@ -287,6 +288,27 @@ export default function SMSAnalyticsPage() {
     fetchData();
   }, []);
 
+  useEffect(() => {
+    // Distinct phones across all months, from the recipient sketches (scripts/sql/009).
+    // Summing the monthly unique_recipients counts a phone once for every month it was messaged.
+    async function fetchReach() {
+      const [all, sms, zns] = await Promise.all([
+        supabase.rpc("sms_unique_reach"),
+        supabase.rpc("sms_unique_reach", { channels: ["sms"] }),
+        supabase.rpc("sms_unique_reach", { channels: ["zns"] }),
+      ]);
+      const error = all.error || sms.error || zns.error;
+      if (error) {
+        // Not installed yet: keep the monthly sums
+        console.error("Unique reach error:", error);
+        return;
+      }
+      setReach({ all: all.data ?? 0, sms: sms.data ?? 0, zns: zns.data ?? 0 });
+    }
+
+    fetchReach();
+  }, []);
+
   // Calculate totals
   const totals = monthlyData.reduce(
     (acc, row) => {
@@ -459,7 +481,8 @@ export default function SMSAnalyticsPage() {
   // Calculate ROI
   const roi = totals.totalCost > 0 ? ((revenueTotals.revenue - totals.totalCost) / totals.totalCost) * 100 : 0;
   const atv = revenueTotals.transactions > 0 ? revenueTotals.revenue / revenueTotals.transactions : 0;
-  const conversionRate = totals.uniqueRecipients > 0 ? (revenueTotals.converted / totals.uniqueRecipients) * 100 : 0;
+  const uniqueRecipients = reach ? reach.all : totals.uniqueRecipients;
+  const conversionRate = uniqueRecipients > 0 ? (revenueTotals.converted / uniqueRecipients) * 100 : 0;
 
   if (loading) {
     return (
@@ -617,7 +640,7 @@ export default function SMSAnalyticsPage() {
             </div>
             <div className="bg-slate-700/30 rounded-lg p-3">
               <p className="text-slate-400 text-xs">{t.recipients}</p>
-              <p className="text-white font-bold text-lg">{formatNumber(channelStats.sms.recipients)}</p>
+              <p className="text-white font-bold text-lg">{formatNumber(reach ? reach.sms : channelStats.sms.recipients)}</p>
             </div>
             <div className="bg-slate-700/30 rounded-lg p-3">
               <p className="text-slate-400 text-xs">{t.deliveryRate}</p>
@@ -662,7 +685,7 @@ export default function SMSAnalyticsPage() {
             </div>
             <div className="bg-slate-700/30 rounded-lg p-3">
               <p className="text-slate-400 text-xs">{t.recipients}</p>
-              <p className="text-white font-bold text-lg">{formatNumber(channelStats.zns.recipients)}</p>
+              <p className="text-white font-bold text-lg">{formatNumber(reach ? reach.zns : channelStats.zns.recipients)}</p>
             </div>
             <div className="bg-slate-700/30 rounded-lg p-3">
               <p className="text-slate-400 text-xs">{t.deliveryRate}</p>